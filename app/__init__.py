@@ -1,8 +1,72 @@
 # App factory & basic config
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+# Thread-pool limits for NumPy/BLAS/TF. Must be set before those libraries are imported,
+# otherwise each worker process spawns one thread per core and they fight over the CPU.
+# DEPLOY_MODE=dev (or bench) leaves the library defaults alone; explicit env vars always win.
+DEPLOY_MODE = os.getenv("DEPLOY_MODE", "production").lower()
+if DEPLOY_MODE not in ("dev", "bench"):
+    os.environ.setdefault("OMP_NUM_THREADS", "2")
+    os.environ.setdefault("MKL_NUM_THREADS", "2")
+    os.environ.setdefault("OPENBLAS_NUM_THREADS", "2")
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", "2")
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+    if os.getenv("ML_USE_GPU", "0").lower() not in ("1", "true", "yes"):
+        os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")   # CPU-only: skip CUDA init
+
 from flask import Flask
 from markupsafe import Markup, escape
 from .routes import main_bp
 from .core.managers.database_manager import db_manager
+from .core.managers.model_manager import model_manager, WARM_READY
+from .core.managers.cache_manager import cache
+
+logger = logging.getLogger(__name__)
+
+def _async_warmup() -> None:
+    # Load both models and run a dummy prediction so the first user request
+    # does not pay for model deserialization / graph construction / kernel autotuning.
+    # Runs in a background thread: non-ML routes are served while this is in progress.
+    for name, warmup in (
+        ("heart", lambda: model_manager.get_heart_model().warmup()),
+        ("brain", model_manager.warmup_brain),
+    ):
+        try:
+            warmup()
+            logger.info("Warmup: %s model ready", name)
+        except Exception:
+            logger.exception("Warmup: %s model failed to warm up", name)
+    WARM_READY.set()
+
+def _in_child_process() -> bool:
+    # Brain pool workers have a parent process. The forkserver (and spawn children) import the entry
+    # module as a separate __mp_main__ module, where parent_process() is still None; in the real
+    # main process multiprocessing just aliases __mp_main__ to __main__
+    return (
+        multiprocessing.parent_process() is not None
+        or sys.modules.get("__mp_main__") is not sys.modules.get("__main__")
+    )
+
+def _configure_logging() -> None:
+    # One buffered sink for every app.* logger (routes, services): a rotating file that is only
+    # opened on the first record, so error paths do not serialize on an unbuffered stdout.
+    app_logger = logging.getLogger(__name__)
+    if app_logger.handlers:     # create_app() called more than once (tests, reloader)
+        return
+    log_file = Path(os.getenv("LOG_FILE", Path(__file__).resolve().parent.parent / "instance" / "logs" / "app.log"))
+    log_file.parent.mkdir(parents = True, exist_ok = True)
+    handler = RotatingFileHandler(log_file, maxBytes = 5 * 1024 * 1024, backupCount = 3, delay = True)
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+    app_logger.addHandler(handler)
+    if DEPLOY_MODE == "dev":
+        app_logger.addHandler(logging.StreamHandler())   # keep errors visible in the dev console
+    app_logger.setLevel(logging.INFO)
 
 # Application factory function.
 def create_app():
@@ -16,8 +80,38 @@ def create_app():
     # Secret key (needed later for sessions, flash messages, etc.)
     # For now it's a hardcoded string; later you can load it from env/config.
     app.config["SECRET_KEY"] = "change_this_later_to_a_random_secret"
+    app.config["DEPLOY_MODE"] = DEPLOY_MODE
+    _configure_logging()
+
+    # Upload limits: reject oversized requests early; werkzeug spools file parts to
+    # temp files, and small non-file fields are capped so parsing stays cheap
+    app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH", str(16 * 1024 * 1024)))
+    app.config["MAX_FORM_MEMORY_SIZE"] = 500 * 1024
+    app.config["MAX_FORM_PARTS"] = 100
+
+    # File downloads (report PDFs) are served from disk: the WSGI server's wsgi.file_wrapper
+    # streams them with sendfile(); behind nginx/Apache, USE_X_SENDFILE=1 hands the
+    # transfer to the proxy instead (X-Sendfile header, empty response body)
+    app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "0").lower() in ("1", "true", "yes")
+
+    # Response cache for idempotent read routes (use RedisCache + CACHE_REDIS_URL to share between workers)
+    app.config["CACHE_TYPE"] = os.getenv("CACHE_TYPE", "SimpleCache")
+    app.config["CACHE_DEFAULT_TIMEOUT"] = int(os.getenv("CACHE_DEFAULT_TIMEOUT", "60"))
+    if os.getenv("CACHE_REDIS_URL"):
+        app.config["CACHE_REDIS_URL"] = os.getenv("CACHE_REDIS_URL")
+    cache.init_app(app)
+
+    # Warm up ML models in the background at startup (ML_EAGER_LOAD=0 -> load lazily on first use)
+    app.config["ML_EAGER_LOAD"] = os.getenv("ML_EAGER_LOAD", "1").lower() in ("1", "true", "yes")
 
     db_manager.init_db() # Initialize database
 
     app.register_blueprint(main_bp) # Register main routes of the app
+
+    # Never warm up inside a child process (brain pool worker / forkserver re-importing the entry
+    # module): warmup_brain() would start another pool from there, and so on recursively
+    if app.config["ML_EAGER_LOAD"] and not _in_child_process():
+        threading.Thread(target = _async_warmup, daemon = True, name = "ml-warmup").start()
+    else:
+        WARM_READY.set()    # nothing to wait for
     return app
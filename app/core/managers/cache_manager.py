@@ -0,0 +1,23 @@
+from __future__ import annotations
+from typing import Any, Callable
+
+try:    # Flask-Caching is optional; without it the decorators below are no-ops
+    from flask_caching import Cache
+except ImportError:
+    Cache = None
+
+
+class _NullCache:   # Same surface as flask_caching.Cache, but never caches
+    def init_app(self, app: Any, config: dict | None = None) -> None:
+        return None
+
+    def cached(self, *args: Any, **kwargs: Any) -> Callable[[Callable], Callable]:
+        return lambda view: view
+
+    def clear(self) -> bool:
+        return True
+
+
+# Global response cache. Only decorate views whose output does not depend on the
+# session / logged-in user, otherwise one user's page could be served to another.
+cache = Cache() if Cache is not None else _NullCache()
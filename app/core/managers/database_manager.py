@@ -1,77 +1,175 @@
 import sqlite3
-from typing import Any, Iterable, Optional
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence
+
+def _as_params(params: Iterable[Any]) -> Sequence[Any]:
+    # sqlite3 accepts any sequence; only materialize generators/iterators
+    return params if isinstance(params, (tuple, list)) else tuple(params)
 
 class DatabaseManager: # Encapsulation
-    def __init__(self, db_path: str = "instance/app.db") -> None: 
+    def __init__(self, db_path: str = "instance/app.db", shared_connection: bool = False) -> None:
         self.db_path = db_path          # Path to the SQLite database file
-        
+        # shared_connection=True -> one connection guarded by a lock (StaticPool-style, for eventlet/green threads)
+        # shared_connection=False -> one persistent connection per OS thread
+        self.shared_connection = shared_connection
+        self._local = threading.local()
+        self._shared_conn: Optional[sqlite3.Connection] = None
+        self._shared_lock = threading.Lock()
+
     def get_connection(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)    # Create and return a new SQLite connection
+        conn = sqlite3.connect(                 # Create and return a new SQLite connection
+            self.db_path,
+            check_same_thread = False,
+            isolation_level = None,             # autocommit; writes use explicit BEGIN/COMMIT
+            cached_statements = 256,            # prepared-statement cache (default 128)
+        )
         conn.row_factory = sqlite3.Row
+        # WAL: readers (dashboard/history) never block writers (register, prediction logs);
+        # synchronous=NORMAL skips the per-commit fsync; reads go through a 256 MiB mmap
+        # window and a 64 MiB page cache per connection
+        conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA mmap_size=268435456;
+            PRAGMA cache_size=-65536;
+            """
+        )
         return conn
-    
-    def execute(self, query: str, params: Iterable[Any] = ()) -> None:
-        with self.get_connection() as conn:     # Execute an INSERT/UPDATE/DELETE query
-            conn.execute(query, tuple(params))
-            conn.commit()
-    
-    def execute_and_get_id(self, query: str, params: Iterable[Any] = ()) -> Optional[int]:
+
+    def _conn(self) -> sqlite3.Connection:
+        """
+        Return the persistent connection for the current thread (or the shared one),
+        opening it on first use so the DB file is not reopened on every query.
+        """
+        if self.shared_connection:
+            if self._shared_conn is None:
+                self._shared_conn = self.get_connection()
+            return self._shared_conn
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.get_connection()
+            self._local.conn = conn
+        return conn
+
+    def _lock(self):
+        # SQLite serializes writes itself; the lock only protects a shared connection object
+        return self._shared_lock if self.shared_connection else nullcontext()
+
+    def _write(self, query: str, params: Sequence[Any]) -> sqlite3.Cursor:
+        execute = self._conn().execute     # bound once; used for BEGIN / query / COMMIT
+        execute("BEGIN")
+        try:
+            cursor = execute(query, _as_params(params))
+            execute("COMMIT")
+        except Exception:
+            execute("ROLLBACK")
+            raise
+        return cursor
+
+    def close(self) -> None:    # Close the connection owned by the current thread (or the shared one)
+        if self.shared_connection:
+            with self._shared_lock:
+                if self._shared_conn is not None:
+                    self._shared_conn.close()
+                    self._shared_conn = None
+            return
+
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def execute(self, query: str, params: Sequence[Any] = ()) -> None:
+        with self._lock():      # Execute an INSERT/UPDATE/DELETE query
+            self._write(query, params)
+
+    def execute_and_get_id(self, query: str, params: Sequence[Any] = ()) -> Optional[int]:
         """
         Execute an INSERT query and return the last_insert_rowid() from the same connection.
         This ensures reliable retrieval of the inserted row ID in SQLite.
         Returns None if the insert fails or no row ID is available.
         """
-        with self.get_connection() as conn:
-            cursor = conn.execute(query, tuple(params))
+        with self._lock():
+            cursor = self._write(query, params)
             row_id = cursor.lastrowid
-            conn.commit()
             return row_id if row_id else None
-            
-    def fetch_one(self, query: str, params: Iterable[Any] = ()) -> Optional[sqlite3.Row]:
-        with self.get_connection() as conn:     # Execute a SELECT query and return a single row
-            cur = conn.execute(query, tuple(params))
+
+    @contextmanager
+    def transaction(self) -> Iterator[Callable[..., sqlite3.Cursor]]:
+        """
+        Run several statements as one transaction (one commit):
+            with db.transaction() as execute:
+                execute("DELETE ...", (user_id,))
+                ...
+        Yields the connection's execute(); rolls back if the block raises.
+        """
+        with self._lock():
+            execute = self._conn().execute
+            execute("BEGIN IMMEDIATE")     # take the write lock up front (no upgrade deadlock)
+            try:
+                yield execute
+                execute("COMMIT")
+            except BaseException:
+                execute("ROLLBACK")
+                raise
+
+    def executemany_and_get_ids(self, query: str, rows: Sequence[Sequence[Any]]) -> list[int]:
+        """
+        Run one INSERT per row inside a single transaction (one commit for the whole batch)
+        and return the inserted row IDs in order. Rows are executed one by one rather than
+        with executemany() so each row's lastrowid is known.
+        """
+        with self.transaction() as execute:
+            return [execute(query, _as_params(row)).lastrowid for row in rows]
+
+    def fetch_one(self, query: str, params: Sequence[Any] = ()) -> Optional[sqlite3.Row]:
+        with self._lock():      # Execute a SELECT query and return a single row
+            cur = self._conn().execute(query, _as_params(params))
             row = cur.fetchone()
         return row
-    
-    def fetch_all(self, query: str, params: Iterable[Any] = ()) -> list[sqlite3.Row]:
-        with self.get_connection() as conn:     # Execute a SELECT query and return all rows as a list
-            cur = conn.execute(query, tuple(params))
+
+    def fetch_all(self, query: str, params: Sequence[Any] = ()) -> list[sqlite3.Row]:
+        with self._lock():      # Execute a SELECT query and return all rows as a list
+            cur = self._conn().execute(query, _as_params(params))
             rows = cur.fetchall()
         return rows
-            
+
     def init_db(self) -> None:
-        with self.get_connection() as conn:     # Initialize database tables if they do not exist
-            cursor = conn.cursor()
-            
-            cursor.execute(     # USERS TABLE
-            """ 
+        with self._lock():      # Initialize database tables if they do not exist
+            # All DDL in one script / one transaction -> a single commit
+            self._conn().executescript(
+            """
+            BEGIN IMMEDIATE;
+
+            -- USERS TABLE
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 username TEXT NOT NULL UNIQUE,
-                email TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
+                email TEXT NOT NULL UNIQUE COLLATE NOCASE,
+                password_hash BLOB NOT NULL,
                 created_at TEXT NOT NULL,
                 updated_at TEXT,
                 is_active INTEGER NOT NULL DEFAULT 1
             );
-            """
-        )
-            cursor.execute(     # PREDICTION LOGS TABLE
-            """
+
+            -- PREDICTION LOGS TABLE
             CREATE TABLE IF NOT EXISTS prediction_logs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 model_type TEXT NOT NULL,
                 input_summary TEXT,
+                input_json TEXT,
                 prediction_result TEXT NOT NULL,
                 probability REAL,
                 created_at TEXT NOT NULL,
                 FOREIGN KEY (user_id) REFERENCES users(id)
             );
-            """
-        )     
-            cursor.execute(     # CHAT LOGS TABLE
-            """
+
+            -- CHAT LOGS TABLE
             CREATE TABLE IF NOT EXISTS chat_logs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
@@ -80,8 +178,35 @@ class DatabaseManager: # Encapsulation
                 created_at TEXT NOT NULL,
                 FOREIGN KEY (user_id) REFERENCES users(id)
             );
+
+            -- INDEXES
+            -- Case-insensitive email lookups for login (also covers databases created
+            -- before the email column was declared COLLATE NOCASE)
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE);
+            -- Per-user counts by model type (dashboard GROUP BY is an index-only scan)
+            CREATE INDEX IF NOT EXISTS idx_predlogs_user_model ON prediction_logs(user_id, model_type);
+            -- Per-user history, newest first
+            CREATE INDEX IF NOT EXISTS idx_pred_user_time ON prediction_logs(user_id, created_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_chat_user_time ON chat_logs(user_id, created_at DESC);
+            -- (user_id leads these indexes, so per-user DELETEs - clear history, delete account -
+            -- seek the user's rows too; a separate (user_id) index would only duplicate them)
+            -- (Report lookups "WHERE id = ? AND user_id = ? [AND model_type = ?]" need no index:
+            -- id is the rowid, so SQLite seeks the single row and checks the rest on it)
+
+            COMMIT;
+
+            -- Refresh planner statistics so the indexes above are picked up
+            ANALYZE;
             """
-        )    
-            conn.commit()    
-            
+        )
+            self._migrate()
+
+    def _migrate(self) -> None:
+        # Columns added after the first release: CREATE TABLE IF NOT EXISTS leaves existing tables alone
+        conn = self._conn()
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(prediction_logs)")}
+        if "input_json" not in columns:
+            # Structured form of input_summary (JSON object of label -> value); NULL for older rows
+            conn.execute("ALTER TABLE prediction_logs ADD COLUMN input_json TEXT")
+
 db_manager = DatabaseManager()  # global instance rest of the app can use
\ No newline at end of file
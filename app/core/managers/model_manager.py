@@ -1,6 +1,54 @@
-from typing import Optional
-from app.models.heart.heart_disease_model import HeartDiseaseModel
-from app.models.brain.brain_tumor_model import BrainTumorModel
+from __future__ import annotations
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:   # model modules are imported lazily so ModelManager() stays cheap
+    import numpy as np
+    from app.models.heart.heart_disease_model import HeartDiseaseModel
+    from app.models.brain.brain_tumor_model import BrainTumorModel
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------------------------
+# Brain inference worker process (one TF runtime per worker, not per request)
+# -------------------------------------------------------------------
+_worker_brain_model: Optional[BrainTumorModel] = None
+
+def _get_worker_brain_model() -> BrainTumorModel:
+    global _worker_brain_model
+    if _worker_brain_model is None:
+        from app.models.brain.brain_tumor_model import BrainTumorModel
+        # The pool hands a worker one task at a time, so there is nothing to coalesce: no batch window
+        _worker_brain_model = BrainTumorModel(batching = False)
+    return _worker_brain_model
+
+def _init_brain_worker() -> None:   # Load the CNN as soon as the worker process starts
+    try:
+        _get_worker_brain_model().load_model()
+    except Exception as e:
+        # Don't break the pool; the error resurfaces on the first predict() call
+        logger.error("Brain worker: failed to load model: %s", e)
+
+def _brain_predict_worker(image_path: str) -> Dict[str, Any]:
+    return _get_worker_brain_model().predict(image_path)
+
+def _brain_predict_bytes_worker(data: bytes) -> Dict[str, Any]:
+    return _get_worker_brain_model().predict_bytes(data)
+
+def _brain_warmup_worker() -> None:
+    _get_worker_brain_model().warmup()
+
+def _brain_pool_context() -> multiprocessing.context.BaseContext:
+    # Never fork the web process: it already runs threads (warmup, log writer, upload / PDF pools)
+    # whose locks a forked child could inherit held. forkserver forks workers from a clean,
+    # single-threaded server process; spawn where it is unavailable (Windows)
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
 
 class ModelManager: # Manages ML/DL model instances
     def __init__(self) -> None:
@@ -8,23 +56,39 @@ class ModelManager: # Manages ML/DL model instances
         self._brain_model: Optional[BrainTumorModel] = None
         self._heart_model_error: Optional[str] = None
         self._brain_model_error: Optional[str] = None
+        # Guards lazy initialization so concurrent requests never load a model twice
+        self._lock = threading.Lock()
+
+        # Inference pools: brain CNN runs in separate process(es) so TF never competes with
+        # request threads; BRAIN_WORKERS=0 runs it in-process instead. The heart tree model
+        # releases the GIL in predict_proba, so a small thread pool is enough for it.
+        self._brain_workers: int = int(os.getenv("BRAIN_WORKERS", "1"))
+        self._heart_workers: int = int(os.getenv("HEART_WORKERS", "2"))
+        self._brain_pool: Optional[ProcessPoolExecutor] = None
+        self._heart_pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
         
     def get_heart_model(self) -> HeartDiseaseModel: #  Return a loaded HeartDiseaseModel instance
-        if self._heart_model is None and self._heart_model_error is None:
-            try:
-                # In the future we may pass a real model_path here.
-                self._heart_model = HeartDiseaseModel(
-                    model_path="app/data/saved_models/heart_model.pkl"
-                )
-                self._heart_model.load_model()
-            except FileNotFoundError as e:
-                self._heart_model_error = f"Heart disease model file not found. Please ensure the model is trained and saved."
-                print(f"[ERROR] ModelManager: {self._heart_model_error}: {e}")
-                raise RuntimeError(self._heart_model_error)
-            except Exception as e:
-                self._heart_model_error = f"Failed to load heart disease model: {str(e)}"
-                print(f"[ERROR] ModelManager: {self._heart_model_error}")
-                raise RuntimeError(self._heart_model_error)
+        if self._heart_model is None:
+            with self._lock:    # double-checked: only one thread builds the model
+                if self._heart_model is None and self._heart_model_error is None:
+                    try:
+                        from app.models.heart.heart_disease_model import HeartDiseaseModel
+
+                        # In the future we may pass a real model_path here.
+                        heart_model = HeartDiseaseModel(
+                            model_path="app/data/saved_models/heart_model.pkl"
+                        )
+                        heart_model.load_model()
+                        self._heart_model = heart_model  # publish only once fully loaded
+                    except FileNotFoundError as e:
+                        self._heart_model_error = f"Heart disease model file not found. Please ensure the model is trained and saved."
+                        logger.error("ModelManager: %s: %s", self._heart_model_error, e)
+                        raise RuntimeError(self._heart_model_error)
+                    except Exception as e:
+                        self._heart_model_error = f"Failed to load heart disease model: {str(e)}"
+                        logger.error("ModelManager: %s", self._heart_model_error)
+                        raise RuntimeError(self._heart_model_error)
         
         if self._heart_model is None:
             raise RuntimeError(self._heart_model_error or "Heart model failed to load.")
@@ -32,20 +96,87 @@ class ModelManager: # Manages ML/DL model instances
         return self._heart_model
 
     def get_brain_model(self) -> BrainTumorModel:   # Return a loaded BrainTumorModel instance
-        if self._brain_model is None and self._brain_model_error is None:
-            try:
-                # Model will use default path or can be overridden
-                # The model loads lazily when predict() is first called
-                self._brain_model = BrainTumorModel()
-            except Exception as e:
-                self._brain_model_error = f"Failed to initialize brain tumor model: {str(e)}"
-                print(f"[ERROR] ModelManager: {self._brain_model_error}")
-                raise RuntimeError(self._brain_model_error)
+        if self._brain_model is None:
+            with self._lock:    # double-checked: only one thread builds the model
+                if self._brain_model is None and self._brain_model_error is None:
+                    try:
+                        from app.models.brain.brain_tumor_model import BrainTumorModel
+
+                        # Model will use default path or can be overridden
+                        # The model loads lazily when predict() is first called
+                        self._brain_model = BrainTumorModel()
+                    except Exception as e:
+                        self._brain_model_error = f"Failed to initialize brain tumor model: {str(e)}"
+                        logger.error("ModelManager: %s", self._brain_model_error)
+                        raise RuntimeError(self._brain_model_error)
         
         if self._brain_model is None:
             raise RuntimeError(self._brain_model_error or "Brain model failed to load.")
         
         return self._brain_model
 
+    def _get_brain_pool(self) -> ProcessPoolExecutor:
+        if self._brain_pool is None:
+            with self._pool_lock:
+                if self._brain_pool is None:
+                    self._brain_pool = ProcessPoolExecutor(
+                        max_workers = self._brain_workers,
+                        initializer = _init_brain_worker,
+                        mp_context = _brain_pool_context(),
+                    )
+        return self._brain_pool
+
+    def _get_heart_pool(self) -> ThreadPoolExecutor:
+        if self._heart_pool is None:
+            with self._pool_lock:
+                if self._heart_pool is None:
+                    self._heart_pool = ThreadPoolExecutor(
+                        max_workers = self._heart_workers,
+                        thread_name_prefix = "heart-inference",
+                    )
+        return self._heart_pool
+
+    def predict_heart(self, features: Dict[str, float]) -> Tuple[str, float]:  # Run heart prediction on the heart pool
+        heart_model = self.get_heart_model()
+        if self._heart_workers <= 0:
+            return heart_model.predict(features)
+        return self._get_heart_pool().submit(heart_model.predict, features).result()
+
+    def predict_heart_values(self, values: np.ndarray, names: Tuple[str, ...]) -> Tuple[str, float]:
+        # Same as predict_heart, for a named feature vector (HeartDiseaseModel.predict_values)
+        heart_model = self.get_heart_model()
+        if self._heart_workers <= 0:
+            return heart_model.predict_values(values, names)
+        return self._get_heart_pool().submit(heart_model.predict_values, values, names).result()
+
+    def predict_brain(self, image_path: str) -> Dict[str, Any]:    # Run brain prediction on the inference worker pool
+        if self._brain_workers <= 0:
+            return self.get_brain_model().predict(image_path)
+        return self._submit_brain(_brain_predict_worker, str(image_path))
+
+    def predict_brain_bytes(self, data: bytes) -> Dict[str, Any]:  # Same, for an encoded image held in memory
+        if self._brain_workers <= 0:
+            return self.get_brain_model().predict_bytes(data)
+        return self._submit_brain(_brain_predict_bytes_worker, data)
+
+    def _submit_brain(self, fn, arg) -> Dict[str, Any]:
+        try:
+            return self._get_brain_pool().submit(fn, arg).result()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM); drop the pool so the next request starts a fresh one
+            with self._pool_lock:
+                self._brain_pool = None
+            logger.error("ModelManager: brain inference worker crashed: %s", e)
+            raise RuntimeError("Brain tumor inference worker crashed. Please try again.")
+
+    def warmup_brain(self) -> None:     # Load + warm up the brain CNN wherever it will run
+        if self._brain_workers <= 0:
+            self.get_brain_model().warmup()
+        else:
+            self._get_brain_pool().submit(_brain_warmup_worker).result()
+
 # Global instance used by services
-model_manager = ModelManager()
\ No newline at end of file
+model_manager = ModelManager()
+
+# Set once background model warmup has finished (checked by the /ready endpoint)
+WARM_READY = threading.Event()
\ No newline at end of file
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any
+from typing import Any, Hashable
 
 
 class BaseDiseaseModel(ABC):
@@ -11,13 +13,43 @@ class BaseDiseaseModel(ABC):
     Provides a common interface so different disease models can be treated
     polymorphically (e.g., in a list[BaseDiseaseModel]) while keeping each
     model's internal details independent.
+
+    Also provides a small thread-safe LRU cache of recent predictions, since
+    predictions are deterministic for identical inputs.
     """
 
+    # Maximum number of cached predictions per model instance
+    CACHE_MAXSIZE: int = 1024
+
     def __init__(self, model_path: str | Path) -> None:
         # Protected attributes used by concrete models
         self._model_path: Path = Path(model_path)
         self._loaded_model: Any | None = None
 
+        self._cache: OrderedDict[Hashable, Any] = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _cache_get(self, key: Hashable) -> Any | None:
+        """Return the cached prediction for key (marking it recently used), or None."""
+        with self._cache_lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value
+
+    def _cache_put(self, key: Hashable, value: Any) -> None:
+        """Store a prediction, evicting the least recently used entry when full."""
+        with self._cache_lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.CACHE_MAXSIZE:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self) -> None:
+        """Drop all cached predictions."""
+        with self._cache_lock:
+            self._cache.clear()
+
     @abstractmethod
     def load_model(self) -> None:
         """Load the underlying ML model into memory."""
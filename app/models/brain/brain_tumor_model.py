@@ -1,27 +1,112 @@
 from __future__ import annotations
+import hashlib
+import importlib
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from io import BytesIO
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, BinaryIO, Dict, List
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras.utils import load_img, img_to_array   # type: ignore
+from PIL import Image
 
 from app.models.base_model import BaseDiseaseModel
 
+logger = logging.getLogger(__name__)
+
+
+def _tflite_interpreter_class() -> Any:
+    # Standalone TFLite runtimes (LiteRT / tflite-runtime) load in a fraction of the time and memory
+    # of a full TensorFlow import; fall back to tf.lite when neither is installed
+    for module in ("ai_edge_litert.interpreter", "tflite_runtime.interpreter"):
+        try:
+            return importlib.import_module(module).Interpreter
+        except ImportError:
+            continue
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class _Batcher:
+    """
+    Micro-batching worker: concurrent predict() calls that arrive within a
+    short window are stacked into a single (B, H, W, 3) forward pass.
+    The worker thread is the only caller of the model, so the underlying
+    Keras model / TFLite interpreter is never used from two threads at once.
+    Inputs are written into one preallocated float32 batch buffer, so no
+    per-request float array is allocated.
+    """
+
+    def __init__(self, run_batch, max_batch: int, max_wait_ms: float, input_shape: tuple[int, ...]) -> None:
+        self._run_batch = run_batch
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000.0
+        self._buffer = np.empty((max_batch,) + input_shape, dtype=np.float32)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="brain-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, x: np.ndarray) -> np.ndarray:
+        """Queue one (1, H, W, 3) image (any numeric dtype) and block until its
+        (num_classes,) output is ready."""
+        future: Future = Future()
+        self._queue.put((x, future))
+        return future.result()
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait
+
+            # Drain whatever else arrives before the deadline, up to max_batch
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                # Fill the reusable batch buffer in place (uint8 -> float32 cast happens here)
+                for i, (x, _) in enumerate(batch):
+                    np.copyto(self._buffer[i], x[0], casting="unsafe")
+                preds = self._run_batch(self._buffer[:len(batch)])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for i, (_, future) in enumerate(batch):
+                future.set_result(preds[i])
+
 
 class BrainTumorModel(BaseDiseaseModel):  # Wrapper around the trained 4-class CNN for brain tumor detection
 
+    # Micro-batching settings for concurrent requests
+    MAX_BATCH: int = 8
+    MAX_WAIT_MS: float = 5.0
+
     def __init__(
         self,
         model_path: str | Path | None = None,
         img_size: tuple[int, int] = (128, 128),
+        batching: bool = True,
     ) -> None:
         # Locate app directory: .../Multi Disease Detection System/app
         app_dir = Path(__file__).resolve().parents[2]
 
-        # Default model path (must match your training script)
+        # Default model path (must match your training script).
+        # Prefer the quantized TFLite export when it has been generated.
         if model_path is None:
-            model_path = app_dir / "data" / "saved_models" / "brain_tumor_cnn_multiclass.h5"
+            saved_models_dir = app_dir / "data" / "saved_models"
+            model_path = saved_models_dir / "brain_tumor_cnn_multiclass.tflite"
+            if not model_path.exists():
+                model_path = saved_models_dir / "brain_tumor_cnn_multiclass.h5"
 
         # Initialize common base attributes (_model_path, _loaded_model)
         super().__init__(model_path)
@@ -32,7 +117,25 @@ class BrainTumorModel(BaseDiseaseModel):  # Wrapper around the trained 4-class C
         self.img_size: tuple[int, int] = img_size
 
         # Keras model instance used internally by this subclass
-        self._model: keras.Model | None = None
+        # (TensorFlow is imported lazily on first load to keep app startup light)
+        self._model: Any | None = None
+        # tf.function wrapping model(x, training=False), traced once for any batch size
+        self._tf_predict: Any | None = None
+
+        # TFLite interpreter (used instead of the Keras model for .tflite files)
+        self._interpreter: Any | None = None
+        self._input_details: Dict[str, Any] | None = None
+        self._output_details: Dict[str, Any] | None = None
+
+        # Serializes the lazy load so concurrent first requests share one TF graph
+        self._load_lock = threading.Lock()
+
+        # Request-coalescing worker (started on first prediction). batching=False runs each image
+        # straight through the model instead: for callers that only ever send one request at a time
+        # (a process-pool worker), where the batch window would be pure added latency
+        self._batching: bool = batching
+        self._batcher: _Batcher | None = None
+        self._batcher_lock = threading.Lock()
 
         # Make sure this matches class_names from training
         self.class_names: List[str] = [
@@ -43,9 +146,35 @@ class BrainTumorModel(BaseDiseaseModel):  # Wrapper around the trained 4-class C
         ]
         
     def _ensure_model_loaded(self) -> None:
-        if self._model is not None:
+        if self._model is not None or self._interpreter is not None:
             return
 
+        with self._load_lock:
+            if self._model is None and self._interpreter is None:
+                self._load()
+
+    @staticmethod
+    def _intra_op_threads() -> int:
+        """Threads one inference may use (TF intra-op pool / TFLite interpreter): capped by
+        TF_NUM_INTRAOP_THREADS (set in production by app/__init__.py), TF_INTRA overrides."""
+        default_intra = os.getenv("TF_NUM_INTRAOP_THREADS", str(max(1, (os.cpu_count() or 2) // 2)))
+        return int(os.getenv("TF_INTRA", default_intra))
+
+    @staticmethod
+    def _configure_tf_threads() -> None:
+        """Bound TF's thread pools so concurrent requests do not oversubscribe the CPU.
+        Only possible before the TF runtime has initialized; ignored afterwards."""
+        import tensorflow as tf
+
+        try:
+            intra = BrainTumorModel._intra_op_threads()
+            inter = int(os.getenv("TF_NUM_INTEROP_THREADS", "1"))
+            tf.config.threading.set_intra_op_parallelism_threads(intra)
+            tf.config.threading.set_inter_op_parallelism_threads(inter)
+        except RuntimeError:
+            pass
+
+    def _load(self) -> None:
         if not self.model_path.exists():
             raise FileNotFoundError(
                 f"Brain tumor model file not found at: {self.model_path}\n"
@@ -53,20 +182,100 @@ class BrainTumorModel(BaseDiseaseModel):  # Wrapper around the trained 4-class C
                 "to this location."
             )
 
-        self._model = keras.models.load_model(self.model_path)  # Load the trained CNN
-        print(f"[BrainTumorModel] Loaded model from: {self.model_path}")
+        if self.model_path.suffix.lower() == ".tflite":
+            # Quantized model exported by model_training/brain_tumor/convert_brain_model_tflite.py
+            interpreter = _tflite_interpreter_class()(
+                model_path = str(self.model_path),
+                num_threads = self._intra_op_threads(),    # same cap as the Keras path
+            )
+            interpreter.allocate_tensors()
+            self._input_details = interpreter.get_input_details()[0]
+            self._output_details = interpreter.get_output_details()[0]
+            self._interpreter = interpreter  # publish last: it marks the model as loaded
+        else:
+            import tensorflow as tf
+
+            self._configure_tf_threads()
+            model = tf.keras.models.load_model(self.model_path)  # Load the trained CNN
+            # Direct call instead of Model.predict(): no per-call tf.data / callback setup.
+            # The input_signature (None batch dim) avoids retracing when batch size changes.
+            self._tf_predict = tf.function(
+                lambda t: model(t, training=False),
+                input_signature=[tf.TensorSpec((None,) + self.img_size + (3,), tf.float32)],
+            )
+            self._model = model  # publish last: it marks the model as loaded
+        logger.info("BrainTumorModel: loaded model from %s", self.model_path)
+
+    def _run_model(self, x: np.ndarray) -> np.ndarray:
+        """Run a (batch, H, W, 3) float32 array through the loaded model and
+        return the softmax output of shape (batch, num_classes)."""
+        if self._interpreter is None:
+            assert self._tf_predict is not None  # for type checkers
+            return self._tf_predict(x).numpy()
+
+        assert self._input_details is not None and self._output_details is not None
+        if tuple(self._input_details["shape"]) != x.shape:
+            # Batch size changed: resize the interpreter's input tensor
+            self._interpreter.resize_tensor_input(self._input_details["index"], list(x.shape))
+            self._interpreter.allocate_tensors()
+            self._input_details = self._interpreter.get_input_details()[0]
+            self._output_details = self._interpreter.get_output_details()[0]
+
+        input_dtype = self._input_details["dtype"]
+        if np.issubdtype(input_dtype, np.integer):
+            # int8/uint8 input: quantize with the tensor's scale / zero point
+            scale, zero_point = self._input_details["quantization"]
+            info = np.iinfo(input_dtype)
+            x = np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(input_dtype)
+        else:
+            x = x.astype(input_dtype, copy=False)
+
+        self._interpreter.set_tensor(self._input_details["index"], x)
+        self._interpreter.invoke()
+        out = self._interpreter.get_tensor(self._output_details["index"])
+
+        output_dtype = self._output_details["dtype"]
+        if np.issubdtype(output_dtype, np.integer):
+            scale, zero_point = self._output_details["quantization"]
+            out = (out.astype("float32") - zero_point) * scale
+        return out
+
+    def _get_batcher(self) -> _Batcher:
+        if self._batcher is None:
+            with self._batcher_lock:
+                if self._batcher is None:
+                    self._batcher = _Batcher(
+                        self._run_model,
+                        self.MAX_BATCH,
+                        self.MAX_WAIT_MS,
+                        self.img_size + (3,),
+                    )
+        return self._batcher
+
+    def _infer(self, x: np.ndarray) -> np.ndarray:
+        """Run one (1, H, W, 3) image and return its (num_classes,) output."""
+        if self._batching:
+            return self._get_batcher().submit(x)
+        return self._run_model(x.astype(np.float32, copy=False))[0]
 
     def load_model(self) -> None:
         """Concrete implementation of the abstract load_model interface."""
         self._ensure_model_loaded()
 
+    def warmup(self) -> None:
+        """Load the CNN and run one dummy batch so graph building / kernel
+        selection happen before the first real request."""
+        self._ensure_model_loaded()
+        dummy = np.zeros((1,) + self.img_size + (3,), dtype="float32")
+        self._infer(dummy)
+
     def _preprocess_image(self, image_path: str | Path) -> np.ndarray:
         """
         Preprocess image for model prediction.
         - Converts image path to Path object
         - Loads and resizes image to model input size (128x128)
         - Converts to RGB format
-        - Returns pixel values in [0, 255] range (model has Rescaling layer)
+        - Returns uint8 pixel values in [0, 255] range (model has Rescaling layer)
         - Adds batch dimension
         """
         image_path = Path(image_path)
@@ -74,77 +283,95 @@ class BrainTumorModel(BaseDiseaseModel):  # Wrapper around the trained 4-class C
         if not image_path.exists():
             raise FileNotFoundError(f"Image not found at: {image_path}")
 
+        return self._to_input(image_path, str(image_path))
+
+    def _preprocess_bytes(self, data: bytes) -> np.ndarray:
+        """Same as _preprocess_image, for an encoded image held in memory."""
+        return self._to_input(BytesIO(data), "uploaded image")
+
+    def _to_input(self, source: Path | BinaryIO, label: str) -> np.ndarray:
         try:
-            # Load & resize image to RGB format
-            # load_img returns a PIL Image in RGB mode
-            img = load_img(
-                str(image_path),  # Ensure string path for load_img
-                target_size=self.img_size,
-                color_mode="rgb",
-            )
-        except Exception as e:
-            raise ValueError(f"Failed to load image from {image_path}: {str(e)}")
-        
-        try:
-            # Convert PIL image to numpy array
-            # img_to_array returns values in [0, 255] range by default
-            img_array = img_to_array(img).astype("float32")
-            
-            # The model has a Rescaling(1.0/255) layer built-in, so it expects
-            # pixel values in [0, 255] range and will normalize internally
-            # Do NOT normalize here to avoid double normalization
-            
-            # Verify values are in expected range
-            if img_array.min() < 0 or img_array.max() > 255:
-                raise ValueError(
-                    f"Image pixel values out of range [0, 255]: "
-                    f"min={img_array.min()}, max={img_array.max()}"
-                )
-            
-            # Add batch dimension: (height, width, channels) -> (1, height, width, channels)
-            img_array = np.expand_dims(img_array, axis=0)
-            
-            # Verify shape is correct: should be (1, 128, 128, 3)
-            expected_shape = (1,) + self.img_size + (3,)
-            if img_array.shape != expected_shape:
-                raise ValueError(
-                    f"Unexpected image shape: {img_array.shape}. Expected: {expected_shape}"
+            # Load, convert to RGB and resize with Pillow (bilinear, same as training)
+            # PIL expects (width, height); img_size is (height, width)
+            with Image.open(source) as im:
+                im = im.convert("RGB").resize(
+                    (self.img_size[1], self.img_size[0]),
+                    Image.BILINEAR,
                 )
-            
-            return img_array
+                # uint8 buffer is [0, 255] by construction, so no range check is needed
+                img_array = np.asarray(im, dtype=np.uint8)
         except Exception as e:
-            raise ValueError(f"Failed to preprocess image: {str(e)}")
+            raise ValueError(f"Failed to load image from {label}: {str(e)}")
+
+        # The model has its Rescaling layer built-in (Rescaling(1/127.5, offset=-1) -> [-1, 1] in the
+        # MobileNetV3 export of train_brain_model.py; 1.0/255 in older custom-CNN models), so it
+        # expects pixel values in [0, 255] range and will normalize internally
+        # Do NOT normalize here to avoid double normalization
+
+        # Add batch dimension: (height, width, channels) -> (1, height, width, channels)
+        # Kept as uint8: the batcher casts it into its preallocated float32 buffer
+        img_array = img_array[np.newaxis, ...]
+
+        # Verify shape is correct: should be (1, 128, 128, 3)
+        expected_shape = (1,) + self.img_size + (3,)
+        if img_array.shape != expected_shape:
+            raise ValueError(
+                f"Failed to preprocess image: Unexpected image shape: {img_array.shape}. "
+                f"Expected: {expected_shape}"
+            )
+
+        return img_array
 
     def predict(self, image_path: str | Path) -> Dict[str, Any]:
         self._ensure_model_loaded()
 
-        assert self._model is not None  # for type checkers
+        # Same file (path + mtime + size) -> same prediction: serve repeats from the cache
+        image_path = Path(image_path)
+        try:
+            stat = image_path.stat()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Image not found at: {image_path}")
+        cache_key = (str(image_path.resolve()), stat.st_mtime_ns, stat.st_size)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return {**cached, "probabilities": dict(cached["probabilities"])}
+
+        return self._predict_input(self._preprocess_image(image_path), cache_key)
+
+    def predict_bytes(self, data: bytes) -> Dict[str, Any]:
+        """Predict from the encoded image bytes (e.g. an upload not yet written to disk)."""
+        self._ensure_model_loaded()
+
+        # Same bytes -> same prediction
+        cache_key = ("bytes", hashlib.blake2b(data, digest_size=16).digest())
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return {**cached, "probabilities": dict(cached["probabilities"])}
 
-        # Preprocess image
-        x = self._preprocess_image(image_path)
+        return self._predict_input(self._preprocess_bytes(data), cache_key)
 
-        # Model returns shape (1, num_classes); we take [0]
-        preds: np.ndarray = self._model.predict(x, verbose=0)[0]
+    def _predict_input(self, x: np.ndarray, cache_key: Any) -> Dict[str, Any]:
+        # Batched with other concurrent requests; returns this image's (num_classes,) row
+        preds: np.ndarray = self._infer(x)
 
-        # Convert to python floats
-        preds = preds.astype("float64")
-        pred_index = int(np.argmax(preds))
-        probability = float(preds[pred_index])
+        # Convert to python floats in a single C -> Python copy
+        preds_list: List[float] = preds.astype(np.float32, copy=False).tolist()
+        pred_index = max(range(len(preds_list)), key=preds_list.__getitem__)
+        probability = preds_list[pred_index]
 
         # Safety check: class_names length should match num_classes
-        if pred_index < len(self.class_names):
-            predicted_class = self.class_names[pred_index]
-        else:
-            predicted_class = f"class_{pred_index}"
+        names = self.class_names
+        if len(names) < len(preds_list):
+            names = names + [f"class_{i}" for i in range(len(names), len(preds_list))]
+        predicted_class = names[pred_index]
 
-        probabilities_dict: Dict[str, float] = {}
-        for i, p in enumerate(preds):
-            name = self.class_names[i] if i < len(self.class_names) else f"class_{i}"
-            probabilities_dict[name] = float(p)
+        probabilities_dict: Dict[str, float] = dict(zip(names, preds_list))
 
-        return {
+        result = {
             "predicted_class": predicted_class,
             "predicted_index": pred_index,
             "probability": probability,
             "probabilities": probabilities_dict,
         }
+        self._cache_put(cache_key, {**result, "probabilities": dict(probabilities_dict)})
+        return result
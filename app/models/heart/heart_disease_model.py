@@ -1,9 +1,14 @@
 from typing import Dict, Tuple, Any, List
 from pathlib import Path
 import numpy as np
-import joblib
 from app.models.base_model import BaseDiseaseModel
 
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
 class HeartDiseaseModel(BaseDiseaseModel):    # Wrapper for the Heart Disease prediction model
     def __init__(self, model_path: str | None = None) -> None:
         # Preserve existing default path behavior
@@ -20,11 +25,21 @@ class HeartDiseaseModel(BaseDiseaseModel):    # Wrapper for the Heart Disease pr
         self.loaded_model: Any | None = self._loaded_model
 
         self.feature_names: List[str] = []
+        # Class name of the loaded estimator (e.g. "RandomForestClassifier"), shown on the PDF report
+        self.model_name: str = ""
+
+        # Precomputed at load time so predict() avoids per-call Python scans
+        self._feat_index: Tuple[str, ...] = ()
+        self._idx_disease: int = -1
+        # names tuple -> index arrays used by predict_values()
+        self._layouts: Dict[Tuple[str, ...], Tuple[np.ndarray, np.ndarray]] = {}
 
-    def load_model(self) -> None:   # Load the RandomForest model + feature names
+    def load_model(self) -> None:   # Load the scikit-learn tree model + feature names
         if self._loaded_model is not None:
             return  # already loaded
 
+        import joblib   # deferred: only needed when the model is actually loaded
+
         bundle_path = Path(self._model_path)
         if not bundle_path.exists():
             raise FileNotFoundError(
@@ -32,43 +47,85 @@ class HeartDiseaseModel(BaseDiseaseModel):    # Wrapper for the Heart Disease pr
                 f"Make sure you ran the training script and saved the model."
             )
 
-        bundle = joblib.load(bundle_path)
+        # Memory-map the trees' NumPy node arrays instead of copying them onto the heap;
+        # pages are loaded on demand and shared between worker processes.
+        # (Requires an uncompressed dump; joblib falls back to a normal load otherwise.)
+        bundle = joblib.load(bundle_path, mmap_mode = "r")
         self._loaded_model = bundle["model"]
         # Keep public alias in sync for any external code that might use it
         self.loaded_model = self._loaded_model
         self.feature_names = bundle["feature_names"]
+        self.model_name = type(self._loaded_model).__name__
 
         if not self.feature_names:
             raise ValueError("Loaded heart model has empty feature_names list.")
 
+        self._feat_index = tuple(self.feature_names)
+
+        # We assume class "1" = has disease; figure out which index that is
+        classes = np.asarray(self._loaded_model.classes_)
+        matches = np.flatnonzero(classes == 1)
+        # Fallback: assume last class is "disease"
+        self._idx_disease = int(matches[0]) if matches.size else len(classes) - 1
+
+    def warmup(self) -> None:   # Load the bundle and run one dummy prediction
+        self.load_model()
+        assert self._loaded_model is not None
+        self._loaded_model.predict_proba(np.zeros((1, len(self.feature_names)), dtype = float))
+
     def predict(self, features: Dict[str, float]) -> Tuple[str, float]:
         # Returns -> (risk_label, probability_of_disease)
-        self.load_model()
+        if self._loaded_model is None:
+            self.load_model()
+
+        # Feature values in model order (default 0 for missing/invalid fields)
+        row = np.fromiter(
+            (_to_float(features.get(name, 0.0)) for name in self._feat_index),
+            dtype = np.float32,
+            count = len(self._feat_index),
+        )
+        return self._predict_row(row)
+
+    def predict_values(self, values: np.ndarray, names: Tuple[str, ...]) -> Tuple[str, float]:
+        """
+        Same as predict(), for a 1-D array of feature values named (in order) by `names`.
+        Values are scattered into model order with one fancy-index assignment; model
+        features missing from `names` default to 0.
+        """
+        if self._loaded_model is None:
+            self.load_model()
+
+        src, dst = self._layout(names)
+        row = np.zeros(len(self._feat_index), dtype = np.float32)
+        row[dst] = values[src]
+        return self._predict_row(row)
+
+    def _layout(self, names: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+        # (positions in names, positions in model order) of the shared features; computed once per names tuple
+        layout = self._layouts.get(names)
+        if layout is None:
+            position = {name: i for i, name in enumerate(names)}
+            pairs = [(position[name], j) for j, name in enumerate(self._feat_index) if name in position]
+            layout = (
+                np.array([i for i, _ in pairs], dtype = np.intp),
+                np.array([j for _, j in pairs], dtype = np.intp),
+            )
+            self._layouts[names] = layout
+        return layout
 
-        # Build feature vector in correct order
-        row_values: list[float] = []
-        for name in self.feature_names:
-            value = features.get(name, 0.0)  # default 0 for missing fields
-            try:
-                row_values.append(float(value))
-            except (TypeError, ValueError):
-                row_values.append(0.0)
+    def _predict_row(self, row: np.ndarray) -> Tuple[str, float]:
+        # row: float32 feature vector in model order (what RandomForest trees compare in; models
+        # that work in float64, like HistGradientBoosting, convert this single row - negligible)
 
-        X = np.array([row_values], dtype = float)
+        # Identical inputs give identical outputs: serve repeats from the cache
+        cache_key = tuple(round(v, 6) for v in row.tolist())
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
 
-        # Predict probability of each class
+        # Predict probability of the "disease" class
         assert self._loaded_model is not None
-        proba = self._loaded_model.predict_proba(X)[0]  # shape: (n_classes)
-
-        # We assume class "1" = has disease; figure out which index that is
-        classes = list(self.loaded_model.classes_)
-        if 1 in classes:
-            idx_disease = classes.index(1)
-        else:
-            # Fallback: assume last class is "disease"
-            idx_disease = len(classes) - 1
-
-        prob_disease = float(proba[idx_disease])
+        prob_disease = float(self._loaded_model.predict_proba(row.reshape(1, -1))[0, self._idx_disease])
 
         # Map probability to simple risk label
         if prob_disease >= 0.7:
@@ -78,4 +135,5 @@ class HeartDiseaseModel(BaseDiseaseModel):    # Wrapper for the Heart Disease pr
         else:
             label = "Low"
 
+        self._cache_put(cache_key, (label, prob_disease))
         return label, prob_disease
@@ -1,27 +1,58 @@
 from dataclasses import dataclass
-from typing import Optional, Any
+from typing import Optional, Any, Iterable
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timezone
+import time
+
+try:    # argon2-cffi (C backend) is preferred; fall back to Werkzeug PBKDF2 if it is not installed
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+    _password_hasher = PasswordHasher(time_cost = 2, memory_cost = 65536, parallelism = 1)
+except ImportError:
+    _password_hasher = None
+
+# (epoch second, formatted string) of the last now_iso() call; timestamps have 1 s resolution
+_last_iso: tuple[int, str] = (-1, "")
 
 @dataclass
 class User:     # Encapsulation
     id: Optional[int]
     username: str
     email: str
-    password_hash: str
+    password_hash: str | bytes      # stored as an ASCII BLOB; legacy rows may still be TEXT
     created_at: str
     updated_at: Optional[str] = None
     is_active: int = 1
 
     @staticmethod
-    def now_iso() -> str: # Return current time in ISO format (YYYY-MM-DDTHH:MM:SS)
-        return datetime.now(timezone.utc).isoformat(timespec="seconds")
+    def now_iso() -> str: # Return current UTC time in ISO format (YYYY-MM-DDTHH:MM:SS+00:00)
+        global _last_iso
+        second = int(time.time())
+        cached = _last_iso
+        if cached[0] != second:     # format at most once per second
+            cached = (second, time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(second)))
+            _last_iso = cached
+        return cached[1]
     
-    def set_password(self, plain_password: str) -> None: # Hash and set the user's password hash
-        self.password_hash = generate_password_hash(plain_password)
+    def set_password(self, plain_password: str) -> None: # Hash and set the user's password hash (ASCII bytes -> BLOB column)
+        if _password_hasher is not None:
+            self.password_hash = _password_hasher.hash(plain_password).encode("ascii")
+        else:
+            self.password_hash = generate_password_hash(plain_password).encode("ascii")
         
     def check_password(self, plain_password: str) -> bool: # Check if provided password matches the stored
-        return check_password_hash(self.password_hash, plain_password)
+        stored = self.password_hash
+        if isinstance(stored, bytes):   # decode once; rows written before the BLOB switch are already str
+            stored = stored.decode("ascii")
+
+        if stored.startswith("$argon2"):
+            if _password_hasher is None:
+                return False
+            try:
+                return _password_hasher.verify(stored, plain_password)
+            except (VerificationError, InvalidHashError):
+                return False
+        # Legacy Werkzeug hashes (pbkdf2/scrypt) created before argon2 was used
+        return check_password_hash(stored, plain_password)
     
     def to_dict(self) -> dict[str, Any]: # Safe dictionary representation
         return {
@@ -34,7 +65,25 @@ class User:     # Encapsulation
         }
         
     @classmethod
-    def from_row(cls, row: Any) -> "User": # Create a User instance from a sqlite3.Row object
+    def from_row(cls, row: Any) -> "User": # Create a User instance from a users row
+        """
+        Positional unpack: callers must select the columns in table order:
+        SELECT id, username, email, password_hash, created_at, updated_at, is_active FROM users
+        Use from_named_row() for ad-hoc queries with a different column order.
+        """
+        id_, username, email, password_hash, created_at, updated_at, is_active = row
+        return cls(
+            id = id_,
+            username = username,
+            email = email,
+            password_hash = password_hash,
+            created_at = created_at,
+            updated_at = updated_at,
+            is_active = is_active,
+        )
+
+    @classmethod
+    def from_named_row(cls, row: Any) -> "User": # Create a User instance from a sqlite3.Row by column name
         return cls(
             id = row["id"],
             username = row["username"],
@@ -43,4 +92,8 @@ class User:     # Encapsulation
             created_at = row["created_at"],
             updated_at = row["updated_at"],
             is_active = row["is_active"],
-        )
\ No newline at end of file
+        )
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Any]) -> list["User"]: # Bulk version of from_row
+        return list(map(cls.from_row, rows))
@@ -4,13 +4,23 @@ from app.services.authentication.auth_service import auth_service
 from app.services.chatbot.chatbot_service import chatbot_service
 from app.services.report.report_service import report_service
 from app.core.managers.database_manager import db_manager
+from app.core.managers.model_manager import WARM_READY
+from app.core.managers.cache_manager import cache
 from werkzeug.utils import secure_filename
 from app.models.user.user import User
 from flask import send_file
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+import logging
 import os
+import shutil
+import tempfile
+import threading
+import time
 from flask import (
     Blueprint,
+    Response,
+    g,
     render_template,
     request,
     redirect,
@@ -22,6 +32,17 @@ from flask import (
 # Blueprint for main/public routes
 main_bp = Blueprint("main", __name__)
 
+logger = logging.getLogger(__name__)
+
+# orjson (optional) encodes each streamed chat piece without the stdlib json encoder setup
+try:
+    import orjson
+
+    def _json_dumps(value) -> str:
+        return orjson.dumps(value).decode()
+except ImportError:
+    from json import dumps as _json_dumps
+
 # -------------------------------------------------------------------
 # Upload configuration for brain MRI images
 # -------------------------------------------------------------------
@@ -32,22 +53,199 @@ main_bp = Blueprint("main", __name__)
 BASE_DIR = Path(__file__).parent  # app/
 BRAIN_UPLOAD_DIR = BASE_DIR / "ui" / "static" / "uploads" / "brain"
 BRAIN_UPLOAD_DIR.mkdir(parents = True, exist_ok = True)
+_BRAIN_UPLOAD_DIR_STR = os.fspath(BRAIN_UPLOAD_DIR)
+# Public URL prefix of uploaded MRIs, built once from the app's static URL path when the
+# blueprint is registered (so no url_for() rule matching per upload); request.script_root
+# is prepended per request so the app still works when mounted under a prefix
+_BRAIN_URL_PREFIX = "/static/uploads/brain/"
+
+
+@main_bp.record_once
+def _init_static_prefixes(state) -> None:
+    global _BRAIN_URL_PREFIX
+    _BRAIN_URL_PREFIX = f"{state.app.static_url_path}/uploads/brain/"
+
+
+# Allowed MRI image extensions (lowercase, without the dot)
+ALLOWED_IMAGE_EXTENSIONS = frozenset({"png", "jpg", "jpeg", "bmp"})
 
-# Allowed MRI image extensions
-ALLOWED_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp"}
+# -------------------------------------------------------------------
+# Heart-disease form fields (these match the 70k Cardiovascular Dataset)
+# -------------------------------------------------------------------
+_HEART_REQUIRED_FIELDS = (
+    "age", "sex", "height", "weight",
+    "ap_hi", "ap_lo", "cholesterol", "gluc",
+    "smoke", "alco", "active",
+)
+_HEART_NUMERIC_SET = frozenset(("age", "height", "weight", "ap_hi", "ap_lo"))
+
+# -------------------------------------------------------------------
+# Per-user dashboard statistics cache
+# -------------------------------------------------------------------
+# user_id -> (timestamp, (total_analyses, heart_scans, brain_scans))
+# Entries expire after _DASH_CACHE_TTL seconds and are dropped whenever the
+# user's prediction history changes (new prediction, history cleared, account deleted).
+_DASH_CACHE_TTL = 30.0
+_DASH_CACHE_MAXSIZE = 1024
+_dash_cache: dict[int, tuple[float, tuple[int, int, int]]] = {}
+# Per-model prediction counts for one user (index-only scan on idx_predlogs_user_model)
+_SQL_DASHBOARD_COUNTS = "SELECT model_type, COUNT(*) FROM prediction_logs WHERE user_id = ? GROUP BY model_type"
+
+
+def _invalidate_user_caches(user_id) -> None:
+    # The user's prediction history changed: drop the dashboard stats and the chatbot's medical context
+    _dash_cache.pop(user_id, None)
+    chatbot_service.invalidate_user(user_id)
+
+# -------------------------------------------------------------------
+# MRI uploads: written to disk in the background while the model runs
+# -------------------------------------------------------------------
+_upload_pool = ThreadPoolExecutor(max_workers = 2, thread_name_prefix = "mri-save")
+
+
+def _save_upload(data: bytes, save_path: str) -> None:
+    # Write into a temp file in the same directory, then atomically move it into
+    # place (readers never see a partial file)
+    fd, tmp_path = tempfile.mkstemp(dir = _BRAIN_UPLOAD_DIR_STR, suffix = ".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, save_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# -------------------------------------------------------------------
+# PDF reports: rendered off the request thread, then served from disk
+# -------------------------------------------------------------------
+# A report is rendered once into instance/reports/<user_id>/<kind>_<log_id>.pdf
+# (outside static/, so it is only reachable through the login-checked report routes).
+# Prediction logs never change, so the file stays valid until the history is cleared.
+REPORTS_DIR = BASE_DIR.parent / "instance" / "reports"
+_REPORT_WAIT_SECONDS = 15.0     # how long a download request waits for a fresh render
+_pdf_pool = ThreadPoolExecutor(max_workers = 4, thread_name_prefix = "pdf-report")
+_pdf_pending: dict[Path, Future] = {}   # report path -> in-flight render (one render per report)
+_pdf_pending_lock = threading.Lock()
+
+
+def _render_report_file(generate, user, log, path: Path) -> Path:
+    try:
+        pdf_buffer = generate(user, log)
+        path.parent.mkdir(parents = True, exist_ok = True)
+        # Write to a temp file and rename so a half-written PDF is never served
+        fd, tmp_path = tempfile.mkstemp(dir = path.parent, suffix = ".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(pdf_buffer.getbuffer())
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok = True)
+            raise
+        return path
+    finally:
+        with _pdf_pending_lock:
+            _pdf_pending.pop(path, None)
+
+
+def _get_report_pdf(kind: str, generate, user, log) -> Path:
+    """
+    Return the on-disk PDF for this log, rendering it on the PDF pool if needed.
+    Raises concurrent.futures.TimeoutError if the render takes longer than _REPORT_WAIT_SECONDS
+    (it keeps running, so a retry picks up the finished file).
+    """
+    path = REPORTS_DIR / str(user.id) / f"{kind}_{log['id']}.pdf"
+    with _pdf_pending_lock:
+        future = _pdf_pending.get(path)
+        if future is None:
+            if path.is_file():
+                return path
+            future = _pdf_pool.submit(_render_report_file, generate, user, log, path)
+            _pdf_pending[path] = future
+    return future.result(timeout = _REPORT_WAIT_SECONDS)
+
+
+def _delete_user_reports(user_id) -> None:
+    shutil.rmtree(REPORTS_DIR / str(user_id), ignore_errors = True)
+
+
+def _session_user() -> User | None:
+    # User built from the profile fields cached at login (no DB read); None for
+    # sessions created before those fields were stored
+    if "user_email" not in session:
+        return None
+    return User(
+        id = g.user_id,
+        username = session.get("username", ""),
+        email = session["user_email"],
+        password_hash = "",
+        created_at = session.get("user_created_at", ""),
+    )
+
+def _find_report_log(log_id: int, user_id: int, model_type: str):
+    # (log, user) for a report download, or None if the log is missing / not this user's.
+    # The header uses the profile cached in the session; older sessions get log + user
+    # from a single JOIN instead of two SELECTs
+    user = _session_user()
+    if user is None:
+        return report_service.get_prediction_and_user(log_id, user_id, model_type = model_type)
+    log = report_service.get_prediction_for_user(log_id, user_id, model_type = model_type)
+    return (log, user) if log is not None else None
+
+
+# -------------------------------------------------------------------
+# Login guard
+# -------------------------------------------------------------------
+# Endpoints reachable without logging in; every other main.* view requires a session
+_PUBLIC_ENDPOINTS = frozenset({"main.welcome", "main.ready", "main.register", "main.login", "main.logout"})
+# Flash message shown when a protected page is opened without a session
+_LOGIN_REQUIRED_MESSAGES = {
+    "main.dashboard": "Please log in to access the dashboard.",
+    "main.heart_disease": "Please log in to access heart disease detection.",
+    "main.brain_tumor": "Please log in to access brain tumor detection.",
+    "main.chatbot": "Please log in to access the AI doctor chatbot.",
+    "main.chatbot_stream": "Please log in to access the AI doctor chatbot.",
+    "main.settings": "Please log in to access settings.",
+    "main.change_password": "Please log in to access settings.",
+    "main.clear_history": "Please log in to access settings.",
+    "main.heart_report": "Please log in to access reports.",
+    "main.brain_report": "Please log in to access reports.",
+}
+
+
+@main_bp.before_request
+def _require_login():
+    # Read the session once per request; protected views use g.user_id
+    endpoint = request.endpoint
+    if endpoint in _PUBLIC_ENDPOINTS:
+        return None
+    user_id = session.get("user_id")
+    if user_id is None:
+        flash(_LOGIN_REQUIRED_MESSAGES.get(endpoint, "Please log in first."), "error")
+        return redirect(url_for("main.login"))
+    g.user_id = user_id
+    return None
 
 
 @main_bp.route("/") # Welcome / Home page
+@cache.cached(timeout = 300)    # static page: same output for every visitor
 def welcome():
     return render_template("welcome.html")
 
 
+@main_bp.route("/ready")    # Readiness probe: 200 once background model warmup is done
+def ready():
+    if WARM_READY.is_set():
+        return "ready", 200
+    return "warming up", 503
+
+
 @main_bp.route("/register", methods = ["GET", "POST"])  # Registration page.
 def register():
     # GET: show the form
     if request.method == "POST":  # POST: process the form and create new user.
         username = request.form.get("username", "").strip()
-        email = request.form.get("email", "").strip()
+        email = request.form.get("email", "").strip().lower()
         password = request.form.get("password", "")
         confirm_password = request.form.get("confirm_password", "")
 
@@ -56,11 +254,6 @@ def register():
             flash("All fields are required.", "error")
             return redirect(url_for("main.register"))
 
-        # Email format validation
-        if "@" not in email or "." not in email.split("@")[-1]:
-            flash("Please enter a valid email address.", "error")
-            return redirect(url_for("main.register"))
-
         if password != confirm_password:
             flash("Passwords do not match.", "error")
             return redirect(url_for("main.register"))
@@ -77,8 +270,8 @@ def register():
             else:
                 flash(message, "error")
                 return redirect(url_for("main.register"))
-        except Exception as e:
-            print(f"[ERROR] Register route: Unexpected error: {e}")
+        except Exception:
+            logger.exception("Register route failed on %s", request.path)
             flash("Registration failed. Please try again later.", "error")
             return redirect(url_for("main.register"))
 
@@ -105,6 +298,9 @@ def login():
         # Save minimal info in session
         session["user_id"] = user.id
         session["username"] = user.username
+        # Profile fields shown in PDF reports (neither can change while logged in)
+        session["user_email"] = user.email
+        session["user_created_at"] = user.created_at
 
         flash(f"Welcome, {user.username}!", "success")
         return redirect(url_for("main.dashboard"))
@@ -115,40 +311,30 @@ def login():
 
 @main_bp.route("/dashboard")
 def dashboard():
-    if "user_id" not in session:
-        flash("Please log in to access the dashboard.", "error")
-        return redirect(url_for("main.login"))
-
-    user_id = session.get("user_id")
+    user_id = g.user_id
     username = session.get("username")
     
-    # Fetch statistics from prediction_logs
-    try:
-        # Total analyses (all predictions)
-        total_row = db_manager.fetch_one(
-            "SELECT COUNT(*) as count FROM prediction_logs WHERE user_id = ?",
-            (user_id,)
-        )
-        total_analyses = total_row[0] if total_row else 0
-        
-        # Heart scans count
-        heart_row = db_manager.fetch_one(
-            "SELECT COUNT(*) as count FROM prediction_logs WHERE user_id = ? AND model_type = ?",
-            (user_id, "heart_disease")
-        )
-        heart_scans = heart_row[0] if heart_row else 0
-        
-        # Brain scans count
-        brain_row = db_manager.fetch_one(
-            "SELECT COUNT(*) as count FROM prediction_logs WHERE user_id = ? AND model_type = ?",
-            (user_id, "brain_tumor_multiclass")
-        )
-        brain_scans = brain_row[0] if brain_row else 0
-    except Exception as e:
-        print(f"[ERROR] Dashboard: Failed to fetch statistics: {e}")
-        total_analyses = 0
-        heart_scans = 0
-        brain_scans = 0
+    # Serve recent statistics from the in-process cache
+    entry = _dash_cache.get(user_id)
+    if entry is not None and time.monotonic() - entry[0] < _DASH_CACHE_TTL:
+        total_analyses, heart_scans, brain_scans = entry[1]
+    else:
+        # Fetch statistics from prediction_logs (one aggregated query)
+        try:
+            rows = db_manager.fetch_all(_SQL_DASHBOARD_COUNTS, (user_id,))
+            counts = {row[0]: row[1] for row in rows}
+            total_analyses = sum(counts.values())     # Total analyses (all predictions)
+            heart_scans = counts.get("heart_disease", 0)
+            brain_scans = counts.get("brain_tumor_multiclass", 0)
+
+            if user_id not in _dash_cache and len(_dash_cache) >= _DASH_CACHE_MAXSIZE:
+                _dash_cache.pop(next(iter(_dash_cache)), None)    # FIFO eviction
+            _dash_cache[user_id] = (time.monotonic(), (total_analyses, heart_scans, brain_scans))
+        except Exception:
+            logger.exception("Dashboard: failed to fetch statistics for user %s", user_id)
+            total_analyses = 0
+            heart_scans = 0
+            brain_scans = 0
     
     return render_template(
         "dashboard.html",
@@ -161,55 +347,51 @@ def dashboard():
 
 @main_bp.route("/heart-disease", methods = ["GET", "POST"])
 def heart_disease():
-    if "user_id" not in session:
-        flash("Please log in to access heart disease detection.", "error")
-        return redirect(url_for("main.login"))
     
     result = None
     if request.method == "POST":
-        # UPDATED: These fields match the 70k Cardiovascular Dataset
-        required_fields = [
-            "age", "sex", "height", "weight", 
-            "ap_hi", "ap_lo", "cholesterol", "gluc", 
-            "smoke", "alco", "active"
-        ]
-        
-        # Validate all required fields are present and not empty
+        # Validate presence of every required field and coerce the numeric ones in one pass
+        form = request.form
+        vals = {}
         missing_fields = []
-        for field in required_fields:
-            value = request.form.get(field, "").strip()
+        numeric_error = None    # first numeric problem, reported only if nothing is missing
+        for field in _HEART_REQUIRED_FIELDS:
+            value = form.get(field, "").strip()
             if not value:
                 missing_fields.append(field)
+                continue
+            if field in _HEART_NUMERIC_SET:
+                try:
+                    value = float(value)
+                except ValueError:
+                    numeric_error = numeric_error or f"{field} must be a valid number."
+                    continue
+                if value < 0:
+                    numeric_error = numeric_error or f"{field} must be a positive number."
+                    continue
+            vals[field] = value
         
         if missing_fields:
             flash(f"Please fill in all required fields. Missing: {', '.join(missing_fields)}", "error")
             return redirect(url_for("main.heart_disease"))
         
-        # Validate numeric fields are valid numbers
-        numeric_fields = ["age", "height", "weight", "ap_hi", "ap_lo"]
-        for field in numeric_fields:
-            try:
-                value = float(request.form.get(field, ""))
-                if value < 0:
-                    flash(f"{field} must be a positive number.", "error")
-                    return redirect(url_for("main.heart_disease"))
-            except ValueError:
-                flash(f"{field} must be a valid number.", "error")
-                return redirect(url_for("main.heart_disease"))
+        if numeric_error:
+            flash(numeric_error, "error")
+            return redirect(url_for("main.heart_disease"))
         
-        user_id = session.get("user_id")
-        form_data = request.form.to_dict()
+        user_id = g.user_id
         
         try:
-            result = prediction_service.predict_heart_disease(form_data, user_id)
+            # vals holds exactly the required fields: numerics already parsed to float
+            result = prediction_service.predict_heart_disease(vals, user_id, wait_for_log = False)
             flash("Heart prediction completed.", "success")
+            prediction_service.resolve_log_id(result)     # the report link needs the committed row ID
+            _invalidate_user_caches(user_id)
         except RuntimeError as e:
             flash(str(e), "error")
             return redirect(url_for("main.heart_disease"))
-        except Exception as e:
-            print(f"[ERROR] Heart disease route: Unexpected error: {type(e).__name__}: {e}")
-            import traceback
-            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+        except Exception:
+            logger.exception("Heart disease route failed on %s", request.path)
             flash("Heart disease prediction failed. Please try again later.", "error")
             return redirect(url_for("main.heart_disease"))
     
@@ -217,10 +399,6 @@ def heart_disease():
 
 @main_bp.route("/brain-tumor", methods = ["GET", "POST"])
 def brain_tumor():  # Brain tumor detection page
-    if "user_id" not in session:
-        flash("Please log in to access brain tumor detection.", "error")
-        return redirect(url_for("main.login"))
-
     result = None
     if request.method == "POST":
         file = request.files.get("mri_image")
@@ -241,7 +419,7 @@ def brain_tumor():  # Brain tumor detection page
             flash("Invalid filename. Please select a valid image file.", "error")
             return redirect(url_for("main.brain_tumor"))
 
-        ext = Path(filename).suffix.lower()
+        ext = filename.rpartition(".")[2].lower() if "." in filename else ""
 
         # Validate file extension
         if ext not in ALLOWED_IMAGE_EXTENSIONS:
@@ -252,31 +430,19 @@ def brain_tumor():  # Brain tumor detection page
             return redirect(url_for("main.brain_tumor"))
 
         # Full save path: app/ui/uploads/brain/<filename>
-        # Flask static_folder is "ui", so url_for("static", filename="uploads/brain/...") 
-        # looks for files in app/ui/uploads/brain/
-        # Use os.path.join to ensure proper path handling on all platforms
-        save_path = os.path.join(str(BRAIN_UPLOAD_DIR), filename)
-
-        # Save the file
-        try:
-            file.save(save_path)
-        except Exception as e:
-            print(f"[ERROR] Failed to save uploaded MRI: {e}")
-            flash("There was a problem saving the uploaded image. Please try again.", "error")
-            return redirect(url_for("main.brain_tumor"))
+        # Served by Flask's static route as /static/uploads/brain/<filename>
+        save_path = f"{_BRAIN_UPLOAD_DIR_STR}{os.sep}{filename}"
 
-        # Build the public URL for the uploaded image using static folder
-        # Use forward slashes for URL (works on all platforms)
-        image_url = url_for("static", filename = f"uploads/brain/{filename}")
-        user_id = session.get("user_id")
+        # Read the upload once: the model decodes these bytes directly, while the copy
+        # shown on the result page is written to disk in the background meanwhile
+        data = file.stream.read()   # bounded by MAX_CONTENT_LENGTH
+        save_future = _upload_pool.submit(_save_upload, data, save_path)
+        user_id = g.user_id
 
         # Run prediction
         try:
-            # Pass string path to prediction service
-            result = prediction_service.predict_brain_tumor(str(save_path), user_id)
-            # Add image URL to result for template display
-            if result:
-                result["image_url"] = image_url
+            # The log insert is committed while the upload save below is awaited
+            result = prediction_service.predict_brain_tumor_from_bytes(data, filename, user_id, wait_for_log = False)
             flash(
                 "Brain tumor prediction completed successfully – see results below.",
                 "success",
@@ -285,21 +451,34 @@ def brain_tumor():  # Brain tumor detection page
             # RuntimeError messages are user-friendly
             flash(str(e), "error")
             result = None
-        except Exception as e:
-            print(f"[ERROR] Brain tumor prediction failed: {type(e).__name__}: {e}")
-            import traceback
-            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+        except Exception:
+            logger.exception("Brain tumor prediction failed on %s", request.path)
             flash("Brain tumor prediction failed. Please try again later.", "error")
             result = None
 
+        # The result page links to the saved image, so it must be on disk before rendering
+        try:
+            save_future.result()
+            saved = True
+        except Exception:
+            logger.exception("Failed to save uploaded MRI on %s", request.path)
+            saved = False
+
+        if result is not None:
+            prediction_service.resolve_log_id(result)
+            _invalidate_user_caches(user_id)
+
+        if result is None:
+            if saved:
+                Path(save_path).unlink(missing_ok = True)   # failed prediction: do not keep the upload
+        elif saved:
+            # Public URL for the uploaded image (secure_filename output is URL-safe)
+            result["image_url"] = f"{request.script_root}{_BRAIN_URL_PREFIX}{filename}"
+
     return render_template("brain_tumor.html", result = result)
 
 @main_bp.route("/chatbot", methods = ["GET", "POST"])
 def chatbot():  # AI Doctor Chatbot page
-    if "user_id" not in session:
-        flash("Please log in to access the AI doctor chatbot.", "error")
-        return redirect(url_for("main.login"))
-
     user_message = None
     assistant_reply = None
 
@@ -310,7 +489,7 @@ def chatbot():  # AI Doctor Chatbot page
             flash("Please type a message before sending.", "error")
             return redirect(url_for("main.chatbot"))
 
-        user_id = session.get("user_id")
+        user_id = g.user_id
 
         try:
             assistant_reply = chatbot_service.send_message(user_id, user_message)
@@ -321,15 +500,12 @@ def chatbot():  # AI Doctor Chatbot page
                 flash("Chatbot configuration error: GROQ_API_KEY environment variable is not set. Please set the GROQ_API_KEY environment variable before using the chatbot. You can get an API key from https://console.groq.com/", "error")
             else:
                 flash(f"Chatbot error: {error_msg}", "error")
-            print(f"[ERROR] ChatbotService failed: {e}")
+            logger.error("ChatbotService failed: %s", e)
             assistant_reply = None
-        except Exception as e:
+        except Exception:
             # Handle other unexpected errors
-            error_msg = str(e)
             flash("There was a problem contacting the AI doctor chatbot. Please try again later.", "error")
-            print(f"[ERROR] ChatbotService failed: {type(e).__name__}: {e}")
-            import traceback
-            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+            logger.exception("ChatbotService failed on %s", request.path)
             assistant_reply = None
 
     return render_template(
@@ -338,6 +514,31 @@ def chatbot():  # AI Doctor Chatbot page
         assistant_reply = assistant_reply,
     )
 
+@main_bp.route("/chatbot/stream", methods = ["POST"])
+def chatbot_stream():   # Same as POST /chatbot, but streams the reply as server-sent events
+    user_message = request.form.get("message", "").strip()
+    if not user_message:
+        return Response("Please type a message before sending.", status = 400, mimetype = "text/plain")
+
+    try:
+        pieces = chatbot_service.send_message_stream(g.user_id, user_message)
+    except RuntimeError as e:
+        # e.g. missing GROQ_API_KEY: the page falls back to a normal POST, which flashes the error
+        logger.error("ChatbotService failed: %s", e)
+        return Response(str(e), status = 503, mimetype = "text/plain")
+
+    def events():
+        # One "data:" event per piece (JSON-encoded, so newlines survive), then a "done" event
+        for piece in pieces:
+            yield f"data: {_json_dumps(piece)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        events(),
+        mimetype = "text/event-stream",
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},   # no proxy buffering
+    )
+
 @main_bp.route("/settings", methods=["GET"])
 def settings():
     """
@@ -345,11 +546,7 @@ def settings():
     - Shows profile info
     - Links/forms for password change, history clear, delete account
     """
-    if "user_id" not in session:
-        flash("Please log in to access settings.", "error")
-        return redirect(url_for("main.login"))
-
-    user_id = session.get("user_id")
+    user_id = g.user_id
     profile = user_settings_service.get_profile(user_id)
 
     if profile is None:
@@ -360,11 +557,7 @@ def settings():
 
 @main_bp.route("/settings/change-password", methods = ["POST"])
 def change_password():
-    if "user_id" not in session:
-        flash("Please log in to access settings.", "error")
-        return redirect(url_for("main.login"))
-
-    user_id = session.get("user_id")
+    user_id = g.user_id
     old_password = request.form.get("old_password", "")
     new_password = request.form.get("new_password", "")
     confirm_password = request.form.get("confirm_password", "")
@@ -381,24 +574,20 @@ def change_password():
 
 @main_bp.route("/settings/clear-history", methods=["POST"])
 def clear_history():
-    if "user_id" not in session:
-        flash("Please log in to access settings.", "error")
-        return redirect(url_for("main.login"))
-
-    user_id = session.get("user_id")
+    user_id = g.user_id
 
     success, message = user_settings_service.clear_prediction_history(user_id)
+    _invalidate_user_caches(user_id)
+    _delete_user_reports(user_id)
     flash(message, "success" if success else "error")
     return redirect(url_for("main.settings"))
 
 @main_bp.route("/settings/delete-account", methods=["POST"])
 def delete_account():
-    if "user_id" not in session:
-        flash("Please log in first.", "error")
-        return redirect(url_for("main.login"))
-
-    user_id = session.get("user_id")
+    user_id = g.user_id
     success, message = user_settings_service.delete_account(user_id)
+    _invalidate_user_caches(user_id)
+    _delete_user_reports(user_id)
     session.clear()
 
     flash(message, "success" if success else "error")
@@ -409,55 +598,45 @@ def heart_report(log_id: int):
     """
     Download a PDF report for a heart-disease prediction.
     """
-    if "user_id" not in session:
-        flash("Please log in to access reports.", "error")
-        return redirect(url_for("main.login"))
-
     # Validate log_id
     if not log_id or log_id <= 0:
         flash("Invalid report ID.", "error")
         return redirect(url_for("main.dashboard"))
 
-    user_id = session.get("user_id")
+    user_id = g.user_id
 
     try:
-        # Get the prediction log and make sure it belongs to this user
-        log = report_service.get_prediction_for_user(
-            log_id,
-            user_id,
-            model_type = "heart_disease",
-        )
-        if log is None:
+        # Get the prediction log and make sure it belongs to this user (one query)
+        found = _find_report_log(log_id, user_id, "heart_disease")
+        if found is None:
             flash("Heart prediction log not found.", "error")
             return redirect(url_for("main.dashboard"))
 
-        # Load user object
-        row = db_manager.fetch_one("SELECT * FROM users WHERE id = ?", (user_id,))
-        if row is None:
-            flash("User not found.", "error")
-            return redirect(url_for("main.dashboard"))
-
-        user = User.from_row(row)
+        log, user = found
 
-        # Generate PDF
+        # Render the PDF on the report pool (or reuse the file rendered earlier)
         try:
-            pdf_buffer = report_service.generate_heart_report(user, log)
-        except Exception as e:
-            print(f"[ERROR] Heart report PDF generation failed: {type(e).__name__}: {e}")
-            import traceback
-            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+            pdf_path = _get_report_pdf("heart", report_service.generate_heart_report, user, log)
+        except FutureTimeoutError:
+            flash("Your report is still being prepared. Please try downloading it again in a moment.", "success")
+            return redirect(url_for("main.dashboard"))
+        except Exception:
+            logger.exception("Heart report PDF generation failed on %s", request.path)
             flash("Could not generate PDF report. Please try again later.", "error")
             return redirect(url_for("main.dashboard"))
 
-        filename = f"heart report {log.get('id')}.pdf"
+        filename = f"heart report {log['id']}.pdf"
         return send_file(
-            pdf_buffer,
+            pdf_path,
             mimetype = "application/pdf",
             as_attachment = True,
             download_name = filename,
+            conditional = True,     # ETag / Last-Modified / Range; body goes out via sendfile()
+            etag = True,
+            max_age = 0,            # browsers revalidate (cheap 304) instead of caching blindly
         )
-    except Exception as e:
-        print(f"[ERROR] Heart report route: Unexpected error: {type(e).__name__}: {e}")
+    except Exception:
+        logger.exception("Heart report route failed on %s", request.path)
         flash("An error occurred while generating the report. Please try again later.", "error")
         return redirect(url_for("main.dashboard"))
 
@@ -466,55 +645,45 @@ def brain_report(log_id: int):
     """
     Download a PDF report for a brain-tumor prediction.
     """
-    if "user_id" not in session:
-        flash("Please log in to access reports.", "error")
-        return redirect(url_for("main.login"))
-
     # Validate log_id
     if not log_id or log_id <= 0:
         flash("Invalid report ID.", "error")
         return redirect(url_for("main.dashboard"))
 
-    user_id = session.get("user_id")
+    user_id = g.user_id
 
     try:
-        # Get the prediction log and make sure it belongs to this user
-        log = report_service.get_prediction_for_user(
-            log_id,
-            user_id,
-            model_type = "brain_tumor_multiclass",
-        )
-        if log is None:
+        # Get the prediction log and make sure it belongs to this user (one query)
+        found = _find_report_log(log_id, user_id, "brain_tumor_multiclass")
+        if found is None:
             flash("Brain prediction log not found.", "error")
             return redirect(url_for("main.dashboard"))
 
-        # Load user object
-        row = db_manager.fetch_one("SELECT * FROM users WHERE id = ?", (user_id,))
-        if row is None:
-            flash("User not found.", "error")
-            return redirect(url_for("main.dashboard"))
-
-        user = User.from_row(row)
+        log, user = found
 
-        # Generate PDF
+        # Render the PDF on the report pool (or reuse the file rendered earlier)
         try:
-            pdf_buffer = report_service.generate_brain_report(user, log)
-        except Exception as e:
-            print(f"[ERROR] Brain report PDF generation failed: {type(e).__name__}: {e}")
-            import traceback
-            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+            pdf_path = _get_report_pdf("brain", report_service.generate_brain_report, user, log)
+        except FutureTimeoutError:
+            flash("Your report is still being prepared. Please try downloading it again in a moment.", "success")
+            return redirect(url_for("main.dashboard"))
+        except Exception:
+            logger.exception("Brain report PDF generation failed on %s", request.path)
             flash("Could not generate PDF report. Please try again later.", "error")
             return redirect(url_for("main.dashboard"))
 
-        filename = f"brain report {log.get('id')}.pdf"
+        filename = f"brain report {log['id']}.pdf"
         return send_file(
-            pdf_buffer,
+            pdf_path,
             mimetype = "application/pdf",
             as_attachment = True,
             download_name = filename,
+            conditional = True,     # ETag / Last-Modified / Range; body goes out via sendfile()
+            etag = True,
+            max_age = 0,            # browsers revalidate (cheap 304) instead of caching blindly
         )
-    except Exception as e:
-        print(f"[ERROR] Brain report route: Unexpected error: {type(e).__name__}: {e}")
+    except Exception:
+        logger.exception("Brain report route failed on %s", request.path)
         flash("An error occurred while generating the report. Please try again later.", "error")
         return redirect(url_for("main.dashboard"))
     
@@ -1,9 +1,40 @@
+import re
 from typing import Tuple, Union
 from app.core.managers.database_manager import db_manager, DatabaseManager
 from app.models.user.user import User
 from app.services.base_service import BaseService
 
 
+# Basic email shape check: something@domain.tld (email format is validated here only, not in routes)
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# SQL used by the auth flows (one canonical string each, so the connection's statement cache always hits)
+# 'u' if the username is taken, 'e' if only the email is; no row data is fetched
+_SQL_USER_EXISTS = """
+    SELECT CASE WHEN username = ? THEN 'u' ELSE 'e' END AS which
+    FROM users
+    WHERE username = ? OR email = ?
+    LIMIT 1
+"""
+_SQL_INSERT_USER = """
+    INSERT INTO users (username, email, password_hash, created_at, updated_at, is_active)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+# Login looks up one exact column so the lookup is a single index probe (no OR across two indexes)
+_SQL_USER_BY_EMAIL = """
+    SELECT id, username, email, password_hash, created_at, updated_at, is_active
+    FROM users
+    WHERE email = ?
+    LIMIT 1
+"""
+_SQL_USER_BY_USERNAME = """
+    SELECT id, username, email, password_hash, created_at, updated_at, is_active
+    FROM users
+    WHERE username = ?
+    LIMIT 1
+"""
+
+
 class AuthService(BaseService):  # Handles user registration, login, and password changes
     def __init__(self, db: DatabaseManager = db_manager) -> None:
         # Initialize shared BaseService database attribute
@@ -25,23 +56,14 @@ class AuthService(BaseService):  # Handles user registration, login, and passwor
         
         # Email format validation (basic check)
         email = email.strip().lower()
-        if "@" not in email or "." not in email.split("@")[-1]:
+        if not _EMAIL_RE.match(email):
             return False, "Please enter a valid email address."
         
-        # Check if username already exists
-        row = self.db.fetch_one(
-            "SELECT * FROM users WHERE username = ?",
-            (username,),
-        )
-        if row is not None:
-            return False, "Username is already taken."
-
-        # Check if email already exists
-        row = self.db.fetch_one(
-            "SELECT * FROM users WHERE email = ?",
-            (email,),
-        )
+        # Check if username or email already exists (one probe, no row data fetched)
+        row = self.db.fetch_one(_SQL_USER_EXISTS, (username, username, email))
         if row is not None:
+            if row[0] == "u":
+                return False, "Username is already taken."
             return False, "Email is already registered."
 
         # Create new User instance
@@ -59,10 +81,7 @@ class AuthService(BaseService):  # Handles user registration, login, and passwor
 
         # Insert into database
         self.db.execute(
-            """
-            INSERT INTO users (username, email, password_hash, created_at, updated_at, is_active)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
+            _SQL_INSERT_USER,
             (
                 user.username,
                 user.email,
@@ -81,22 +100,25 @@ class AuthService(BaseService):  # Handles user registration, login, and passwor
         password: str,
     ) -> Tuple[bool, Union[str, User]]:
        
-        # Search by Email/Username
-        row = self.db.fetch_one(
-            "SELECT * FROM users WHERE email = ? OR username = ?",
-            (identifier, identifier),
-        )
+        # Search by Email (identifier contains "@") or Username
+        if "@" in identifier:
+            row = self.db.fetch_one(_SQL_USER_BY_EMAIL, (identifier.lower(),))
+            if row is None:     # usernames are not forbidden from containing "@"
+                row = self.db.fetch_one(_SQL_USER_BY_USERNAME, (identifier,))
+        else:
+            row = self.db.fetch_one(_SQL_USER_BY_USERNAME, (identifier,))
         if row is None:
             return False, "User not found."
 
+        # Deactivated accounts are rejected before the (deliberately slow) password KDF runs
+        if not row["is_active"]:
+            return False, "Account is deactivated."
+
         user = User.from_row(row)
 
         if not user.check_password(password):
             return False, "Incorrect password."
 
-        if not user.is_active:
-            return False, "Account is deactivated."
-
         return True, user
     
 auth_service = AuthService() # Global service instance
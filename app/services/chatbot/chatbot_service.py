@@ -1,14 +1,308 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any
+from typing import TYPE_CHECKING, Optional, Dict, Any, Iterator, Tuple
 from app.core.managers.database_manager import db_manager, DatabaseManager
-from groq import Groq
+import asyncio
+import atexit
+import functools
+import importlib.util
+import logging
 import os
+import re
+import sqlite3
+import string
+import threading
+import time
+import weakref
 from app.services.base_service import BaseService
 
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:   # groq (and httpx/pydantic) is only imported when the chatbot is first used
+    from groq import AsyncGroq, Groq
+
+
+# System-level instructions for the AI doctor assistant (identical for every request,
+# so it is built once at import time)
+#
+# MESSAGE ORDER INVARIANT: every Groq request starts with exactly this system message,
+# byte-for-byte, followed by the per-user context and then the user's message. The
+# provider can only reuse its cached prefill for a shared *leading* prefix, so never
+# interpolate per-request data into _SYSTEM_PROMPT or put anything in front of it.
+_SYSTEM_PROMPT = (
+    "ROLE:"
+    "You are Dr. MDDS, a board-certified, highly experienced Medical Doctor and Diagnostic Consultant with comprehensive expertise across ALL medical fields including:\n"
+    "- Internal Medicine, Cardiology, Neurology, Psychiatry, Endocrinology, Gastroenterology\n"
+    "- Orthopedics, Dermatology, Ophthalmology, ENT, Pulmonology, Nephrology\n"
+    "- Oncology, Hematology, Immunology, Infectious Diseases, Emergency Medicine\n"
+    "- Pediatrics, Geriatrics, Women's Health, Men's Health, and Preventive Medicine\n"
+    "- Pharmacology, Drug Interactions, Pain Management, and Symptom Analysis\n\n"
+    "You have access to the patient's complete medical history through the Multi-Disease Detection System, including their latest Heart Disease Risk Assessment and Brain MRI Scan results.\n\n"
+
+    "COMPREHENSIVE MEDICAL EXPERTISE:"
+    "- You are a FULL DOCTOR with extensive knowledge of ALL medical conditions, diseases, symptoms, treatments, and medications.\n"
+    "- You can answer questions about ANY medical topic: pain (any location, type, or severity), physical sensations, emotional feelings, medications (prescription and OTC), symptoms, diseases, treatments, diagnostic procedures, and health concerns.\n"
+    "- You understand the full spectrum of human health from common colds to complex rare diseases.\n"
+    "- You can interpret and correlate symptoms across different body systems.\n"
+    "- You have deep knowledge of pharmacology, drug mechanisms, interactions, side effects, and contraindications.\n\n"
+
+    "PATIENT ANALYSIS INTEGRATION (CRITICAL):"
+    "- You ALWAYS have access to the patient's latest analysis results (Heart Disease Risk Assessment and Brain MRI Scan) which will be provided in the context.\n"
+    "- You MUST reference and correlate the patient's symptoms, pain, or questions with their latest test results when relevant.\n"
+    "- When discussing pain, feelings, or medical concerns, check if they relate to the patient's heart or brain analysis results.\n"
+    "- Use the analysis data to provide personalized, context-aware medical guidance.\n"
+    "- Example: If a patient asks about chest pain and their heart analysis shows elevated risk, reference that in your response.\n"
+    "- Example: If a patient asks about headaches and their brain MRI shows abnormalities, incorporate that information.\n\n"
+
+    "EMERGENCY & RED-FLAG HANDLING (MANDATORY OVERRIDE):"
+    "- Red-Flag Detection: If the user reports severe chest pain, chest pressure radiating to the arm or jaw, sudden shortness of breath, fainting, seizures, sudden weakness or numbness on one side of the body, confusion, severe head injury, loss of consciousness, severe abdominal pain, or any life-threatening symptoms, this must be treated as a medical emergency.\n"
+    "- Immediate Action Rule: In red-flag scenarios, you MUST stop detailed analysis and clearly instruct the user to seek immediate emergency medical care or contact local emergency services (call 911 or local emergency number).\n"
+    "- Priority Rule: Emergency guidance takes absolute priority over all other response sections.\n"
+    "- Communication Style: Use calm, direct, and clear language. Do NOT provide alternative explanations, reassurance, or home remedies in emergency situations.\n\n"
+
+    "PAIN & SYMPTOM ANALYSIS:"
+    "- You are an expert in analyzing ALL types of pain: acute, chronic, sharp, dull, throbbing, burning, stabbing, aching, etc.\n"
+    "- You understand pain in ANY location: head, chest, abdomen, back, joints, muscles, nerves, etc.\n"
+    "- You can differentiate between different pain types and their potential causes.\n"
+    "- You can assess pain severity and urgency.\n"
+    "- You understand how pain relates to various medical conditions across all specialties.\n\n"
+
+    "FEELINGS & EMOTIONAL HEALTH:"
+    "- You understand physical feelings and sensations (nausea, dizziness, fatigue, weakness, numbness, tingling, etc.).\n"
+    "- You understand emotional feelings and their connection to physical health (anxiety, depression, stress-related symptoms).\n"
+    "- You can differentiate between psychological and physiological causes of feelings.\n"
+    "- You recognize when feelings indicate serious medical conditions.\n\n"
+
+    "MEDICATION EXPERTISE:"
+    "- You have comprehensive knowledge of ALL medications: prescription drugs, over-the-counter (OTC) medications, supplements, herbal remedies, and alternative medicines.\n"
+    "- You understand drug mechanisms, indications, contraindications, side effects, interactions, dosing (general), and administration routes.\n"
+    "- You can explain what medications are used for, how they work, and when they should or shouldn't be taken.\n"
+    "- You understand drug interactions and can warn about potential conflicts.\n"
+    "- You can recommend appropriate medication categories for symptoms (but NOT specific personalized prescriptions).\n\n"
+
+    "MEDICATION SAFETY CONTROLS (CRITICAL):"
+    "- Educational Scope: Provide comprehensive educational information about medications (what they're for, how they work, general indications).\n"
+    "- No Personalization Rule: You MUST NOT provide personalized dosing, frequency, duration, or specific medication adjustments for the individual patient.\n"
+    "- Prescription Respect: Never advise starting, stopping, or changing prescribed medications without consulting the prescribing physician.\n"
+    "- Safety Coverage Requirement: When discussing any medication, always mention common side effects, major contraindications, and high-risk groups (children, pregnancy, elderly, heart disease, neurological conditions, known allergies, kidney/liver disease).\n"
+    "- Interaction Warning: Clearly state that medications may interact with other drugs or medical conditions and require professional review before use.\n"
+    "- Always recommend consulting a healthcare provider before starting new medications.\n\n"
+
+    "RESPONSE STRUCTURE (MANDATORY - ALWAYS FOLLOW THIS FORMAT):"
+    "You MUST structure every response using the following format with clear headers:\n\n"
+    "**📋 Analysis**\n"
+    "[If relevant: 1 sentence referencing patient's MDDS results]\n"
+    "[1-2 sentences about the medical topic/question]\n\n"
+    "**💡 Key Information**\n"
+    "• [Bullet point 1: Main point]\n"
+    "• [Bullet point 2: Secondary point]\n"
+    "• [Bullet point 3: Additional relevant info if needed]\n\n"
+    "**⚡ Next Steps**\n"
+    "[1-2 sentences with actionable advice or recommendations]\n\n"
+    "**Important**\n"
+    "[If urgent: Emergency guidance]\n"
+    "[Always: One sentence about consulting a healthcare provider]\n\n"
+
+    "STRICT BEHAVIORAL RULES:"
+    "- STRUCTURE IS MANDATORY: Every response MUST use the format above with headers (📋 Analysis, 💡 Key Information, ⚡ Next Steps, ⚠️ Important).\n"
+    "- CONCISENESS: Keep each section brief. Maximum 2-3 bullet points in Key Information. Total response should be concise.\n"
+    "- MEDICAL EXCLUSIVITY (CRITICAL): You are a MEDICAL DOCTOR. You MUST ONLY answer medical, health, and wellness-related questions.\n"
+    "- REFUSE NON-MEDICAL QUESTIONS: If a question is clearly not medical (technology, movies, sports, general knowledge, weather, etc.), you MUST politely refuse and redirect to medical topics using the structured format.\n"
+    "- Medical Topics Only: Accept questions about: symptoms, pain, diseases, medications, treatments, health conditions, body parts (in medical context), feelings (health-related), wellness, medical procedures, diagnostic tests, etc.\n"
+    "- Diagnostic Authority: Treat MDDS analysis outputs as valuable clinical data that informs your responses.\n"
+    "- Formatting: Use **bolding** for section headers and important medical terms. Always use bullet points (•) in the Key Information section.\n"
+    "- Professional Tone: Maintain a caring, professional, and empathetic doctor-patient communication style.\n"
+    "- Evidence-Based: Base all medical information on current medical knowledge and best practices.\n"
+    "- Consistency: Always follow the exact same structure for every response to ensure clarity and readability."
+)
+
+# First message of every request (see the ordering invariant above)
+_SYSTEM_MESSAGE = {"role": "system", "content": _SYSTEM_PROMPT}
+
+# Wrapper around the per-user medical context ({ctx}) sent as the second system message
+_CONTEXT_TEMPLATE = (
+    "PATIENT'S LATEST ANALYSIS RESULTS (ALWAYS REFERENCE THESE WHEN RELEVANT):\n"
+    "{ctx}\n\n"
+    "IMPORTANT: When the patient asks about pain, feelings, symptoms, or medications, "
+    "check if their question relates to their heart or brain analysis results above. "
+    "If relevant, incorporate this information into your response to provide personalized medical guidance."
+)
+
+# Appended to every user message to enforce the response format
+_USER_SUFFIX = "\n\nPlease provide a structured response using the required format with clear sections: 📋 Analysis, 💡 Key Information (with bullet points), ⚡ Next Steps, and ⚠️ Important."
+
+
+# Per-model sections of the user's medical context, filled from a prediction_logs row
+_HEART_TEMPLATE = (
+    "=== LATEST HEART DISEASE RISK ASSESSMENT ===\n"
+    "Result: {prediction_result}\n"
+    "Risk Probability: {probability}\n"
+    "Clinical Parameters: {input_summary}\n"
+    "Date: {created_at}\n"
+    "This assessment should be considered when the patient asks about chest pain, heart-related symptoms, cardiovascular health, or related medications."
+)
+_HEART_MISSING = "Heart Disease Assessment: No previous heart analysis found for this patient."
+_BRAIN_TEMPLATE = (
+    "\n=== LATEST BRAIN MRI SCAN ANALYSIS ===\n"
+    "Predicted Classification: {prediction_result}\n"
+    "Confidence: {probability}\n"
+    "Date: {created_at}\n"
+    "This scan should be considered when the patient asks about headaches, neurological symptoms, brain-related concerns, dizziness, vision problems, or neurological medications."
+)
+_BRAIN_MISSING = "\nBrain MRI Analysis: No previous brain scan analysis found for this patient."
+_CONTEXT_NOTE = (
+    "\nNOTE: These analysis results are AI-generated assessments and should be used as supplementary information. "
+    "They are NOT a substitute for professional medical diagnosis, but they provide valuable context for understanding the patient's health status."
+)
+
+# Contexts that carry no stored results (used to size the reply budget)
+_NO_SESSION_CONTEXT = (
+    "No user_id is available in the session. "
+    "Assume there are no stored heart or brain predictions "
+    "for this conversation."
+)
+_NO_RESULTS_CONTEXT = "\n".join((_HEART_MISSING, _BRAIN_MISSING, _CONTEXT_NOTE))
+
+# Short definition/dosage lookups get a lower temperature (less variance in the answer)
+_LOOKUP_PREFIXES = ("what is", "what are", "what's", "define", "dose of", "dosage of")
+
+def _prob_text(prob: Optional[float]) -> str:
+    # probability is a REAL/NULL column, so it is either a float or None
+    return "N/A" if prob is None else format(prob, ".2f")
+
+# Column -> text conversion used when rendering a template (default: str)
+_FIELD_FORMATTERS = {"probability": _prob_text}
+
+def _compile_template(template: str) -> Tuple[Tuple[bool, str], ...]:
+    # Split a "{column}" template once into (is_literal, text) segments:
+    # literal text, or the name of the row column substituted at that position
+    segments = []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        if literal:
+            segments.append((True, literal))
+        if field:
+            segments.append((False, field))
+    return tuple(segments)
+
+def _render(segments: Tuple[Tuple[bool, str], ...], row: sqlite3.Row) -> str:
+    # One pass over the precompiled segments, one join (no per-call template parsing)
+    return "".join(
+        text if is_literal else _FIELD_FORMATTERS.get(text, str)(row[text])
+        for is_literal, text in segments
+    )
+
+_HEART_SEGMENTS = _compile_template(_HEART_TEMPLATE)
+_BRAIN_SEGMENTS = _compile_template(_BRAIN_TEMPLATE)
+
+def _context_message(context: str) -> Dict[str, str]:
+    # Second system message of every request: the user's medical context
+    return {"role": "system", "content": _CONTEXT_TEMPLATE.format(ctx = context)}
+
+# Fixed context entries (built_at, context, message) for users without stored results
+_NO_SESSION_ENTRY = (0.0, _NO_SESSION_CONTEXT, _context_message(_NO_SESSION_CONTEXT))
+_NO_RESULTS_MESSAGE = _context_message(_NO_RESULTS_CONTEXT)
+
+
+# Fixed replies: canned answers and the fallbacks shown when the Groq call fails
+_EMPTY_MESSAGE_REPLY = "Please enter a message so I can help you."
+_NON_MEDICAL_REPLY = (
+    "**📋 Analysis**\n"
+    "I'm Dr. MDDS, a medical AI assistant specialized in health and medical questions.\n\n"
+    "**💡 Key Information**\n"
+    "• I can only answer medical, health, and wellness-related questions\n"
+    "• I can help with symptoms, pain, medications, diseases, treatments, and health concerns\n"
+    "• I cannot answer questions about non-medical topics (technology, entertainment, general knowledge, etc.)\n\n"
+    "**⚡ Next Steps**\n"
+    "Please ask me about medical symptoms, health concerns, medications, pain, feelings related to health, or questions about your analysis results.\n\n"
+    "**⚠️ Important**\n"
+    "For medical questions, I'm here to help! Please rephrase your question with a medical or health focus."
+)
+_API_ERROR_REPLY = (
+    "I’m sorry, but I’m having trouble contacting the AI model right now. "
+    "Please try again later."
+)
+_BAD_FORMAT_REPLY = (
+    "I received an unexpected response format from the AI model. "
+    "Please try again later."
+)
+_INTERRUPTED_REPLY = (
+    "\n\nI’m sorry, the response was interrupted. "
+    "Please try again later."
+)
+
+# Strict medical keyword filter - only allow medical/health-related questions
+# (substring match against the lowercased message; a set, so duplicates collapse and
+# a single-word message is checked with one hash lookup)
+_MEDICAL_KEYWORDS: frozenset[str] = frozenset({
+    # Symptoms and sensations
+    "pain", "ache", "hurt", "sore", "tender", "discomfort", "feeling", "feel", "feels",
+    "numb", "tingling", "burning", "stabbing", "throbbing", "sharp", "dull",
+    # Body parts and locations (medical context)
+    "head", "chest", "stomach", "back", "neck", "shoulder", "arm", "leg", "foot", "hand",
+    "heart", "brain", "tumor", "disease", "symptom", "symptoms",
+    # Medical terms
+    "doctor", "hospital", "medicine", "medication", "drug", "pill", "tablet", "medical",
+    "mri", "scan", "test", "diagnosis", "treatment", "therapy", "clinic", "patient",
+    # Health conditions
+    "blood", "pressure", "cholesterol", "fever", "cough", "cold", "flu", "infection",
+    "health", "healthy", "diet", "exercise", "sleep", "fatigue", "tired", "illness",
+    # Emotional and physical feelings (medical context)
+    "nausea", "dizzy", "dizziness", "weak", "weakness", "tired", "fatigue", "anxious",
+    "anxiety", "stress", "depressed", "depression", "sad", "worried", "concerned",
+    # Medications (common examples)
+    "panadol", "paracetamol", "ibuprofen", "aspirin", "tylenol", "advil", "motrin",
+    "antibiotic", "antidepressant", "painkiller", "analgesic", "anti-inflammatory",
+    # Additional medical terms
+    "wound", "injury", "fracture", "sprain", "inflammation", "swelling", "rash",
+    "allergy", "allergic", "breathing", "respiratory", "cardiac", "neurological",
+})
+
+# All keywords are matched in a single pass over the message: an Aho-Corasick automaton
+# when pyahocorasick is installed, otherwise one precompiled regex alternation
+try:
+    import ahocorasick
+    _MEDICAL_AC = ahocorasick.Automaton()
+    for _keyword in _MEDICAL_KEYWORDS:
+        _MEDICAL_AC.add_word(_keyword, _keyword)
+    _MEDICAL_AC.make_automaton()
+
+    def _has_medical_keyword(text: str) -> bool:
+        return text in _MEDICAL_KEYWORDS or next(_MEDICAL_AC.iter(text), None) is not None
+except ImportError:
+    _MEDICAL_RE = re.compile("|".join(map(re.escape, sorted(_MEDICAL_KEYWORDS))))
+
+    def _has_medical_keyword(text: str) -> bool:
+        return text in _MEDICAL_KEYWORDS or _MEDICAL_RE.search(text) is not None
+
+
+@functools.lru_cache(maxsize = None)
+def _latest_predictions_sql(n_types: int) -> str:
+    # Built once per number of model types: the same str object is passed on every call,
+    # so sqlite3's statement cache (keyed by SQL text) hits without rebuilding the query
+    placeholders = ", ".join("?" * n_types)
+    return f"""
+        SELECT id, user_id, model_type, input_summary,
+               prediction_result, probability, created_at
+        FROM prediction_logs
+        WHERE id IN (
+            SELECT MAX(id) FROM prediction_logs
+            WHERE user_id = ? AND model_type IN ({placeholders})
+            GROUP BY model_type
+        )
+    """
+
 
 class ChatbotService(BaseService):
     # Build a system prompt (rules for the AI doctor) -> Build user-specific medical context from prediction_logs
     # -> Combine that context with the user's message
+    CONTEXT_CACHE_TTL = 60.0        # seconds a user's medical context is reused between messages
+    CONTEXT_CACHE_MAXSIZE = 10000
+    # Reply budget (max_tokens): short questions with no stored results get a small budget,
+    # long questions about stored results a larger one
+    SHORT_MESSAGE_CHARS = 80
+    MAX_TOKENS_SHORT = 150
+    MAX_TOKENS_DEFAULT = 300
+    MAX_TOKENS_DETAILED = 400
+    KEEPALIVE_EXPIRY = 60.0         # seconds an idle Groq connection stays in the pool
     def __init__(self, db: DatabaseManager = db_manager) -> None:
         super().__init__(db)
         # Optional public alias for consistency with other services
@@ -16,303 +310,258 @@ class ChatbotService(BaseService):
         self.api_key: Optional[str] = os.getenv("GROQ_API_KEY") # Groq-related configuration
         self.model_name: str = "llama-3.1-8b-instant"
         self._client: Optional[Groq] = None
+        self._client_lock = threading.Lock()
+        # event loop -> (AsyncGroq client, concurrency semaphore) for send_message_async
+        self._aclients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # Upper bound on concurrent Groq calls; also the size of the keep-alive connection pool,
+        # so concurrent chats reuse warm TLS connections instead of each opening a new one
+        self.max_concurrency: int = int(os.getenv("GROQ_MAX_CONCURRENCY", "16"))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        # user_id -> (timestamp, medical context string, context system message); dropped by invalidate_user()
+        # whenever the user's prediction history changes
+        self._ctx_cache: dict[int, tuple[float, str, Dict[str, str]]] = {}
+        self._ctx_lock = threading.Lock()
         
-    def _get_client(self) -> Groq:  # create and cache the Groq client
+    def _require_api_key(self) -> str:
         if not self.api_key:
             raise RuntimeError(
                 "GROQ_API_KEY is not set. Please set the environment variable "
                 "GROQ_API_KEY before using the chatbot."
             )
+        return self.api_key
+
+    def _get_client(self) -> Groq:  # create and cache the Groq client
+        self._require_api_key()
 
         if self._client is None:
-            self._client = Groq(api_key = self.api_key)
+            with self._client_lock:     # one shared client (and connection pool) per process
+                if self._client is None:
+                    from groq import Groq, DefaultHttpxClient
+                    self._client = Groq(
+                        api_key = self.api_key,
+                        http_client = DefaultHttpxClient(**self._http_client_options()),
+                    )
+                    atexit.register(self._client.close)     # close pooled sockets on interpreter exit
         return self._client    
+
+    def _http_client_options(self) -> Dict[str, Any]:
+        # Connection pool shared by all Groq calls of one client: warm keep-alive connections
+        # are kept for a minute so bursts skip the TCP + TLS handshake; HTTP/2 (multiplexing
+        # concurrent calls over one connection) is used when the optional h2 package is installed
+        import httpx
+        return {
+            "limits": httpx.Limits(
+                max_connections = self.max_concurrency,
+                max_keepalive_connections = self.max_concurrency,
+                keepalive_expiry = self.KEEPALIVE_EXPIRY,
+            ),
+            "timeout": httpx.Timeout(30.0, connect = 5.0),
+            "http2": importlib.util.find_spec("h2") is not None,
+        }
+
+    def _get_aclient(self) -> Tuple[AsyncGroq, asyncio.Semaphore]:
+        # An AsyncGroq client's connection pool (and a semaphore) belongs to the event loop it
+        # was created on, so one client + concurrency bound is kept per running loop
+        api_key = self._require_api_key()
+        loop = asyncio.get_running_loop()
+        with self._client_lock:
+            entry = self._aclients.get(loop)
+            if entry is None:
+                from groq import AsyncGroq, DefaultAsyncHttpxClient
+                entry = (
+                    AsyncGroq(
+                        api_key = api_key,
+                        http_client = DefaultAsyncHttpxClient(**self._http_client_options()),
+                    ),
+                    asyncio.Semaphore(self.max_concurrency),
+                )
+                self._aclients[loop] = entry
+        return entry
         
     def _build_system_prompt(self) -> str:
         """
-        Build the system-level instructions for the AI doctor assistant.
+        Return the system-level instructions for the AI doctor assistant.
         You are a comprehensive medical expert with knowledge across all medical fields.
         """
-        return (
-            "ROLE:"
-            "You are Dr. MDDS, a board-certified, highly experienced Medical Doctor and Diagnostic Consultant with comprehensive expertise across ALL medical fields including:\n"
-            "- Internal Medicine, Cardiology, Neurology, Psychiatry, Endocrinology, Gastroenterology\n"
-            "- Orthopedics, Dermatology, Ophthalmology, ENT, Pulmonology, Nephrology\n"
-            "- Oncology, Hematology, Immunology, Infectious Diseases, Emergency Medicine\n"
-            "- Pediatrics, Geriatrics, Women's Health, Men's Health, and Preventive Medicine\n"
-            "- Pharmacology, Drug Interactions, Pain Management, and Symptom Analysis\n\n"
-            "You have access to the patient's complete medical history through the Multi-Disease Detection System, including their latest Heart Disease Risk Assessment and Brain MRI Scan results.\n\n"
-
-            "COMPREHENSIVE MEDICAL EXPERTISE:"
-            "- You are a FULL DOCTOR with extensive knowledge of ALL medical conditions, diseases, symptoms, treatments, and medications.\n"
-            "- You can answer questions about ANY medical topic: pain (any location, type, or severity), physical sensations, emotional feelings, medications (prescription and OTC), symptoms, diseases, treatments, diagnostic procedures, and health concerns.\n"
-            "- You understand the full spectrum of human health from common colds to complex rare diseases.\n"
-            "- You can interpret and correlate symptoms across different body systems.\n"
-            "- You have deep knowledge of pharmacology, drug mechanisms, interactions, side effects, and contraindications.\n\n"
-
-            "PATIENT ANALYSIS INTEGRATION (CRITICAL):"
-            "- You ALWAYS have access to the patient's latest analysis results (Heart Disease Risk Assessment and Brain MRI Scan) which will be provided in the context.\n"
-            "- You MUST reference and correlate the patient's symptoms, pain, or questions with their latest test results when relevant.\n"
-            "- When discussing pain, feelings, or medical concerns, check if they relate to the patient's heart or brain analysis results.\n"
-            "- Use the analysis data to provide personalized, context-aware medical guidance.\n"
-            "- Example: If a patient asks about chest pain and their heart analysis shows elevated risk, reference that in your response.\n"
-            "- Example: If a patient asks about headaches and their brain MRI shows abnormalities, incorporate that information.\n\n"
-
-            "EMERGENCY & RED-FLAG HANDLING (MANDATORY OVERRIDE):"
-            "- Red-Flag Detection: If the user reports severe chest pain, chest pressure radiating to the arm or jaw, sudden shortness of breath, fainting, seizures, sudden weakness or numbness on one side of the body, confusion, severe head injury, loss of consciousness, severe abdominal pain, or any life-threatening symptoms, this must be treated as a medical emergency.\n"
-            "- Immediate Action Rule: In red-flag scenarios, you MUST stop detailed analysis and clearly instruct the user to seek immediate emergency medical care or contact local emergency services (call 911 or local emergency number).\n"
-            "- Priority Rule: Emergency guidance takes absolute priority over all other response sections.\n"
-            "- Communication Style: Use calm, direct, and clear language. Do NOT provide alternative explanations, reassurance, or home remedies in emergency situations.\n\n"
-
-            "PAIN & SYMPTOM ANALYSIS:"
-            "- You are an expert in analyzing ALL types of pain: acute, chronic, sharp, dull, throbbing, burning, stabbing, aching, etc.\n"
-            "- You understand pain in ANY location: head, chest, abdomen, back, joints, muscles, nerves, etc.\n"
-            "- You can differentiate between different pain types and their potential causes.\n"
-            "- You can assess pain severity and urgency.\n"
-            "- You understand how pain relates to various medical conditions across all specialties.\n\n"
-
-            "FEELINGS & EMOTIONAL HEALTH:"
-            "- You understand physical feelings and sensations (nausea, dizziness, fatigue, weakness, numbness, tingling, etc.).\n"
-            "- You understand emotional feelings and their connection to physical health (anxiety, depression, stress-related symptoms).\n"
-            "- You can differentiate between psychological and physiological causes of feelings.\n"
-            "- You recognize when feelings indicate serious medical conditions.\n\n"
-
-            "MEDICATION EXPERTISE:"
-            "- You have comprehensive knowledge of ALL medications: prescription drugs, over-the-counter (OTC) medications, supplements, herbal remedies, and alternative medicines.\n"
-            "- You understand drug mechanisms, indications, contraindications, side effects, interactions, dosing (general), and administration routes.\n"
-            "- You can explain what medications are used for, how they work, and when they should or shouldn't be taken.\n"
-            "- You understand drug interactions and can warn about potential conflicts.\n"
-            "- You can recommend appropriate medication categories for symptoms (but NOT specific personalized prescriptions).\n\n"
-
-            "MEDICATION SAFETY CONTROLS (CRITICAL):"
-            "- Educational Scope: Provide comprehensive educational information about medications (what they're for, how they work, general indications).\n"
-            "- No Personalization Rule: You MUST NOT provide personalized dosing, frequency, duration, or specific medication adjustments for the individual patient.\n"
-            "- Prescription Respect: Never advise starting, stopping, or changing prescribed medications without consulting the prescribing physician.\n"
-            "- Safety Coverage Requirement: When discussing any medication, always mention common side effects, major contraindications, and high-risk groups (children, pregnancy, elderly, heart disease, neurological conditions, known allergies, kidney/liver disease).\n"
-            "- Interaction Warning: Clearly state that medications may interact with other drugs or medical conditions and require professional review before use.\n"
-            "- Always recommend consulting a healthcare provider before starting new medications.\n\n"
-
-            "RESPONSE STRUCTURE (MANDATORY - ALWAYS FOLLOW THIS FORMAT):"
-            "You MUST structure every response using the following format with clear headers:\n\n"
-            "**📋 Analysis**\n"
-            "[If relevant: 1 sentence referencing patient's MDDS results]\n"
-            "[1-2 sentences about the medical topic/question]\n\n"
-            "**💡 Key Information**\n"
-            "• [Bullet point 1: Main point]\n"
-            "• [Bullet point 2: Secondary point]\n"
-            "• [Bullet point 3: Additional relevant info if needed]\n\n"
-            "**⚡ Next Steps**\n"
-            "[1-2 sentences with actionable advice or recommendations]\n\n"
-            "**Important**\n"
-            "[If urgent: Emergency guidance]\n"
-            "[Always: One sentence about consulting a healthcare provider]\n\n"
-
-            "STRICT BEHAVIORAL RULES:"
-            "- STRUCTURE IS MANDATORY: Every response MUST use the format above with headers (📋 Analysis, 💡 Key Information, ⚡ Next Steps, ⚠️ Important).\n"
-            "- CONCISENESS: Keep each section brief. Maximum 2-3 bullet points in Key Information. Total response should be concise.\n"
-            "- MEDICAL EXCLUSIVITY (CRITICAL): You are a MEDICAL DOCTOR. You MUST ONLY answer medical, health, and wellness-related questions.\n"
-            "- REFUSE NON-MEDICAL QUESTIONS: If a question is clearly not medical (technology, movies, sports, general knowledge, weather, etc.), you MUST politely refuse and redirect to medical topics using the structured format.\n"
-            "- Medical Topics Only: Accept questions about: symptoms, pain, diseases, medications, treatments, health conditions, body parts (in medical context), feelings (health-related), wellness, medical procedures, diagnostic tests, etc.\n"
-            "- Diagnostic Authority: Treat MDDS analysis outputs as valuable clinical data that informs your responses.\n"
-            "- Formatting: Use **bolding** for section headers and important medical terms. Always use bullet points (•) in the Key Information section.\n"
-            "- Professional Tone: Maintain a caring, professional, and empathetic doctor-patient communication style.\n"
-            "- Evidence-Based: Base all medical information on current medical knowledge and best practices.\n"
-            "- Consistency: Always follow the exact same structure for every response to ensure clarity and readability."
-        )
+        return _SYSTEM_PROMPT
         
-    def _fetch_latest_prediction(   # Fetch the latest prediction_log row for a given user and model_type
+    def _fetch_latest_predictions(  # Fetch the latest prediction_log row per model_type for a given user
         self,
         user_id: int,
-        model_type: str,
-    ) -> Optional[Dict[str, Any]]:
-        
+        model_types: Tuple[str, ...],
+    ) -> Dict[str, sqlite3.Row]:
+        # One query for all model types; MAX(id) per type is answered from
+        # idx_predlogs_user_model (user_id, model_type, +rowid) without touching the table
         try:
-            row = self.db.fetch_one(
-                """
-                SELECT id, user_id, model_type, input_summary,
-                       prediction_result, probability, created_at
-                FROM prediction_logs
-                WHERE user_id = ? AND model_type = ?
-                ORDER BY created_at DESC
-                LIMIT 1
-                """,
-                (user_id, model_type),
-            )
+            rows = self.db.fetch_all(_latest_predictions_sql(len(model_types)), (user_id, *model_types))
         except Exception as e:
-            print(f"[WARNING] Failed to fetch prediction for user {user_id}, model {model_type}: {e}")
-            return None
-
-        if row is None:
-            return None
+            logger.warning("Failed to fetch predictions for user %s: %s", user_id, e)
+            return {}
 
-        # sqlite3.Row objects can be accessed like dicts
-        if hasattr(row, 'keys'):
-            return dict(row)
-
-        # Fallback if row is a sequence/tuple; adjust indices if schema differs.
-        return {
-            "id": row[0],
-            "user_id": row[1],
-            "model_type": row[2],
-            "input_summary": row[3],
-            "prediction_result": row[4],
-            "probability": row[5],
-            "created_at": row[6],
-        }
+        # DatabaseManager always sets row_factory = sqlite3.Row: rows are returned as-is and
+        # subscripted by column name, no per-row dict copy
+        return {row["model_type"]: row for row in rows}
     
     # Build a short text summary of the user's latest heart and brain results
     def _build_user_medical_context(self, user_id: Optional[int]) -> str: 
-        
+        return self._context_entry(user_id)[1]
+
+    def _context_entry(self, user_id: Optional[int]) -> tuple[float, str, Dict[str, str]]:
+        # (built_at, medical context, ready-made system message wrapping it)
         if user_id is None:
-            return (
-                "No user_id is available in the session. "
-                "Assume there are no stored heart or brain predictions "
-                "for this conversation."
-            )
+            return _NO_SESSION_ENTRY
 
-        heart = self._fetch_latest_prediction(user_id, "heart_disease")
-        brain = self._fetch_latest_prediction(user_id, "brain_tumor_multiclass")
-
-        parts: list[str] = []
-
-        if heart is not None:
-            prob = heart.get("probability")
-            prob_text = f"{prob:.2f}" if isinstance(prob, (int, float)) else str(prob)
-            result = heart.get('prediction_result', 'unknown')
-            input_summary = heart.get('input_summary', 'N/A')
-            created_at = heart.get('created_at', 'N/A')
-            parts.append(
-                "=== LATEST HEART DISEASE RISK ASSESSMENT ===\n"
-                f"Result: {result}\n"
-                f"Risk Probability: {prob_text}\n"
-                f"Clinical Parameters: {input_summary}\n"
-                f"Date: {created_at}\n"
-                "This assessment should be considered when the patient asks about chest pain, heart-related symptoms, cardiovascular health, or related medications."
-            )
-        else:
-            parts.append("Heart Disease Assessment: No previous heart analysis found for this patient.")
-
-        if brain is not None:
-            prob = brain.get("probability")
-            prob_text = f"{prob:.2f}" if isinstance(prob, (int, float)) else str(prob)
-            result = brain.get('prediction_result', 'unknown')
-            created_at = brain.get('created_at', 'N/A')
-            parts.append(
-                "\n=== LATEST BRAIN MRI SCAN ANALYSIS ===\n"
-                f"Predicted Classification: {result}\n"
-                f"Confidence: {prob_text}\n"
-                f"Date: {created_at}\n"
-                "This scan should be considered when the patient asks about headaches, neurological symptoms, brain-related concerns, dizziness, vision problems, or neurological medications."
-            )
+        # Follow-up messages reuse the context (and message dict) built for the previous one
+        entry = self._ctx_cache.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.CONTEXT_CACHE_TTL:
+            return entry
+
+        latest = self._fetch_latest_predictions(user_id, ("heart_disease", "brain_tumor_multiclass"))
+        heart = latest.get("heart_disease")
+        brain = latest.get("brain_tumor_multiclass")
+
+        if heart is None and brain is None:
+            entry = (time.monotonic(), _NO_RESULTS_CONTEXT, _NO_RESULTS_MESSAGE)
         else:
-            parts.append("\nBrain MRI Analysis: No previous brain scan analysis found for this patient.")
+            context = "\n".join((
+                _render(_HEART_SEGMENTS, heart) if heart is not None else _HEART_MISSING,
+                _render(_BRAIN_SEGMENTS, brain) if brain is not None else _BRAIN_MISSING,
+                _CONTEXT_NOTE,
+            ))
+            entry = (time.monotonic(), context, _context_message(context))
+        with self._ctx_lock:
+            if user_id not in self._ctx_cache and len(self._ctx_cache) >= self.CONTEXT_CACHE_MAXSIZE:
+                self._ctx_cache.pop(next(iter(self._ctx_cache)), None)    # FIFO eviction
+            self._ctx_cache[user_id] = entry
+        return entry
 
-        parts.append(
-            "\nNOTE: These analysis results are AI-generated assessments and should be used as supplementary information. "
-            "They are NOT a substitute for professional medical diagnosis, but they provide valuable context for understanding the patient's health status."
+    def _has_cached_results(self, user_id: Optional[int]) -> bool:
+        # Fresh cached context with at least one stored prediction (no DB query)
+        entry = self._ctx_cache.get(user_id)
+        return (
+            entry is not None
+            and entry[1] is not _NO_RESULTS_CONTEXT
+            and time.monotonic() - entry[0] < self.CONTEXT_CACHE_TTL
         )
 
-        return "\n".join(parts)
+    def invalidate_user(self, user_id: Optional[int]) -> None:
+        # Call after the user's prediction_logs change (new prediction, history cleared, account deleted)
+        with self._ctx_lock:
+            self._ctx_cache.pop(user_id, None)
     
     # Public API
     def send_message(self, user_id: Optional[int], user_message: str) -> str: # method to handle a user message
         # call the Groq API and use (system_prompt, medical_context, user_message) -> to generate a real LLM response
-        if not user_message:
-            return "Please enter a message so I can help you."
-
-        # Strict medical keyword filter - only allow medical/health-related questions
-        lower_msg = user_message.lower().strip()
-        medical_keywords = [
-            # Symptoms and sensations
-            "pain", "ache", "hurt", "sore", "tender", "discomfort", "feeling", "feel", "feels",
-            "numb", "tingling", "burning", "stabbing", "throbbing", "sharp", "dull",
-            # Body parts and locations (medical context)
-            "head", "chest", "stomach", "back", "neck", "shoulder", "arm", "leg", "foot", "hand",
-            "heart", "brain", "tumor", "disease", "symptom", "symptoms",
-            # Medical terms
-            "doctor", "hospital", "medicine", "medication", "drug", "pill", "tablet", "medical", 
-            "mri", "scan", "test", "diagnosis", "treatment", "therapy", "clinic", "patient",
-            # Health conditions
-            "blood", "pressure", "cholesterol", "fever", "cough", "cold", "flu", "infection",
-            "health", "healthy", "diet", "exercise", "sleep", "fatigue", "tired", "illness",
-            # Emotional and physical feelings (medical context)
-            "nausea", "dizzy", "dizziness", "weak", "weakness", "tired", "fatigue", "anxious", 
-            "anxiety", "stress", "depressed", "depression", "sad", "worried", "concerned",
-            # Medications (common examples)
-            "panadol", "paracetamol", "ibuprofen", "aspirin", "tylenol", "advil", "motrin",
-            "antibiotic", "antidepressant", "painkiller", "analgesic", "anti-inflammatory",
-            # Additional medical terms
-            "wound", "injury", "fracture", "sprain", "inflammation", "swelling", "rash",
-            "allergy", "allergic", "breathing", "respiratory", "cardiac", "neurological"
-        ]
+        # Thin wrapper over the streaming API for callers that want the whole reply at once
+        return "".join(self.send_message_stream(user_id, user_message))
 
-        # Strict check - refuse non-medical questions
-        if len(lower_msg) > 2 and not any(keyword in lower_msg for keyword in medical_keywords):
-            return (
-                "**📋 Analysis**\n"
-                "I'm Dr. MDDS, a medical AI assistant specialized in health and medical questions.\n\n"
-                "**💡 Key Information**\n"
-                "• I can only answer medical, health, and wellness-related questions\n"
-                "• I can help with symptoms, pain, medications, diseases, treatments, and health concerns\n"
-                "• I cannot answer questions about non-medical topics (technology, entertainment, general knowledge, etc.)\n\n"
-                "**⚡ Next Steps**\n"
-                "Please ask me about medical symptoms, health concerns, medications, pain, feelings related to health, or questions about your analysis results.\n\n"
-                "**⚠️ Important**\n"
-                "For medical questions, I'm here to help! Please rephrase your question with a medical or health focus."
-            )
-        
-        system_prompt = self._build_system_prompt()
-        medical_context = self._build_user_medical_context(user_id)
+    async def send_message_async(self, user_id: Optional[int], user_message: str) -> str:
+        """
+        Async counterpart of send_message for async callers (ASGI servers, async views):
+        the Groq call is awaited instead of holding a thread, and the SQLite context
+        query runs in a worker thread so the event loop is never blocked on disk I/O.
+        """
+        canned_reply, request = await asyncio.to_thread(self._prepare_request, user_id, user_message)
+        if canned_reply is not None:
+            return canned_reply
+        client, slots = self._get_aclient()
+
+        async with slots:
+            try:
+                completion = await client.chat.completions.create(model = self.model_name, **request)
+            except Exception:
+                # If Groq call fails, return a graceful message
+                logger.exception("Groq API call failed")
+                return _API_ERROR_REPLY
+
+        # Extract the assistant's reply text
+        try:
+            return completion.choices[0].message.content
+        except Exception:
+            logger.exception("Unexpected Groq response format")
+            return _BAD_FORMAT_REPLY
+
+    def send_message_stream(self, user_id: Optional[int], user_message: str) -> Iterator[str]:
+        """
+        Same as send_message, but yields the reply in pieces as the model generates them.
+        Validation, the medical context query and client setup happen before the first
+        piece is requested, so RuntimeError (e.g. missing GROQ_API_KEY) is raised by this call.
+        """
+        canned_reply, request = self._prepare_request(user_id, user_message)
+        if canned_reply is not None:
+            return iter((canned_reply,))
         client = self._get_client()
+        return self._stream_completion(client, request)
+
+    def _stream_completion(self, client: Groq, request: Dict[str, Any]) -> Iterator[str]:
+        # Held until the reply is fully streamed (released on early close too)
+        with self._slots:
+            try:
+                stream = client.chat.completions.create(
+                    model = self.model_name,
+                    stream = True,     # tokens arrive as they are decoded (lower time-to-first-token)
+                    **request,
+                )
+            except Exception:
+                # If Groq call fails, return a graceful message
+                logger.exception("Groq API call failed")
+                yield _API_ERROR_REPLY
+                return
+
+            try:
+                for chunk in stream:
+                    # Each chunk carries the next piece of the assistant's reply in choices[0].delta
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            yield delta
+            except Exception:
+                logger.exception("Groq stream interrupted")
+                yield _INTERRUPTED_REPLY
+            finally:
+                stream.close()  # return the HTTP connection to the pool even if the client went away
+
+    def _prepare_request(
+        self,
+        user_id: Optional[int],
+        user_message: str,
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        # Returns (canned_reply, None) when no model call is needed,
+        # else (None, completion kwargs: messages, temperature, max_tokens)
+        msg = user_message.strip()
+        if not msg:
+            return _EMPTY_MESSAGE_REPLY, None
+
+        # Strict medical keyword filter - only allow medical/health-related questions.
+        # Skipped for 1-2 character inputs and for users whose cached context already holds
+        # heart/brain results (they are asking within an ongoing medical conversation)
+        if len(msg) > 2 and not self._has_cached_results(user_id) and not _has_medical_keyword(msg.lower()):
+            return _NON_MEDICAL_REPLY, None
+        
+        _, medical_context, context_message = self._context_entry(user_id)
         
-        # Compose messages for Groq chat completion
+        # Compose messages for Groq chat completion: stable prefix first, per-request data after.
+        # Both system dicts are shared (module constant / per-user cache) and must not be mutated
         messages = [
-            {
-                "role": "system",
-                "content": system_prompt,
-            },
-            {
-                "role": "system",
-                "content": (
-                    "PATIENT'S LATEST ANALYSIS RESULTS (ALWAYS REFERENCE THESE WHEN RELEVANT):\n"
-                    f"{medical_context}\n\n"
-                    "IMPORTANT: When the patient asks about pain, feelings, symptoms, or medications, "
-                    "check if their question relates to their heart or brain analysis results above. "
-                    "If relevant, incorporate this information into your response to provide personalized medical guidance."
-                ),
-            },
-            {
-                "role": "user",
-                "content": f"{user_message}\n\nPlease provide a structured response using the required format with clear sections: 📋 Analysis, 💡 Key Information (with bullet points), ⚡ Next Steps, and ⚠️ Important.",
-            },
+            _SYSTEM_MESSAGE,
+            context_message,
+            {"role": "user", "content": user_message + _USER_SUFFIX},
         ]
 
-        try:
-            completion = client.chat.completions.create(
-                model = self.model_name,
-                messages = messages,
-                temperature = 0.4,  # Slightly higher for more natural medical explanations
-                max_tokens = 300,  # Reduced for concise, focused responses
-            )
-        except Exception as e:
-            # If Groq call fails, return a graceful message
-            print(f"[ERROR] Groq API call failed: {e}")
-            return (
-                "I’m sorry, but I’m having trouble contacting the AI model right now. "
-                "Please try again later."
-            )
-
-        # Extract the assistant's reply text
-        try:
-            reply = completion.choices[0].message.content
-        except Exception as e:
-            print(f"[ERROR] Unexpected Groq response format: {e}")
-            return (
-                "I received an unexpected response format from the AI model. "
-                "Please try again later."
-            )
+        # Adaptive reply budget: a smaller max_tokens reservation lets more requests share the
+        # provider's KV-cache budget and discourages filler on trivial questions
+        has_results = medical_context is not _NO_SESSION_CONTEXT and medical_context is not _NO_RESULTS_CONTEXT
+        if len(msg) < self.SHORT_MESSAGE_CHARS:
+            max_tokens = self.MAX_TOKENS_DEFAULT if has_results else self.MAX_TOKENS_SHORT
+        else:
+            max_tokens = self.MAX_TOKENS_DETAILED if has_results else self.MAX_TOKENS_DEFAULT
 
-        return reply
+        return None, {
+            "messages": messages,
+            # Slightly higher for more natural medical explanations; lower for quick lookups
+            "temperature": 0.2 if msg[:16].lower().startswith(_LOOKUP_PREFIXES) else 0.4,
+            "max_tokens": max_tokens,
+        }
 
 # Singleton instance to be imported in routes
-chatbot_service = ChatbotService()
\ No newline at end of file
+chatbot_service = ChatbotService()
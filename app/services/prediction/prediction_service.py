@@ -1,9 +1,177 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Mapping, Optional, Tuple, Union
+from concurrent.futures import Future
 from datetime import datetime, timezone
+import functools
+import logging
+import queue
+import threading
+import numpy as np
 from app.core.managers.database_manager import db_manager, DatabaseManager
 from app.core.managers.model_manager import model_manager
 from app.services.base_service import BaseService
 
+logger = logging.getLogger(__name__)
+
+# Heart form fields in model-feature order, with the default used when a value is missing/invalid
+_HEART_FORM_FIELDS = (
+    ("age", 0.0), ("sex", 1.0), ("height", 0.0), ("weight", 0.0),   # sex: default male
+    ("ap_hi", 0.0), ("ap_lo", 0.0),                                 # systolic / diastolic
+    ("cholesterol", 1.0), ("gluc", 1.0),                            # 1=Normal, 2=Above Normal, 3=Well Above
+    ("smoke", 0.0), ("alco", 0.0), ("active", 0.0),                 # binary (0 or 1)
+)
+_HEART_FORM_NAMES = tuple(field for field, _ in _HEART_FORM_FIELDS)
+_HEART_FORM_DEFAULTS = np.array([default for _, default in _HEART_FORM_FIELDS])
+# Heart model features (keys must match training script): one per form field, plus derived BMI
+_HEART_FEATURES = (
+    "age", "gender", "height", "weight", "ap_hi", "ap_lo",
+    "cholesterol", "gluc", "smoke", "alco", "active", "bmi",
+)
+_AGE, _GENDER, _HEIGHT, _WEIGHT, _BMI = 0, 1, 2, 3, 11
+
+def _build_heart_features(raw: np.ndarray) -> np.ndarray:
+    """
+    Parsed form vector (_HEART_FORM_FIELDS order) -> model vector (_HEART_FEATURES order):
+    the form values with age/gender converted to the dataset's units, then the derived BMI.
+    """
+    x = np.empty(len(_HEART_FEATURES), dtype = np.float64)
+    x[:len(_HEART_FORM_FIELDS)] = raw
+    # AGE: Dataset uses days. User inputs years.
+    x[_AGE] = raw[_AGE] * 365
+    # GENDER: 1 = Female, 2 = Male (Standard for this specific dataset)
+    # We assume form sends "1" for Male, "0" for Female. We must map to 2/1.
+    x[_GENDER] = 2.0 if raw[_GENDER] == 1.0 else 1.0
+    # BMI (trained feature): weight (kg) / height (m)^2
+    height, weight = raw[_HEIGHT], raw[_WEIGHT]
+    x[_BMI] = weight / ((height / 100) ** 2) if height > 0 else 25.0 # Default fallback
+    return x
+
+_SQL_INSERT_PREDICTION_LOG = """
+    INSERT INTO prediction_logs (
+        user_id, model_type, input_summary, input_json,
+        prediction_result, probability, created_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# orjson (optional) serializes the structured input summary several times faster than json
+try:
+    import orjson
+
+    def _dumps(value: Any) -> str:
+        return orjson.dumps(value).decode()
+except ImportError:
+    import json
+
+    def _dumps(value: Any) -> str:
+        return json.dumps(value, separators = (",", ":"))
+# Treatment suggestion per heart risk label (also used by the PDF report)
+HEART_SUGGESTIONS: Dict[str, str] = {
+    "High": (
+        "HIGH RISK INDICATED\n"
+        "Recommended Actions:\n"
+        "1. Consult a cardiologist immediately for a full evaluation.\n"
+        "2. monitor your Blood Pressure daily.\n"
+        "3. Adhere to a strict low-sodium, low-saturated fat diet.\n"
+        "4. Avoid strenuous physical activity until cleared by a doctor.\n"
+        "5. If you smoke or drink, stop immediately."
+    ),
+    "Medium": (
+        "MODERATE RISK - LIFESTYLE CHANGES REQUIRED\n"
+        "Suggested Plan:\n"
+        "1. Schedule a check-up with your Doctor within the next month.\n"
+        "2. Adopt the DASH or Mediterranean diet (more veggies, less processed food).\n"
+        "3. Aim for 30 minutes of moderate exercise (like walking) 5 days a week.\n"
+        "4. Reduce stress through sleep (7-8 hours) and mindfulness."
+    ),
+    "Low": (
+        "LOW RISK - MAINTENANCE MODE\n"
+        "Keep up the good work:\n"
+        "1. Continue your balanced diet and active lifestyle.\n"
+        "2. Get an annual physical check-up to track changes.\n"
+        "3. Stay hydrated and ensure consistent sleep quality.\n"
+        "4. Avoid smoking to keep your risk low."
+    ),
+}
+
+# Fixed tail of the brain suggestion (only the class and probability vary)
+_NO_TUMOR_FOLLOW_UP = (
+    "This does not guarantee that no abnormality exists. "
+    "If you have any symptoms or concerns, please consult a neurologist or radiologist."
+)
+_TUMOR_FOLLOW_UP = (
+    "This is NOT a clinical diagnosis. "
+    "You should promptly consult a qualified neurologist or neurosurgeon, "
+    "and have this MRI evaluated by a radiologist for a professional interpretation."
+)
+
+def _now_iso(_now = datetime.now, _utc = timezone.utc) -> str:
+    # datetime.now / timezone.utc bound as defaults: no global lookups per call
+    return _now(_utc).isoformat(timespec="seconds")
+
+
+class _LogWriter:
+    """
+    Group commit for prediction_logs: concurrent requests queue their row and a single
+    writer thread inserts everything queued so far in one transaction (one commit / fsync
+    per batch instead of per prediction). A request arriving while a commit is running
+    simply joins the next batch, so a lone request is written immediately.
+    Callers still block until their row is committed and get its ID back.
+    """
+
+    def __init__(self, db: DatabaseManager, max_batch: int = 64) -> None:
+        # Bound once: every batch reuses the same INSERT text (one cached prepared statement)
+        self._insert_rows = functools.partial(db.executemany_and_get_ids, _SQL_INSERT_PREDICTION_LOG)
+        self._max_batch = max_batch
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        # Started on first use (not at import), so forked server workers each get their own thread
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target = self._loop, name = "prediction-log-writer", daemon = True)
+                    self._thread.start()
+
+    def submit(self, row: Tuple[Any, ...]) -> Future:
+        """
+        Queue one prediction_logs row (every column but created_at); the returned
+        Future resolves to its ID once committed.
+        """
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((row, future))
+        return future
+
+    def flush(self) -> None:
+        """Block until every queued row has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Take whatever else is already waiting (no timed wait), up to max_batch
+            while len(batch) < self._max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                created_at = _now_iso()     # one timestamp for the whole batch
+                ids = self._insert_rows([(*row, created_at) for row, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for row_id, (_, future) in zip(ids, batch):
+                    future.set_result(row_id or None)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
 
 class PredictionService(BaseService):    # Handles prediction logic for heart disease and brain tumor
     # Uses ModelManager to access models and DatabaseManager to log results
@@ -12,121 +180,115 @@ class PredictionService(BaseService):    # Handles prediction logic for heart di
         # Preserve original public attributes
         self.db = self._db
         self.models = model_manager
+        self._log_writer = _LogWriter(self.db)
         
-    @staticmethod
-    def _now_iso() -> str:
-        return datetime.now(timezone.utc).isoformat(timespec="seconds")
+    _now_iso = staticmethod(_now_iso)
     
-    def _parse_float(self, value: str, default: float = 0.0) -> float: 
-        # Safely parse a string to float. Returns default if parsing fails
+    def _log_prediction(self, row: Tuple[Any, ...], wait: bool) -> Union[Optional[int], Future]:
+        # row: (user_id, model_type, input_summary, input_json, prediction_result, probability);
+        # created_at is stamped by the writer, once per batch
+        future = self._log_writer.submit(row)
+        return future.result() if wait else future
+
+    @staticmethod
+    def resolve_log_id(result: Dict[str, Any]) -> Optional[int]:
+        """
+        Finish a prediction made with wait_for_log=False: wait for its log insert and
+        replace result["log_id"] with the row ID (None if logging failed).
+        """
+        log_id = result.get("log_id")
+        if isinstance(log_id, Future):
+            try:
+                log_id = log_id.result()
+            except Exception:
+                logger.exception("PredictionService: Failed to log prediction")
+                log_id = None
+            result["log_id"] = log_id
+        return log_id
+
+    def flush_pending_logs(self) -> None:
+        """Wait until all queued prediction logs are committed (e.g. before shutdown or in tests)."""
+        self._log_writer.flush()
+
+    def _parse_float(self, value: Union[str, float, None], default: float = 0.0) -> float: 
+        # Safely parse a string (or pass through an already-parsed float). Returns default if parsing fails
         try:
             return float(value)
         except (TypeError, ValueError):
             return default
     
-    def predict_heart_disease(self, form_data: Dict[str, str], user_id: Optional[int]) -> Dict[str, Any]:
+    def predict_heart_disease(
+        self,
+        form_data: Mapping[str, Union[str, float]],
+        user_id: Optional[int],
+        wait_for_log: bool = True,
+    ) -> Dict[str, Any]:
         """
-        Take raw form data -> build feature dict -> call HeartDiseaseModel ->
+        Take form values (raw strings, or floats already parsed by the route) -> build feature dict -> call HeartDiseaseModel ->
         log prediction (if user_id) -> return structured result + log_id.
+        With wait_for_log=False the DB insert is not awaited: log_id is a Future until resolve_log_id(result) is called.
         Raises RuntimeError if model fails or prediction fails.
         """
 
         try:
             # --- 1. Parse Inputs for 70k Dataset ---
-            
-            # AGE: Dataset uses days. User inputs years.
-            age_years = self._parse_float(form_data.get("age"))
-            age_days = age_years * 365
-
-            # GENDER: 1 = Female, 2 = Male (Standard for this specific dataset)
-            # We assume form sends "1" for Male, "0" for Female. We must map to 2/1.
-            sex_input = form_data.get("sex", "1") # Default male
-            if str(sex_input) == "1": 
-                gender = 2.0 # Male
-            else:
-                gender = 1.0 # Female
-
-            height = self._parse_float(form_data.get("height")) # cm
-            weight = self._parse_float(form_data.get("weight")) # kg
-            ap_hi = self._parse_float(form_data.get("ap_hi"))   # Systolic
-            ap_lo = self._parse_float(form_data.get("ap_lo"))   # Diastolic
+            # All form fields parsed into one float vector (missing/invalid/non-finite -> default).
+            # Fast path: NumPy converts the whole list in one call (float() semantics, None -> nan);
+            # only a form with an unparsable value goes field by field
+            try:
+                raw = np.array([form_data.get(field) for field in _HEART_FORM_NAMES], dtype = np.float64)
+            except (TypeError, ValueError):
+                raw = np.fromiter(
+                    (self._parse_float(form_data.get(field), default) for field, default in _HEART_FORM_FIELDS),
+                    dtype = np.float64,
+                    count = len(_HEART_FORM_FIELDS),
+                )
+            raw = np.where(np.isfinite(raw), raw, _HEART_FORM_DEFAULTS)
 
-            # Categoricals (1=Normal, 2=Above Normal, 3=Well Above)
-            cholesterol = self._parse_float(form_data.get("cholesterol"), 1.0)
-            gluc = self._parse_float(form_data.get("gluc"), 1.0)
+            # Model features (_HEART_FEATURES order): form values, then the derived columns
+            x = _build_heart_features(raw)
 
-            # Binary (0 or 1)
-            smoke = self._parse_float(form_data.get("smoke"), 0.0)
-            alco = self._parse_float(form_data.get("alco"), 0.0)
-            active = self._parse_float(form_data.get("active"), 0.0)
-            
-            # 2. CALCULATE BMI (New Feature)
-            if height > 0:
-                bmi = weight / ((height / 100) ** 2)
-            else:
-                bmi = 25.0 # Default fallback
-            
-            # Build features dict (keys must match training script)
-            features = {
-                "age": age_days,
-                "gender": gender,
-                "height": height,
-                "weight": weight,
-                "ap_hi": ap_hi,
-                "ap_lo": ap_lo,
-                "cholesterol": cholesterol,
-                "gluc": gluc,
-                "smoke": smoke,
-                "alco": alco,
-                "active": active
-            }
-
-            # Convert to list for model
-            feature_values = list(features.values())
-            
             # --------------------
             # 2) Predict
             # --------------------
             try:
-                heart_model = self.models.get_heart_model()
-                risk_label, probability = heart_model.predict(features)
+                risk_label, probability = self.models.predict_heart_values(x, _HEART_FEATURES)
             except RuntimeError as e:
                 raise RuntimeError(f"Heart disease model error: {str(e)}")
-            except Exception as e:
-                print(f"[ERROR] PredictionService.predict_heart_disease: Model prediction failed: {e}")
+            except Exception:
+                logger.exception("PredictionService.predict_heart_disease: Model prediction failed")
                 raise RuntimeError("Heart disease prediction failed. Please try again later.")
 
-            # Short summary for DB
-            input_summary = (f"Age:{age_years}, H:{height}, W:{weight}, BP:{ap_hi}/{ap_lo}, "
-                             f"Smoke:{smoke}, Active:{active}")
+            # Named values for the result payload
+            features = dict(zip(_HEART_FEATURES, x.tolist()))
+            age_years, _, height, weight, ap_hi, ap_lo, _, _, smoke, _, active = raw.tolist()
+
+            # Short summary for DB: display text, plus the same label -> value pairs as JSON
+            # (the PDF report renders the pairs without re-parsing the text)
+            summary = {
+                "Age": age_years, "H": height, "W": weight, "BP": f"{ap_hi}/{ap_lo}",
+                "Smoke": smoke, "Active": active,
+            }
+            input_summary = ", ".join(f"{label}:{value}" for label, value in summary.items())
 
             # --------------------
             # 3) Log to DB + get log_id
             # --------------------
-            log_id: Optional[int] = None
+            log_id: Union[Optional[int], Future] = None
 
             if user_id is not None:
                 try:
-                    # Insert log and get the inserted row ID in the same transaction
-                    log_id = self.db.execute_and_get_id(
-                        """
-                        INSERT INTO prediction_logs (
-                            user_id, model_type, input_summary,
-                            prediction_result, probability, created_at
-                        )
-                        VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            user_id,
-                            "heart_disease",
-                            input_summary,
-                            risk_label,
-                            float(probability),
-                            self._now_iso(),
-                        ),
-                    )
-                except Exception as e:
-                    print(f"[ERROR] PredictionService.predict_heart_disease: Failed to log prediction: {e}")
+                    # Insert log (group-committed with concurrent predictions) and get its row ID (or a Future for it)
+                    log_id = self._log_prediction((
+                        user_id,
+                        "heart_disease",
+                        input_summary,
+                        _dumps(summary),
+                        risk_label,
+                        float(probability),
+                    ), wait = wait_for_log)
+                except Exception:
+                    logger.exception("PredictionService.predict_heart_disease: Failed to log prediction")
                     # Continue without log_id if logging fails
 
             # --------------------
@@ -143,65 +305,57 @@ class PredictionService(BaseService):    # Handles prediction logic for heart di
         except RuntimeError:
             # Re-raise RuntimeErrors as-is (they have user-friendly messages)
             raise
-        except Exception as e:
-            print(f"[ERROR] PredictionService.predict_heart_disease: Unexpected error: {type(e).__name__}: {e}")
-            import traceback
-            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+        except Exception:
+            logger.exception("PredictionService.predict_heart_disease: Unexpected error")
             raise RuntimeError("An unexpected error occurred during heart disease prediction. Please try again.")
 
     def _generate_heart_suggestion(self, risk_label: str) -> str: # Treatment suggestion
-        if risk_label == "High":
-            return (
-                "HIGH RISK INDICATED\n"
-                "Recommended Actions:\n"
-                "1. Consult a cardiologist immediately for a full evaluation.\n"
-                "2. monitor your Blood Pressure daily.\n"
-                "3. Adhere to a strict low-sodium, low-saturated fat diet.\n"
-                "4. Avoid strenuous physical activity until cleared by a doctor.\n"
-                "5. If you smoke or drink, stop immediately."
-            )
-        elif risk_label == "Medium":
-            return (
-                "MODERATE RISK - LIFESTYLE CHANGES REQUIRED\n"
-                "Suggested Plan:\n"
-                "1. Schedule a check-up with your Doctor within the next month.\n"
-                "2. Adopt the DASH or Mediterranean diet (more veggies, less processed food).\n"
-                "3. Aim for 30 minutes of moderate exercise (like walking) 5 days a week.\n"
-                "4. Reduce stress through sleep (7-8 hours) and mindfulness."
-            )
-        else:
-            return (
-                "LOW RISK - MAINTENANCE MODE\n"
-                "Keep up the good work:\n"
-                "1. Continue your balanced diet and active lifestyle.\n"
-                "2. Get an annual physical check-up to track changes.\n"
-                "3. Stay hydrated and ensure consistent sleep quality.\n"
-                "4. Avoid smoking to keep your risk low."
-            )
+        return HEART_SUGGESTIONS.get(risk_label, HEART_SUGGESTIONS["Low"])
     
-    def predict_brain_tumor(self, image_path: str, user_id: Optional[int]) -> Dict[str, Any]:
+    def predict_brain_tumor(self, image_path: str, user_id: Optional[int], wait_for_log: bool = True) -> Dict[str, Any]:
         """
         Take an MRI image path -> call BrainTumorModel -> log prediction -> return result.
+        wait_for_log=False works as in predict_heart_disease.
         Raises RuntimeError if model fails or prediction fails.
         """
+        input_summary = f"image_path={image_path.name if hasattr(image_path, 'name') else str(image_path)}"
+        return self._predict_brain(self.models.predict_brain, image_path, input_summary, user_id, wait_for_log)
+
+    def predict_brain_tumor_from_bytes(
+        self,
+        data: bytes,
+        filename: str,
+        user_id: Optional[int],
+        wait_for_log: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Same as predict_brain_tumor, for an uploaded MRI still held in memory
+        (the image is decoded straight from the bytes; nothing is read from disk).
+        """
+        return self._predict_brain(self.models.predict_brain_bytes, data, f"image_path={filename}", user_id, wait_for_log)
+
+    def _predict_brain(
+        self,
+        predict,
+        source,
+        input_summary: str,
+        user_id: Optional[int],
+        wait_for_log: bool,
+    ) -> Dict[str, Any]:
         try:
-            # Get brain model
+            # Run prediction (in the brain inference worker pool)
             try:
-                brain_model = self.models.get_brain_model()
-            except RuntimeError as e:
-                raise RuntimeError(f"Brain tumor model error: {str(e)}")
-            
-            # Run prediction
-            try:
-                model_result = brain_model.predict(image_path)
+                model_result = predict(source)
             except FileNotFoundError as e:
-                print(f"[ERROR] PredictionService.predict_brain_tumor: Image file not found: {e}")
+                logger.error("PredictionService.predict_brain_tumor: Image file not found: %s", e)
                 raise RuntimeError("Image file not found. Please ensure the file was uploaded correctly.")
             except ValueError as e:
-                print(f"[ERROR] PredictionService.predict_brain_tumor: Image preprocessing error: {e}")
+                logger.warning("PredictionService.predict_brain_tumor: Image preprocessing error: %s", e)
                 raise RuntimeError(f"Error processing image: {str(e)}. Please ensure you're uploading a valid image file.")
-            except Exception as e:
-                print(f"[ERROR] PredictionService.predict_brain_tumor: Model prediction failed: {e}")
+            except RuntimeError as e:
+                raise RuntimeError(f"Brain tumor model error: {str(e)}")
+            except Exception:
+                logger.exception("PredictionService.predict_brain_tumor: Model prediction failed")
                 raise RuntimeError("Brain tumor prediction failed. Please try again later.")
             
             predicted_class: str = model_result.get("predicted_class", "unknown")
@@ -212,36 +366,24 @@ class PredictionService(BaseService):    # Handles prediction logic for heart di
             tumor_classes = {"glioma", "meningioma", "pituitary"}
             is_tumor = predicted_class in tumor_classes
             
-            # Build a short input summary for logging
-            input_summary = f"image_path={image_path.name if hasattr(image_path, 'name') else str(image_path)}"
-
             # --------------------
             # Log prediction in DB + get log_id
             # --------------------
-            log_id: Optional[int] = None
+            log_id: Union[Optional[int], Future] = None
 
             if user_id is not None:
                 try:
-                    # Insert log and get the inserted row ID in the same transaction
-                    log_id = self.db.execute_and_get_id(
-                        """
-                        INSERT INTO prediction_logs (
-                            user_id, model_type, input_summary,
-                            prediction_result, probability, created_at
-                        )
-                        VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            user_id,
-                            "brain_tumor_multiclass",
-                            input_summary,
-                            predicted_class,
-                            probability,
-                            self._now_iso(),
-                        ),
-                    )
-                except Exception as e:
-                    print(f"[ERROR] PredictionService.predict_brain_tumor: Failed to log prediction: {e}")
+                    # Insert log (group-committed with concurrent predictions) and get its row ID (or a Future for it)
+                    log_id = self._log_prediction((
+                        user_id,
+                        "brain_tumor_multiclass",
+                        input_summary,
+                        None,
+                        predicted_class,
+                        probability,
+                    ), wait = wait_for_log)
+                except Exception:
+                    logger.exception("PredictionService.predict_brain_tumor: Failed to log prediction")
                     # Continue without log_id if logging fails
 
             # Build a user-friendly suggestion message
@@ -259,10 +401,8 @@ class PredictionService(BaseService):    # Handles prediction logic for heart di
         except RuntimeError:
             # Re-raise RuntimeErrors as-is (they have user-friendly messages)
             raise
-        except Exception as e:
-            print(f"[ERROR] PredictionService.predict_brain_tumor: Unexpected error: {type(e).__name__}: {e}")
-            import traceback
-            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+        except Exception:
+            logger.exception("PredictionService.predict_brain_tumor: Unexpected error")
             raise RuntimeError("An unexpected error occurred during brain tumor prediction. Please try again.")
 
     def _generate_brain_suggestion(
@@ -278,23 +418,15 @@ class PredictionService(BaseService):    # Handles prediction logic for heart di
             return (
                 f"The model's highest confidence class is 'no_tumor' "
                 f"with an estimated probability of about {prob_pct}%. "
-                "This does not guarantee that no abnormality exists. "
-                "If you have any symptoms or concerns, please consult a neurologist or radiologist."
+                + _NO_TUMOR_FOLLOW_UP
             )
 
         # tumor classes
-        base_msg = (
+        return (
             f"The model suggests the MRI is most consistent with '{predicted_class}' "
             f"with an estimated probability of about {prob_pct}%. "
-            "This is NOT a clinical diagnosis."
-        )
-
-        follow_up = (
-            "You should promptly consult a qualified neurologist or neurosurgeon, "
-            "and have this MRI evaluated by a radiologist for a professional interpretation."
+            + _TUMOR_FOLLOW_UP
         )
-
-        return base_msg + " " + follow_up
     
 # Global instance used by routes
 prediction_service = PredictionService()
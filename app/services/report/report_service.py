@@ -1,13 +1,113 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any
+from typing import TYPE_CHECKING, Optional, Dict, Any, Tuple, Union
 from io import BytesIO
+import functools
+import sqlite3
+import textwrap
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import mm
 from app.core.managers.database_manager import db_manager, DatabaseManager
+from app.core.managers.model_manager import model_manager
 from app.models.user.user import User
 from app.services.base_service import BaseService
+from app.services.prediction.prediction_service import HEART_SUGGESTIONS
+
+if TYPE_CHECKING:   # reportlab is only imported when the first PDF is rendered
+    from reportlab.pdfgen import canvas
+
+# A prediction_logs row: sqlite3.Row from the database (a dict is accepted too)
+LogRow = Union[sqlite3.Row, Dict[str, Any]]
+_LOG_COLUMNS = (
+    "id", "user_id", "model_type", "input_summary", "prediction_result", "probability", "created_at", "input_json",
+)
+
+# orjson (optional) parses the stored input_json faster than json
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
+# Fixed SQL text (no per-call string building), so sqlite3's statement cache is hit
+_SQL_LOG_BY_ID = """
+    SELECT id, user_id, model_type, input_summary,
+           prediction_result, probability, created_at, input_json
+    FROM prediction_logs
+    WHERE id = ? AND user_id = ?
+"""
+_SQL_LOG_BY_ID_AND_TYPE = _SQL_LOG_BY_ID + " AND model_type = ?"
+# Log + owner in one statement (the password hash is not read: reports never need it)
+_SQL_LOG_WITH_USER = """
+    SELECT p.id, p.user_id, p.model_type, p.input_summary,
+           p.prediction_result, p.probability, p.created_at, p.input_json,
+           u.username, u.email, u.created_at AS u_created,
+           u.updated_at AS u_updated, u.is_active
+    FROM prediction_logs p
+    JOIN users u ON u.id = p.user_id
+    WHERE p.id = ? AND p.user_id = ?
+"""
+_SQL_LOG_WITH_USER_AND_TYPE = _SQL_LOG_WITH_USER + " AND p.model_type = ?"
+
+# Report explanation per predicted brain class (keys lowercased)
+_BRAIN_CLASS_EXPLANATIONS = {
+    "no_tumor": (
+        "The model did not detect a brain tumor pattern in the MRI image. "
+        "However, this is only an AI model output and cannot replace a "
+        "radiologist's professional interpretation."
+    ),
+    "glioma": (
+        "The model pattern is most consistent with a glioma-type tumor. "
+        "This does NOT confirm a diagnosis. A radiologist and "
+        "neurospecialist must review the MRI and perform full clinical "
+        "evaluation."
+    ),
+    "meningioma": (
+        "The model pattern is most consistent with a meningioma-type tumor. "
+        "This is only an AI pattern suggestion and not a diagnosis. "
+        "A specialist must confirm any findings."
+    ),
+    "pituitary": (
+        "The model pattern is most consistent with a pituitary-region tumor. "
+        "This is not a confirmed diagnosis. A radiologist and doctor must "
+        "interpret the MRI and clinical picture."
+    ),
+}
+_BRAIN_UNKNOWN_EXPLANATION = (
+    "The model could not clearly map the MRI to one of the expected "
+    "classes, or the class name is unknown. Only a qualified doctor "
+    "and radiologist can interpret the scan reliably."
+)
+
+# Readable names for the heart estimators the training script has produced (other classes print as-is)
+_HEART_MODEL_NAMES = {
+    "RandomForestClassifier": "Random Forest",
+    "HistGradientBoostingClassifier": "Gradient Boosting",
+}
+_BRAIN_MODEL_LABEL = "Brain tumor CNN (4-class: glioma, meningioma, pituitary, no_tumor)"
+
+# Common disclaimer added to all reports
+_MEDICAL_DISCLAIMER = (
+    "This report is generated by an AI-based system. All "
+    "results are approximate and can be wrong. This is NOT a medical "
+    "diagnosis, prescription, or a substitute for professional medical "
+    "advice. Always consult a qualified doctor or healthcare provider "
+    "for any decisions about your health."
+)
+
+# Page layout shared by all reports, in points (same values as reportlab.lib.units.mm and
+# reportlab.lib.pagesizes.A4, computed here so importing this module does not load ReportLab)
+_MM = 72.0 / 2.54 * 0.1
+_PAGE_SIZE = (210 * _MM, 297 * _MM)     # A4
+_MARGIN_LEFT = 20 * _MM
+_MARGIN_TOP = _PAGE_SIZE[1] - 20 * _MM
+_DISCLAIMER_Y = 25 * _MM
+_REPORT_SUBTITLE = "Multi Disease Detection System – Educational AI output"
+
+@functools.lru_cache(maxsize = 64)
+def _wrap_cached(text: str, width: int) -> Tuple[str, ...]:
+    # Report paragraphs are a small fixed set (explanations, disclaimer): wrap each once.
+    # textwrap is linear in the paragraph length; newlines are treated as spaces
+    return tuple(textwrap.wrap(text, width = width, break_long_words = False, break_on_hyphens = False))
 
 
 class ReportService(BaseService):
@@ -18,61 +118,103 @@ class ReportService(BaseService):
     - Generates PDF reports for brain tumor predictions
     """
     
+    # Maximum number of rendered PDFs kept in memory (a few KB each)
+    PDF_CACHE_MAXSIZE: int = 256
+
     def __init__(self, db: DatabaseManager = db_manager) -> None:
         super().__init__(db)
         # Optional public alias for consistency
         self.db = self._db
-
-    def _row_to_log_dict(self, row) -> Dict[str, Any]:
+        # (kind, user fields, log fields) -> PDF bytes; prediction_logs rows never change,
+        # so entries are only ever evicted (LRU), never invalidated
+        self._pdf_cache: OrderedDict[Tuple[Any, ...], bytes] = OrderedDict()
+        self._pdf_cache_lock = threading.Lock()
+        # Per-thread output buffer reused by every render on that thread (see _create_canvas)
+        self._canvas_local = threading.local()
+
+    def _cached_pdf(self, kind: str, render, user: User, log: LogRow, model_label: str) -> BytesIO:
+        """
+        Return a fresh buffer with the rendered report, rendering only on a cache miss.
+        The key holds every value printed in the report (model_label included: the heart one
+        depends on the loaded model), so a hit is always identical output.
         """
-        Convert a DB row into a plain dict.
-        Expected columns:
+        key = (
+            kind, model_label, user.id, user.username, user.email,
+            log["id"], log["created_at"], log["prediction_result"],
+            log["probability"], log["input_summary"],
+        )
+        with self._pdf_cache_lock:
+            data = self._pdf_cache.get(key)
+            if data is not None:
+                self._pdf_cache.move_to_end(key)
+        if data is None:
+            data = render(user, log, model_label).getvalue()
+            with self._pdf_cache_lock:
+                self._pdf_cache[key] = data
+                if len(self._pdf_cache) > self.PDF_CACHE_MAXSIZE:
+                    self._pdf_cache.popitem(last = False)
+        return BytesIO(data)
+
+    def _row_to_log_dict(self, row) -> LogRow:
+        """
+        Return a log row with access by column name.
+        sqlite3.Row (what DatabaseManager always returns) is used as-is, without copying
+        into a dict; a plain tuple is mapped onto the columns below:
             id, user_id, model_type, input_summary,
-            prediction_result, probability, created_at
-        """
-        if hasattr(row, "keys"):
-            # sqlite3.Row or dict-like
-            return dict(row)
-
-        # tuple fallback
-        return {
-            "id": row[0],
-            "user_id": row[1],
-            "model_type": row[2],
-            "input_summary": row[3],
-            "prediction_result": row[4],
-            "probability": row[5],
-            "created_at": row[6],
-        }
+            prediction_result, probability, created_at, input_json
+        """
+        if isinstance(row, (sqlite3.Row, dict)):
+            return row
+        return dict(zip(_LOG_COLUMNS, row))
 
     def get_prediction_for_user(
         self,
         log_id: int,
         user_id: int,
         model_type: Optional[str] = None,
-    ) -> Optional[Dict[str, Any]]:
+    ) -> Optional[LogRow]:
         """
         Fetch a prediction_logs row by id + user_id,
         optionally filtered by model_type.
         """
-        params = [log_id, user_id]
-        query = """
-            SELECT id, user_id, model_type, input_summary,
-                   prediction_result, probability, created_at
-            FROM prediction_logs
-            WHERE id = ? AND user_id = ?
-        """
-
         if model_type:
-            query += " AND model_type = ?"
-            params.append(model_type)
-
-        row = self.db.fetch_one(query, tuple(params))
+            row = self.db.fetch_one(_SQL_LOG_BY_ID_AND_TYPE, (log_id, user_id, model_type))
+        else:
+            row = self.db.fetch_one(_SQL_LOG_BY_ID, (log_id, user_id))
         if row is None:
             return None
 
         return self._row_to_log_dict(row)
 
+    def get_prediction_and_user(
+        self,
+        log_id: int,
+        user_id: int,
+        model_type: Optional[str] = None,
+    ) -> Optional[Tuple[LogRow, User]]:
+        """
+        Fetch a prediction_logs row (by id + user_id, optionally filtered by model_type)
+        together with its owner in one JOIN query. Returns (log, user) or None.
+        """
+        if model_type:
+            row = self.db.fetch_one(_SQL_LOG_WITH_USER_AND_TYPE, (log_id, user_id, model_type))
+        else:
+            row = self.db.fetch_one(_SQL_LOG_WITH_USER, (log_id, user_id))
+        if row is None:
+            return None
+
+        log = row   # the log columns come first; the extra user columns are simply not read
+        user = User(
+            id = row["user_id"],
+            username = row["username"],
+            email = row["email"],
+            password_hash = "",
+            created_at = row["u_created"],
+            updated_at = row["u_updated"],
+            is_active = row["is_active"],
+        )
+        return log, user
+
     # ------------------------------------------------------------------
     # Helpers for formatting
     # ------------------------------------------------------------------
@@ -84,6 +226,11 @@ class ReportService(BaseService):
             return "N/A"
         if isinstance(value, datetime):
             return value.strftime("%Y-%m-%d %H:%M")
+        # Fast path: our own timestamps ("YYYY-MM-DDTHH:MM:SS+00:00") are sliced, not parsed
+        # (the parse path below keeps the stored offset too, so the result is identical)
+        if (isinstance(value, str) and len(value) >= 16 and value[10] in "T "
+                and value[4] == value[7] == "-" and value[13] == ":"):
+            return f"{value[:10]} {value[11:16]}"
         try:
             dt = datetime.fromisoformat(str(value))
             return dt.strftime("%Y-%m-%d %H:%M")
@@ -100,99 +247,61 @@ class ReportService(BaseService):
         except Exception:
             return str(prob)
 
+    def _heart_model_label(self) -> str:
+        """
+        'Heart disease (Random Forest)': named after the estimator in the deployed heart_model.pkl.
+        """
+        try:
+            name = model_manager.get_heart_model().model_name
+        except RuntimeError:    # model missing / failed to load: the report still renders
+            return "Heart disease"
+        return f"Heart disease ({_HEART_MODEL_NAMES.get(name, name)})"
+
     def _heart_risk_explanation(self, risk_label: str) -> str:
         """
-        A short text similar to PredictionService._generate_heart_suggestion,
-        but tailored for the PDF report.
-        """
-        if risk_label == "High":
-            return (
-                "HIGH RISK INDICATED\n"
-                "Recommended Actions:\n"
-                "1. Consult a cardiologist immediately for a full evaluation.\n"
-                "2. monitor your Blood Pressure daily.\n"
-                "3. Adhere to a strict low-sodium, low-saturated fat diet.\n"
-                "4. Avoid strenuous physical activity until cleared by a doctor.\n"
-                "5. If you smoke or drink, stop immediately."
-            )
-        elif risk_label == "Medium":
-            return (
-                "MODERATE RISK - LIFESTYLE CHANGES REQUIRED\n"
-                "Suggested Plan:\n"
-                "1. Schedule a check-up with your Doctor within the next month.\n"
-                "2. Adopt the DASH or Mediterranean diet (more veggies, less processed food).\n"
-                "3. Aim for 30 minutes of moderate exercise (like walking) 5 days a week.\n"
-                "4. Reduce stress through sleep (7-8 hours) and mindfulness."
-            )
-        else:
-            return (
-                "LOW RISK - MAINTENANCE MODE\n"
-                "Keep up the good work:\n"
-                "1. Continue your balanced diet and active lifestyle.\n"
-                "2. Get an annual physical check-up to track changes.\n"
-                "3. Stay hydrated and ensure consistent sleep quality.\n"
-                "4. Avoid smoking to keep your risk low."
-            )
+        Same text as PredictionService._generate_heart_suggestion, shown in the PDF report.
+        """
+        return HEART_SUGGESTIONS.get(risk_label, HEART_SUGGESTIONS["Low"])
 
     def _brain_class_explanation(self, predicted_class: str) -> str:
         """
         Provide a simple textual explanation for a brain tumor class.
         """
-        cls = (predicted_class or "").lower().strip()
-        if cls == "no_tumor":
-            return (
-                "The model did not detect a brain tumor pattern in the MRI image. "
-                "However, this is only an AI model output and cannot replace a "
-                "radiologist's professional interpretation."
-            )
-        elif cls == "glioma":
-            return (
-                "The model pattern is most consistent with a glioma-type tumor. "
-                "This does NOT confirm a diagnosis. A radiologist and "
-                "neurospecialist must review the MRI and perform full clinical "
-                "evaluation."
-            )
-        elif cls == "meningioma":
-            return (
-                "The model pattern is most consistent with a meningioma-type tumor. "
-                "This is only an AI pattern suggestion and not a diagnosis. "
-                "A specialist must confirm any findings."
-            )
-        elif cls == "pituitary":
-            return (
-                "The model pattern is most consistent with a pituitary-region tumor. "
-                "This is not a confirmed diagnosis. A radiologist and doctor must "
-                "interpret the MRI and clinical picture."
-            )
-        else:
-            return (
-                "The model could not clearly map the MRI to one of the expected "
-                "classes, or the class name is unknown. Only a qualified doctor "
-                "and radiologist can interpret the scan reliably."
-            )
+        return _BRAIN_CLASS_EXPLANATIONS.get((predicted_class or "").lower().strip(), _BRAIN_UNKNOWN_EXPLANATION)
 
     def _medical_disclaimer(self) -> str:
         """
         Common disclaimer added to all reports.
         """
-        return (
-            "This report is generated by an AI-based system. All "
-            "results are approximate and can be wrong. This is NOT a medical "
-            "diagnosis, prescription, or a substitute for professional medical "
-            "advice. Always consult a qualified doctor or healthcare provider "
-            "for any decisions about your health."
-        )
+        return _MEDICAL_DISCLAIMER
 
     # ------------------------------------------------------------------
     # PDF generation helpers
     # ------------------------------------------------------------------
+    def _input_summary_lines(self, log: LogRow) -> list[str]:
+        """
+        One "Label:value" line per input, from the structured input_json column;
+        older rows without it fall back to splitting the input_summary text.
+        """
+        if log["input_json"]:
+            return [f"{label}:{value}" for label, value in _loads(log["input_json"]).items()]
+        return [part.strip() for part in str(log["input_summary"]).split(",")]
+
     def _create_canvas(self) -> canvas.Canvas:
         """
-        Create a ReportLab canvas on a BytesIO buffer and return the canvas.
+        Create a ReportLab canvas on this thread's reusable BytesIO buffer and return the canvas.
         The caller is responsible for saving and rewinding the buffer.
+        The buffer is overwritten by the next render on the same thread, so its bytes must be
+        copied out first (_cached_pdf does this with getvalue()).
         """
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
+        buffer = getattr(self._canvas_local, "buffer", None)
+        if buffer is None:
+            buffer = self._canvas_local.buffer = BytesIO()
+        else:
+            buffer.seek(0)
+            buffer.truncate()
+        from reportlab.pdfgen.canvas import Canvas
+        c = Canvas(buffer, pagesize=_PAGE_SIZE)
         # Attach buffer to canvas so caller can access it later
         c._buffer = buffer  # type: ignore[attr-defined]
         return c
@@ -207,34 +316,42 @@ class ReportService(BaseService):
         buffer.seek(0)
         return buffer
 
-    # ------------------------------------------------------------------
-    # Public API: Generate heart report
-    # ------------------------------------------------------------------
-    def generate_heart_report(self, user: User, log: Dict[str, Any]) -> BytesIO:
+    def _draw_static_frame(self, c: canvas.Canvas, title: str) -> None:
         """
-        Create a PDF report for a heart-disease prediction.
+        Draw the parts shared by every report: title, subtitle and the bottom disclaimer
+        (its wrapped lines are computed once per process).
         """
-        c = self._create_canvas()
-        width, height = A4
-
-        # Margins
-        margin_left = 20 * mm
-        margin_top = height - 20 * mm
-
         # Title
         c.setFont("Helvetica-Bold", 18)
-        c.drawString(margin_left, margin_top, "Heart Disease Risk Report")
+        c.drawString(_MARGIN_LEFT, _MARGIN_TOP, title)
 
         # Subtitle
         c.setFont("Helvetica", 10)
-        c.drawString(
-            margin_left,
-            margin_top - 14,
-            "Multi Disease Detection System – Educational AI output",
-        )
+        c.drawString(_MARGIN_LEFT, _MARGIN_TOP - 14, _REPORT_SUBTITLE)
+
+        # Disclaimer at bottom
+        text_obj = c.beginText(_MARGIN_LEFT, _DISCLAIMER_Y)
+        text_obj.setFont("Helvetica", 9, leading = 11)
+        text_obj.textLines(self._wrap_text(self._medical_disclaimer(), max_chars=95))
+        c.drawText(text_obj)
+
+    # ------------------------------------------------------------------
+    # Public API: Generate heart report
+    # ------------------------------------------------------------------
+    def generate_heart_report(self, user: User, log: LogRow) -> BytesIO:
+        """
+        Create a PDF report for a heart-disease prediction.
+        """
+        # Resolved once, before the cache lookup: it is part of the key
+        return self._cached_pdf("heart", self._render_heart_report, user, log, self._heart_model_label())
+
+    def _render_heart_report(self, user: User, log: LogRow, model_label: str) -> BytesIO:
+        c = self._create_canvas()
+        margin_left = _MARGIN_LEFT
+        self._draw_static_frame(c, "Heart Disease Risk Report")
 
         # Section: Patient info
-        y = margin_top - 40
+        y = _MARGIN_TOP - 40
         c.setFont("Helvetica-Bold", 12)
         c.drawString(margin_left, y, "Patient information")
 
@@ -247,8 +364,8 @@ class ReportService(BaseService):
         c.drawString(
             margin_left,
             y,
-            f"Report generated from log ID: {log.get('id')} "
-            f"on {self._format_datetime(log.get('created_at'))}",
+            f"Report generated from log ID: {log['id']} "
+            f"on {self._format_datetime(log['created_at'])}",
         )
 
         # Section: Model result
@@ -256,9 +373,8 @@ class ReportService(BaseService):
         c.setFont("Helvetica-Bold", 12)
         c.drawString(margin_left, y, "Model result")
 
-        risk_label = str(log.get("prediction_result", "Unknown"))
-        probability_str = self._probability_to_percent(log.get("probability"))
-        input_summary = str(log.get("input_summary", ""))
+        risk_label = str(log["prediction_result"])
+        probability_str = self._probability_to_percent(log["probability"])
 
         c.setFont("Helvetica", 10)
         y -= 14
@@ -266,7 +382,7 @@ class ReportService(BaseService):
         y -= 14
         c.drawString(margin_left, y, f"Model probability: {probability_str}")
         y -= 14
-        c.drawString(margin_left, y, f"Model type: Heart disease (Random Forest)")
+        c.drawString(margin_left, y, f"Model type: {model_label}")
 
         # Input summary
         y -= 20
@@ -277,8 +393,7 @@ class ReportService(BaseService):
         text_obj = c.beginText()
         text_obj.setTextOrigin(margin_left, y)
         text_obj.setLeading(13)
-        for line in input_summary.split(","):
-            text_obj.textLine(line.strip())
+        text_obj.textLines(self._input_summary_lines(log))
         c.drawText(text_obj)
 
         # Explanation
@@ -295,45 +410,24 @@ class ReportService(BaseService):
             text_obj.textLine(line)
         c.drawText(text_obj)
 
-        # Disclaimer at bottom
-        disclaimer = self._medical_disclaimer()
-        c.setFont("Helvetica", 9)
-        text_obj = c.beginText()
-        text_obj.setTextOrigin(margin_left, 25 * mm)
-        text_obj.setLeading(11)
-        for line in self._wrap_text(disclaimer, max_chars=95):
-            text_obj.textLine(line)
-        c.drawText(text_obj)
-
         return self._finish_canvas(c)
 
     # ------------------------------------------------------------------
     # Public API: Generate brain report
     # ------------------------------------------------------------------
-    def generate_brain_report(self, user: User, log: Dict[str, Any]) -> BytesIO:
+    def generate_brain_report(self, user: User, log: LogRow) -> BytesIO:
         """
         Create a PDF report for a brain-tumor prediction (4-class model).
         """
-        c = self._create_canvas()
-        width, height = A4
-
-        margin_left = 20 * mm
-        margin_top = height - 20 * mm
-
-        # Title
-        c.setFont("Helvetica-Bold", 18)
-        c.drawString(margin_left, margin_top, "Brain MRI AI Analysis Report")
+        return self._cached_pdf("brain", self._render_brain_report, user, log, _BRAIN_MODEL_LABEL)
 
-        # Subtitle
-        c.setFont("Helvetica", 10)
-        c.drawString(
-            margin_left,
-            margin_top - 14,
-            "Multi Disease Detection System – Educational AI output",
-        )
+    def _render_brain_report(self, user: User, log: LogRow, model_label: str) -> BytesIO:
+        c = self._create_canvas()
+        margin_left = _MARGIN_LEFT
+        self._draw_static_frame(c, "Brain MRI AI Analysis Report")
 
         # Patient info
-        y = margin_top - 40
+        y = _MARGIN_TOP - 40
         c.setFont("Helvetica-Bold", 12)
         c.drawString(margin_left, y, "Patient information")
 
@@ -346,8 +440,8 @@ class ReportService(BaseService):
         c.drawString(
             margin_left,
             y,
-            f"Report generated from log ID: {log.get('id')} "
-            f"on {self._format_datetime(log.get('created_at'))}",
+            f"Report generated from log ID: {log['id']} "
+            f"on {self._format_datetime(log['created_at'])}",
         )
 
         # Model result
@@ -355,8 +449,8 @@ class ReportService(BaseService):
         c.setFont("Helvetica-Bold", 12)
         c.drawString(margin_left, y, "Model result")
 
-        predicted_class = str(log.get("prediction_result", "Unknown"))
-        probability_str = self._probability_to_percent(log.get("probability"))
+        predicted_class = str(log["prediction_result"])
+        probability_str = self._probability_to_percent(log["probability"])
 
         c.setFont("Helvetica", 10)
         y -= 14
@@ -367,7 +461,7 @@ class ReportService(BaseService):
         c.drawString(
             margin_left,
             y,
-            "Model type: Brain tumor CNN (4-class: glioma, meningioma, pituitary, no_tumor)",
+            f"Model type: {model_label}",
         )
 
         # Interpretation
@@ -384,16 +478,6 @@ class ReportService(BaseService):
             text_obj.textLine(line)
         c.drawText(text_obj)
 
-        # Disclaimer at bottom
-        disclaimer = self._medical_disclaimer()
-        c.setFont("Helvetica", 9)
-        text_obj = c.beginText()
-        text_obj.setTextOrigin(margin_left, 25 * mm)
-        text_obj.setLeading(11)
-        for line in self._wrap_text(disclaimer, max_chars=95):
-            text_obj.textLine(line)
-        c.drawText(text_obj)
-
         return self._finish_canvas(c)
 
     # ------------------------------------------------------------------
@@ -401,24 +485,9 @@ class ReportService(BaseService):
     # ------------------------------------------------------------------
     def _wrap_text(self, text: str, max_chars: int = 90) -> list[str]:
         """
-        Naive word-wrap for long paragraphs for ReportLab.
+        Word-wrap a long paragraph into lines of at most max_chars for ReportLab.
         """
-        words = text.split()
-        lines: list[str] = []
-        current_line: list[str] = []
-
-        for w in words:
-            test_line = " ".join(current_line + [w])
-            if len(test_line) <= max_chars:
-                current_line.append(w)
-            else:
-                lines.append(" ".join(current_line))
-                current_line = [w]
-
-        if current_line:
-            lines.append(" ".join(current_line))
-
-        return lines
+        return list(_wrap_cached(text, max_chars))
 
 
 # Singleton instance
@@ -1,5 +1,8 @@
 from __future__ import annotations
-from typing import Optional, Tuple, Dict, Any
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
 from app.core.managers.database_manager import db_manager, DatabaseManager
 from app.models.user.user import User 
 from app.services.base_service import BaseService
@@ -7,41 +10,42 @@ from app.services.base_service import BaseService
 
 class UserSettingsService(BaseService): 
     #Handles:(Fetch basic profile/Change password/Clear prediction history/Delete account)
+    PROFILE_CACHE_TTL = 30.0        # seconds a profile row is reused between settings page loads
+    PROFILE_CACHE_MAXSIZE = 1024
+
     def __init__(self, db: DatabaseManager = db_manager) -> None:
         super().__init__(db)
         # Provide a public alias consistent with other services if needed
         self.db = self._db
-
-    def _fetch_user_instance(self, user_id: int) -> Optional[User]:
-        row = self.db.fetch_one(
+        # user_id -> (timestamp, profile row); per process, dropped on password change / account deletion
+        self._profile_cache: dict[int, tuple[float, sqlite3.Row]] = {}
+        self._profile_lock = threading.Lock()
+
+    def get_profile(self, user_id: int) -> Optional[sqlite3.Row]:
+        entry = self._profile_cache.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.PROFILE_CACHE_TTL:
+            return entry[1]
+
+        # Only the displayed, non-sensitive columns (never password_hash); the row is returned
+        # as-is: it supports profile["username"] (and profile.username in templates)
+        profile = self.db.fetch_one(
             """
-            SELECT id, username, email, password_hash,
-                   created_at, updated_at,
-                   is_active
+            SELECT id, username, email, created_at, updated_at
             FROM users
             WHERE id = ?
             """,
             (user_id,),
         )
+        if profile is not None:     # a missing user is never cached
+            with self._profile_lock:
+                if user_id not in self._profile_cache and len(self._profile_cache) >= self.PROFILE_CACHE_MAXSIZE:
+                    self._profile_cache.pop(next(iter(self._profile_cache)), None)    # FIFO eviction
+                self._profile_cache[user_id] = (time.monotonic(), profile)
+        return profile
 
-        if row is None:
-            return None
-
-        # Use User.from_row() to create object
-        return User.from_row(row)
-
-    def get_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
-        user = self._fetch_user_instance(user_id)
-        if user is None:
-            return None
-
-        return {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "created_at": user.created_at,
-            "updated_at": user.updated_at,
-        }
+    def _invalidate_profile(self, user_id: int) -> None:
+        with self._profile_lock:
+            self._profile_cache.pop(user_id, None)
 
     def change_password(
         self,
@@ -57,9 +61,20 @@ class UserSettingsService(BaseService):
         if new_password != confirm_password:
             return False, "New password and confirmation do not match."
 
-        user = self._fetch_user_instance(user_id)
-        if user is None:
+        # Same rule as registration; checked before the DB read and the (slow) hash verification,
+        # so malformed requests cost no KDF work
+        if len(new_password) < 6:
+            return False, "Password must be at least 6 characters long."
+
+        if new_password == old_password:
+            return False, "New password must be different from the old password."
+
+        # Only the hash is needed (hashes are salted, so the check can't be folded into the UPDATE)
+        row = self.db.fetch_one("SELECT password_hash FROM users WHERE id = ?", (user_id,))
+        if row is None:
             return False, "User not found."
+        old_hash = row["password_hash"]
+        user = User(id = user_id, username = "", email = "", password_hash = old_hash, created_at = "")
 
         # Check old password using User.check_password
         if not user.check_password(old_password):
@@ -68,12 +83,17 @@ class UserSettingsService(BaseService):
         # Update password using User.set_password
         user.set_password(new_password)
 
-        # Save updated hash
-        self.db.execute(
-            "UPDATE users SET password_hash = ?, updated_at = ? WHERE id = ?",
-            (user.password_hash, User.now_iso(), user_id),
-        )
-
+        # Save updated hash, only if it is still the one just verified (compare-and-swap: a
+        # concurrent password change in between makes this a no-op instead of being overwritten)
+        with self.db.transaction() as execute:
+            updated = execute(
+                "UPDATE users SET password_hash = ?, updated_at = ? WHERE id = ? AND password_hash = ?",
+                (user.password_hash, User.now_iso(), user_id, old_hash),
+            ).rowcount
+
+        self._invalidate_profile(user_id)     # updated_at changed (or a concurrent change did)
+        if not updated:
+            return False, "Your password was changed in the meantime. Please try again."
         return True, "Password updated successfully."
 
     def clear_prediction_history(self, user_id: int) -> Tuple[bool, str]:
@@ -84,10 +104,13 @@ class UserSettingsService(BaseService):
         return True, "Prediction history cleared."
 
     def delete_account(self, user_id: int) -> Tuple[bool, str]:
-        self.db.execute(
-            "DELETE FROM users WHERE id = ?",
-            (user_id,),
-        )
+        # The user's logs and the user row go in one transaction (one commit): no orphaned
+        # prediction/chat rows, and no half-deleted account if something fails midway
+        with self.db.transaction() as execute:
+            execute("DELETE FROM chat_logs WHERE user_id = ?", (user_id,))
+            execute("DELETE FROM prediction_logs WHERE user_id = ?", (user_id,))
+            execute("DELETE FROM users WHERE id = ?", (user_id,))
+        self._invalidate_profile(user_id)
         return True, "Your account has been deleted."
 
 user_settings_service = UserSettingsService()
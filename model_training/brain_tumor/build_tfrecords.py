@@ -0,0 +1,76 @@
+import json
+from pathlib import Path
+import numpy as np
+import tensorflow as tf
+from train_brain_model import IMG_SIZE, load_image_splits
+
+SHARD_BYTES = 100 * 1024 * 1024  # start a new shard file after ~100 MB
+
+def _serialize(image: np.ndarray, label: int) -> bytes:
+    # Raw uint8 pixels (no JPEG): the training pipeline only reshapes them
+    feature = {
+        "image": tf.train.Feature(bytes_list = tf.train.BytesList(value = [image.tobytes()])),
+        "label": tf.train.Feature(int64_list = tf.train.Int64List(value = [int(label)])),
+    }
+    return tf.train.Example(features = tf.train.Features(feature = feature)).SerializeToString()
+
+def _write_split(ds: tf.data.Dataset, out_dir: Path, split: str, num_classes: int) -> list[int]:
+    # Returns the number of images written per class (label order)
+    shard, shard_size, count, writer = 0, SHARD_BYTES, 0, None
+    class_counts = [0] * num_classes
+    for image, label in ds.as_numpy_iterator():
+        if shard_size >= SHARD_BYTES:
+            if writer is not None:
+                writer.close()
+            writer = tf.io.TFRecordWriter(str(out_dir / f"{split}-{shard:03d}.tfrecord"))
+            shard, shard_size = shard + 1, 0
+        # Resized pixels are fractional; round back to uint8 (at most 0.5/255 off)
+        record = _serialize(np.clip(np.rint(image), 0, 255).astype(np.uint8), label)
+        writer.write(record)
+        shard_size += len(record)
+        count += 1
+        class_counts[int(label)] += 1
+    if writer is not None:
+        writer.close()
+    print(f"[INFO] {split}: {count} images in {shard} shard(s)")
+    return class_counts
+
+def main() -> None: # Decode + resize the MRI folders once into sharded TFRecords for train_brain_model.py
+    # Resolve project paths
+    current_file = Path(__file__).resolve()
+    project_root = current_file.parents[2]
+
+    train_dir = project_root / "app" / "data" / "brain_mri" / "Training"
+    test_dir = project_root / "app" / "data" / "brain_mri" / "Testing"
+    out_dir = project_root / "app" / "data" / "brain_mri" / "tfrecords"
+
+    for directory in (train_dir, test_dir):
+        if not directory.exists():
+            raise FileNotFoundError(f"Image directory not found at {directory}")
+
+    out_dir.mkdir(parents = True, exist_ok = True)
+    (out_dir / "meta.json").unlink(missing_ok = True)     # half-written shards must never be picked up
+    for old in out_dir.glob("*.tfrecord"):
+        old.unlink()
+
+    # Same loader / seed / validation split as training, so the shards hold exactly the same split
+    train_ds, val_ds, test_ds, class_names = load_image_splits(train_dir, test_dir)
+    class_counts = {
+        split: _write_split(ds, out_dir, split, len(class_names))
+        for split, ds in (("train", train_ds), ("val", val_ds), ("test", test_ds))
+    }
+
+    # Written last: train_brain_model.py only switches to the shards once this file exists
+    # (train_class_counts also spares it the label scan for the class weights)
+    meta = {
+        "image_size": list(IMG_SIZE),
+        "class_names": class_names,
+        "counts": {split: sum(counts) for split, counts in class_counts.items()},
+        "train_class_counts": class_counts["train"],
+    }
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent = 2))
+    print(f"[INFO] TFRecords saved to: {out_dir}")
+    print("[INFO] Done.")
+
+if __name__ == "__main__":
+    main()
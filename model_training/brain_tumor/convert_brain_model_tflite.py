@@ -0,0 +1,73 @@
+from pathlib import Path
+import tensorflow as tf
+from tensorflow import keras
+
+def main() -> None: # Convert the trained Keras CNN into an int8-quantized TFLite model for Flask inference
+    # Resolve project paths
+    current_file = Path(__file__).resolve()
+    project_root = current_file.parents[2]
+
+    train_dir = project_root / "app" / "data" / "brain_mri" / "Training"
+    model_dir = project_root / "app" / "data" / "saved_models"
+    keras_model_path = model_dir / "brain_tumor_cnn_multiclass.h5"
+    tflite_model_path = model_dir / "brain_tumor_cnn_multiclass.tflite"
+
+    print(f"[INFO] Keras model: {keras_model_path}")
+    print(f"[INFO] TFLite model will be saved to: {tflite_model_path}")
+
+    if not keras_model_path.exists():
+        raise FileNotFoundError(
+            f"Keras model not found at {keras_model_path}\n"
+            "Run train_brain_model.py first."
+        )
+
+    if not train_dir.exists():
+        raise FileNotFoundError(
+            f"Training directory not found at {train_dir}\n"
+            "It is needed as the representative dataset for int8 calibration."
+        )
+
+    IMG_SIZE = (128, 128)
+    CALIBRATION_BATCHES = 100  # batches of 1 image used to calibrate activation ranges
+
+    model = keras.models.load_model(keras_model_path)
+
+    calib_ds = keras.utils.image_dataset_from_directory(
+        train_dir,
+        labels = None,
+        image_size = IMG_SIZE,
+        batch_size = 1,
+        color_mode = "rgb",
+        shuffle = True,
+        seed = 42,
+    )
+
+    def representative_dataset():
+        # Raw [0, 255] pixels, same as BrainTumorModel._preprocess_image (Rescaling is inside the model)
+        for images in calib_ds.take(CALIBRATION_BATCHES):
+            yield [tf.cast(images, tf.float32)]
+
+    # Full-integer post-training quantization: every op must have an int8 kernel (conversion fails
+    # instead of silently leaving float ops behind). The input is uint8, which is exactly what raw
+    # pixels are (BrainTumorModel quantizes with the tensor's scale / zero point); the softmax output
+    # stays float32
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.uint8
+    converter.inference_output_type = tf.float32
+
+    print("[INFO] Converting model to TFLite (int8)...")
+    tflite_model = converter.convert()
+    tflite_model_path.write_bytes(tflite_model)
+
+    size_h5 = keras_model_path.stat().st_size / (1024 * 1024)
+    size_tflite = tflite_model_path.stat().st_size / (1024 * 1024)
+    print(f"[RESULT] Keras size:  {size_h5:.2f} MB")
+    print(f"[RESULT] TFLite size: {size_tflite:.2f} MB")
+    print(f"[INFO] TFLite model saved to: {tflite_model_path}")
+    print("[INFO] Done.")
+
+if __name__ == "__main__":
+    main()
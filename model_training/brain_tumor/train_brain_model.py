@@ -1,24 +1,162 @@
+import json
 import os
 from pathlib import Path
+import numpy as np
 import tensorflow as tf
 from tensorflow import keras
-from tensorflow.keras import layers                                                                                                                                                                                                         # type: ignore
+from tensorflow.keras import layers, mixed_precision                                                                                                                                                                                        # type: ignore
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint                                                                                                                                                                       # type: ignore
 
-def main() -> None: # Train a 4-class CNN and save the trained model
+# Dataset configuration (shared with build_tfrecords.py, which must produce the same split)
+IMG_SIZE = (128, 128)
+VALIDATION_SPLIT = 0.2
+SEED = 42
+
+def load_image_splits(train_dir: Path, test_dir: Path):  # (train, val, test, class_names) decoded from the image folders
+    train_ds = keras.utils.image_dataset_from_directory(
+        train_dir,
+        labels = "inferred",        # folder name ('yes'/'no') -> label
+        label_mode = "int",      # # multi-class labels: 0, 1, 2, 3
+        validation_split = VALIDATION_SPLIT,
+        subset = "training",
+        seed = SEED,
+        image_size = IMG_SIZE,
+        batch_size = None,          # unbatched: decoded images are cached once, batched below
+        color_mode = "rgb",
+    )
+    
+    val_ds = keras.utils.image_dataset_from_directory(
+        train_dir,
+        labels = "inferred",
+        label_mode = "int",
+        validation_split = VALIDATION_SPLIT,
+        subset = "validation",
+        seed = SEED,
+        image_size = IMG_SIZE,
+        batch_size = None,          # unbatched: decoded images are cached once, batched below
+        color_mode = "rgb",
+    )
+    
+    # Test dataset from Testing
+    test_ds = keras.utils.image_dataset_from_directory(
+        test_dir,
+        labels = "inferred",
+        label_mode = "int",
+        seed = SEED,
+        image_size = IMG_SIZE,
+        batch_size = None,          # unbatched: decoded images are cached once, batched below
+        color_mode = "rgb",
+        shuffle = False,
+    )
+    return train_ds, val_ds, test_ds, train_ds.class_names
+
+def load_tfrecord_split(tfrecord_dir: Path, split: str) -> tf.data.Dataset:  # One split written by build_tfrecords.py
+    features = {
+        "image": tf.io.FixedLenFeature([], tf.string),  # raw uint8 pixels, IMG_SIZE x 3
+        "label": tf.io.FixedLenFeature([], tf.int64),
+    }
+
+    def parse(record):
+        example = tf.io.parse_single_example(record, features)
+        image = tf.reshape(tf.io.decode_raw(example["image"], tf.uint8), (*IMG_SIZE, 3))
+        return image, tf.cast(example["label"], tf.int32)
+
+    # Shards are read in parallel (interleaved) and parsed in parallel; no JPEG decoding at all
+    files = tf.data.Dataset.list_files(str(tfrecord_dir / f"{split}-*.tfrecord"), shuffle = False)
+    return files.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length = 8,
+        num_parallel_calls = tf.data.AUTOTUNE,
+        deterministic = False,
+    ).map(parse, num_parallel_calls = tf.data.AUTOTUNE)
+
+def build_augmentation() -> keras.Sequential: # Random training-time transforms (no-ops at inference)
+    return keras.Sequential(
+        [
+            layers.RandomFlip("horizontal"),
+            layers.RandomRotation(0.05),
+            layers.RandomZoom(0.05),
+        ],
+        name = "data_augmentation",
+    )
+
+def build_model(img_size, num_classes: int, rescale: bool = True, pretrained: bool = True) -> keras.Model: # Pretrained backbone + small classifier head (layers use the current global dtype policy)
+    # rescale=False builds the training variant, fed with pixels already scaled to [0, 1];
+    # the saved model always rescales itself so it takes raw [0, 255] pixels (Flask, TFLite).
+    # Either way a weight-free Rescaling layer maps the pixels to the [-1, 1] range the backbone expects.
+    # pretrained=False skips loading the ImageNet weights (for the export copy, which gets the trained ones).
+    # Augmentation is not part of it: main() wraps it in front for training only
+    inputs = keras.Input(shape = (*img_size, 3))
+    if rescale:
+        x = layers.Rescaling(1.0 / 127.5, offset = -1.0)(inputs)   # [0, 255] -> [-1, 1]
+    else:
+        x = layers.Rescaling(2.0, offset = -1.0)(inputs)           # [0, 1] -> [-1, 1]
+
+    # ImageNet-pretrained MobileNetV3-Small: generic edge/texture filters come for free instead of being
+    # learned from scratch on a few thousand MRIs, and its depthwise convolutions are cheap
+    backbone = keras.applications.MobileNetV3Small(
+        input_shape = (*img_size, 3),
+        include_top = False,
+        weights = "imagenet" if pretrained else None,
+        pooling = "avg",                    # global average pooling -> one feature vector per image
+        include_preprocessing = False,      # scaling is done by the Rescaling layer above
+    )
+    backbone.trainable = False  # frozen at first: only the head is trained (see main)
+    x = backbone(x, training = False)   # BatchNorm keeps its ImageNet statistics, also while fine-tuning
+
+    x = layers.Dropout(0.3)(x) # solve overfitting problem by forcing model to learn robust patterns
+    
+    # Output: one logit per class; softmax kept in float32 so the loss is stable under mixed precision
+    x = layers.Dense(num_classes)(x)
+    outputs = layers.Activation("softmax", dtype = "float32")(x)
+    return keras.Model(inputs, outputs, name="brain_tumor_cnn_multiclass")  # Wraps everything up into a single object
+
+def get_backbone(model: keras.Model) -> keras.Model:  # The pretrained feature extractor inside build_model()'s model
+    return next(layer for layer in model.layers if isinstance(layer, keras.Model))
+
+def unfreeze_top_layers(backbone: keras.Model, n_layers: int) -> None:  # Fine-tuning: train only the last n layers
+    backbone.trainable = True
+    for layer in backbone.layers[:-n_layers]:
+        layer.trainable = False
+    for layer in backbone.layers[-n_layers:]:
+        if isinstance(layer, layers.BatchNormalization):
+            layer.trainable = False     # keep the ImageNet statistics (small batches would wreck them)
+
+def compile_model(model: keras.Model, learning_rate: float, use_mixed: bool) -> None:
+    optimizer = keras.optimizers.Adam(learning_rate = learning_rate) # Adaptive Moment Estimation
+    if use_mixed:
+        optimizer = mixed_precision.LossScaleOptimizer(optimizer)  # keeps small float16 gradients from underflowing
+    model.compile(
+        optimizer = optimizer,
+        loss = "sparse_categorical_crossentropy", # calculates how wrong the model is
+        metrics = ["accuracy"], 
+    )
+
+def main() -> None: # Fine-tune a pretrained CNN on the 4 MRI classes and save the trained model
+    # XLA auto-clustering: fuses ReLU / Rescaling / softmax / loss ops into the neighbouring
+    # conv and dense kernels. Ops XLA can't compile (e.g. the augmentation layers) simply stay
+    # outside the clusters. BRAIN_TRAIN_XLA=0 turns it off (benchmark one epoch both ways).
+    use_xla = os.getenv("BRAIN_TRAIN_XLA", "1").lower() in ("1", "true", "yes")
+    tf.config.optimizer.set_jit("autoclustering" if use_xla else False)
+    print(f"[INFO] XLA auto-clustering: {'on' if use_xla else 'off'}")
+
     # Resolve project paths
     current_file = Path(__file__).resolve()
     project_root = current_file.parents[2]
     
     train_dir = project_root / "app" / "data" / "brain_mri" / "Training"
     test_dir = project_root / "app" / "data" / "brain_mri" / "Testing"
+    # Pre-decoded shards from build_tfrecords.py (used instead of the image folders when present)
+    tfrecord_dir = project_root / "app" / "data" / "brain_mri" / "tfrecords"
     model_dir = project_root / "app" / "data" / "saved_models"
     model_dir.mkdir(parents = True, exist_ok = True)
     
     # final model used by Flask
     model_path = model_dir / "brain_tumor_cnn_multiclass.h5"
-    # best checkpoint during training
-    checkpoint_path = model_dir / "brain_tumor_cnn_multiclass_best.h5"
+    # best checkpoints during training (weights only: no graph / optimizer state rewritten on every improvement);
+    # one file per phase, because which layers are trainable changes the weight order inside the file
+    frozen_checkpoint_path = model_dir / "brain_tumor_cnn_multiclass_best_frozen.weights.h5"
+    checkpoint_path = model_dir / "brain_tumor_cnn_multiclass_best.weights.h5"
     
     print(f"[INFO] Project root: {project_root}")
     print(f"[INFO] Training dir: {train_dir}")
@@ -45,53 +183,36 @@ def main() -> None: # Train a 4-class CNN and save the trained model
             "  Testing/no_tumor\n"
         )
         
+    # Mixed precision (float16 compute, float32 weights): uses Tensor Cores on recent GPUs.
+    # Default: on when a GPU is visible (float16 on CPU is slower); BRAIN_TRAIN_MIXED_PRECISION=0/1 forces it
+    mixed_env = os.getenv("BRAIN_TRAIN_MIXED_PRECISION", "auto").lower()
+    if mixed_env == "auto":
+        use_mixed = bool(tf.config.list_physical_devices("GPU"))
+    else:
+        use_mixed = mixed_env in ("1", "true", "yes")
+    if use_mixed:
+        mixed_precision.set_global_policy("mixed_float16")
+    print(f"[INFO] Mixed precision: {'on' if use_mixed else 'off'}")
+
     # Dataset configuration
-    IMG_SIZE = (128, 128)
-    BATCH_SIZE = 32
-    VALIDATION_SPLIT = 0.2
-    SEED = 42
+    BATCH_SIZE = 64 if use_mixed else 32    # float16 activations leave room for larger batches
 
-    # training & validation datasets
-    print("[INFO] Creating training and validation datasets...")
-    
-    train_ds = keras.utils.image_dataset_from_directory(
-        train_dir,
-        labels = "inferred",        # folder name ('yes'/'no') -> label
-        label_mode = "int",      # # multi-class labels: 0, 1, 2, 3
-        validation_split = VALIDATION_SPLIT,
-        subset = "training",
-        seed = SEED,
-        image_size = IMG_SIZE,
-        batch_size = BATCH_SIZE,
-        color_mode = "rgb",
-    )
+    # training, validation & test datasets
+    meta_path = tfrecord_dir / "meta.json"
+    if meta_path.exists():
+        print(f"[INFO] Reading pre-decoded TFRecord shards from: {tfrecord_dir}")
+        meta = json.loads(meta_path.read_text())
+        if tuple(meta["image_size"]) != IMG_SIZE:
+            raise ValueError(f"TFRecords were built for {meta['image_size']}, expected {IMG_SIZE}; rerun build_tfrecords.py")
+        train_ds, val_ds, test_ds = (load_tfrecord_split(tfrecord_dir, split) for split in ("train", "val", "test"))
+        class_names = meta["class_names"]
+        train_class_counts = meta.get("train_class_counts")     # absent in shards from older builds
+    else:
+        print("[INFO] Creating training, validation and test datasets from the image folders...")
+        train_ds, val_ds, test_ds, class_names = load_image_splits(train_dir, test_dir)
+        train_class_counts = None
     
-    val_ds = keras.utils.image_dataset_from_directory(
-        train_dir,
-        labels = "inferred",
-        label_mode = "int",
-        validation_split = VALIDATION_SPLIT,
-        subset = "validation",
-        seed = SEED,
-        image_size = IMG_SIZE,
-        batch_size = BATCH_SIZE,
-        color_mode = "rgb",
-    )
-    
-    # Test dataset from Testing
-    print("[INFO] Creating test dataset...")
-    test_ds = keras.utils.image_dataset_from_directory(
-        test_dir,
-        labels = "inferred",
-        label_mode = "int",
-        seed = SEED,
-        image_size = IMG_SIZE,
-        batch_size = BATCH_SIZE,
-        color_mode = "rgb",
-        shuffle = False,
-    )
-    
-    class_names = train_ds.class_names  # ['no', 'yes'] -> label 0 = 'no', label 1 = 'yes'
+    # class_names: folder names in label order (label 0 = class_names[0], ...)
     num_classes = len(class_names)
     print(f"[INFO] Class names (from folders): {class_names}")
     print(f"[INFO] Number of classes: {num_classes}")
@@ -99,99 +220,146 @@ def main() -> None: # Train a 4-class CNN and save the trained model
     # Prepare datasets -> cache / prefetch / normalization / augmentation
     AUTOTUNE = tf.data.AUTOTUNE
     
-    # Prefetch for performance
-    train_ds = train_ds.cache().shuffle(1000).prefetch(buffer_size = AUTOTUNE)
-    val_ds = val_ds.cache().prefetch(buffer_size = AUTOTUNE)
-    test_ds = test_ds.cache().prefetch(buffer_size=AUTOTUNE)
-    
-    # Normalization layer: scales [0, 255] -> [0, 1]
-    normalization_layer = layers.Rescaling(1.0 / 255)
-    
-    data_augmentation = keras.Sequential(
-        [
-            layers.RandomFlip("horizontal"),
-            layers.RandomRotation(0.05),
-            layers.RandomZoom(0.05),
-        ],
-        name = "data_augmentation",
+    # Files are read + decoded in parallel by image_dataset_from_directory (map with AUTOTUNE)
+    # and only once thanks to cache(); after that each epoch shuffles single images (not whole
+    # batches), batches them on parallel threads and prefetches while the GPU trains.
+    # Pixels are scaled to [0, 1] once, before cache(), instead of by a Rescaling layer on every
+    # training step (cached as float16 under mixed precision: half the memory).
+    SHUFFLE_BUFFER = 2000
+    cache_dtype = tf.float16 if use_mixed else tf.float32
+
+    def rescale(images, labels):
+        return tf.cast(images, cache_dtype) / 255.0, labels
+
+    train_ds = train_ds.map(rescale, num_parallel_calls = AUTOTUNE)
+    val_ds = val_ds.map(rescale, num_parallel_calls = AUTOTUNE)
+    test_ds = test_ds.map(rescale, num_parallel_calls = AUTOTUNE)
+
+    train_ds = train_ds.cache()
+
+    # Class weights ("balanced", as sklearn's compute_class_weight: n_samples / (n_classes * count)),
+    # so the minority classes are not learned last and EarlyStopping triggers sooner. Without
+    # counts in meta.json the labels are scanned once; that pass also fills the cache above, so the
+    # first epoch does not decode the images again.
+    if train_class_counts is None:
+        print("[INFO] Counting training labels...")
+        counts = np.zeros(num_classes, dtype = np.int64)
+        for labels in train_ds.map(lambda _, label: label).batch(4096).as_numpy_iterator():
+            counts += np.bincount(labels, minlength = num_classes)
+        train_class_counts = counts.tolist()
+    counts = np.asarray(train_class_counts, dtype = np.float64)
+    class_weight = {i: float(counts.sum() / (num_classes * n)) for i, n in enumerate(counts) if n > 0}
+    print(f"[INFO] Training images per class: {dict(zip(class_names, train_class_counts))}")
+    print(f"[INFO] Class weights: {class_weight}")
+
+    unordered = tf.data.Options()
+    unordered.deterministic = False     # training batches may be produced out of order
+    train_ds = (
+        train_ds.shuffle(SHUFFLE_BUFFER, seed = SEED)
+        .batch(BATCH_SIZE, num_parallel_calls = AUTOTUNE)
+        .prefetch(buffer_size = AUTOTUNE)
+        .with_options(unordered)
     )
+    val_ds = val_ds.cache().batch(BATCH_SIZE, num_parallel_calls = AUTOTUNE).prefetch(buffer_size = AUTOTUNE)
+    test_ds = test_ds.cache().batch(BATCH_SIZE, num_parallel_calls = AUTOTUNE).prefetch(buffer_size = AUTOTUNE)
     
     # Build CNN model
-    print("[INFO] Building CNN model...")
+    print("[INFO] Building CNN model (pretrained MobileNetV3-Small backbone)...")
+    model = build_model(IMG_SIZE, num_classes, rescale = False)
+    model.summary(print_fn = lambda line: print("[MODEL] " + line))
 
-    inputs = keras.Input(shape = (*IMG_SIZE, 3))
-    x = data_augmentation(inputs)
-    x = normalization_layer(x)
-    
-    x = layers.Conv2D(32, (3, 3), activation = "relu", padding = "same")(x) # create diffrent filters, One might look for vertical lines, another for horizontal lines, another for curves
-    x = layers.MaxPooling2D((2, 2))(x) # reduces image size by half to reduce amount of math calc needed for next layer
+    # Training wrapper: augmentation -> CNN. Both run inside the train step fit() compiles, on the
+    # same device, and the augmentation layers are never serialized into the saved model
+    train_inputs = keras.Input(shape = (*IMG_SIZE, 3))
+    train_model = keras.Model(train_inputs, model(build_augmentation()(train_inputs)), name = "brain_tumor_cnn_training")
     
-    x = layers.Conv2D(64, (3, 3), activation = "relu", padding = "same")(x)
-    x = layers.MaxPooling2D((2, 2))(x) 
+    def callbacks(path: Path, best_so_far: float = float("inf")):
+        early_stop = EarlyStopping(
+            monitor = 'val_loss',    # Watch the validation loss
+            patience = 7,            # Wait 7 epochs before stopping
+            restore_best_weights = True, # Go back to the "sweet spot" version
+            verbose = 1,
+        )
+        checkpoint_cb = ModelCheckpoint(
+            filepath = str(path),
+            monitor = "val_loss",
+            save_best_only = True,
+            save_weights_only = True,
+            initial_value_threshold = best_so_far,  # only saved if it beats everything before it
+            verbose = 1,
+        )
+        return [early_stop, checkpoint_cb]
 
-    x = layers.Conv2D(128, (3, 3), activation = "relu", padding = "same")(x)
-    x = layers.MaxPooling2D((2, 2))(x)
-    
-    x = layers.Conv2D(256, (3, 3), activation = "relu", padding = "same")(x)
-    x = layers.MaxPooling2D((2, 2))(x)
+    for stale in (frozen_checkpoint_path, checkpoint_path):
+        stale.unlink(missing_ok = True)     # a file left by an older run must not be loaded below
 
-    x = layers.Flatten()(x) # final decision-making layers (Dense) understand flat lists, not 3D images
-    x = layers.Dense(256, activation = "relu")(x)   # thinking happens
-    x = layers.Dropout(0.5)(x) # solve overfitting problem by forcing model to learn robust patterns
-    
-    # Output: single neuron, sigmoid -> probability of class "1" ('yes')
-    outputs = layers.Dense(num_classes, activation = "softmax")(x)
-    model = keras.Model(inputs, outputs, name="brain_tumor_cnn_multiclass")  # Wraps everything up into a single object
-    model.summary(print_fn = lambda line: print("[MODEL] " + line))
-    
-    # Compile the model
-    model.compile(
-        optimizer = "adam", # Adaptive Moment Estimation
-        loss = "sparse_categorical_crossentropy", # calculates how wrong the model is
-        metrics = ["accuracy"], 
-    )
-    
-    early_stop = EarlyStopping(
-    monitor = 'val_loss',    # Watch the validation loss
-    patience = 7,            # Wait 7 epochs before stopping
-    restore_best_weights = True, # Go back to the "sweet spot" version
-    verbose = 1,
-    )
-    
-    checkpoint_cb = ModelCheckpoint(
-        filepath = str(checkpoint_path),
-        monitor = "val_loss",
-        save_best_only = True,
-        verbose = 1,
+    # Phase 1: backbone frozen, train the new head
+    FROZEN_EPOCHS = 10
+    compile_model(train_model, 1e-3, use_mixed)
+    print(f"[INFO] Training the classifier head for {FROZEN_EPOCHS} epochs (backbone frozen)...")
+    frozen_history = train_model.fit(
+        train_ds,
+        validation_data = val_ds,
+        epochs = FROZEN_EPOCHS,
+        class_weight = class_weight,
+        callbacks = callbacks(frozen_checkpoint_path),
     )
-    
-    # Train the model
-    EPOCHS = 100
-    print(f"[INFO] Starting training for {EPOCHS} epochs...")
-    history = model.fit(
+    frozen_best = min(frozen_history.history["val_loss"])
+    if frozen_checkpoint_path.exists():
+        train_model.load_weights(str(frozen_checkpoint_path))   # fine-tune from the best head
+
+    # Phase 2: unfreeze the last backbone layers and fine-tune with a small learning rate
+    FINE_TUNE_EPOCHS = 20
+    FINE_TUNE_LAYERS = 30
+    backbone = get_backbone(model)
+    unfreeze_top_layers(backbone, FINE_TUNE_LAYERS)
+    compile_model(train_model, 1e-5, use_mixed)     # recompile: trainable flags changed
+    print(f"[INFO] Fine-tuning the last {FINE_TUNE_LAYERS} backbone layers for up to {FINE_TUNE_EPOCHS} epochs...")
+    fine_tune_history = train_model.fit(
         train_ds,
         validation_data = val_ds,
-        epochs = EPOCHS,
-        callbacks = [early_stop, checkpoint_cb]
+        epochs = FINE_TUNE_EPOCHS,
+        class_weight = class_weight,
+        callbacks = callbacks(checkpoint_path, frozen_best),
     )
     
+    # Best weights overall: the fine-tuned checkpoint if it beat phase 1, else the phase-1 one
+    # (loaded with the same trainable layers it was saved with)
     if checkpoint_path.exists():
         print(f"[INFO] Loading best weights from checkpoint: {checkpoint_path}")
-        model.load_weights(str(checkpoint_path))
+        train_model.load_weights(str(checkpoint_path))
+    elif frozen_checkpoint_path.exists():
+        print(f"[INFO] Fine-tuning did not improve; loading best weights from: {frozen_checkpoint_path}")
+        backbone.trainable = False
+        train_model.load_weights(str(frozen_checkpoint_path))
     
-    # Evaluate on validation data
-    print("[INFO] Evaluating on validation set...")
-    val_loss, val_acc = model.evaluate(val_ds)
+    # Validation metrics of the restored weights: fit() already measured them at the end of the best
+    # epoch (the lowest val_loss over both phases is exactly what the checkpoints kept), so no extra
+    # pass over the validation set is needed
+    val_losses = frozen_history.history["val_loss"] + fine_tune_history.history["val_loss"]
+    val_accs = frozen_history.history["val_accuracy"] + fine_tune_history.history["val_accuracy"]
+    best_epoch = int(np.argmin(val_losses))
+    val_loss, val_acc = val_losses[best_epoch], val_accs[best_epoch]
+    print(f"[RESULT] Best epoch: {best_epoch + 1} of {len(val_losses)} (both phases)")
     print(f"[RESULT] Validation loss: {val_loss:.4f}")
     print(f"[RESULT] Validation acc:  {val_acc:.4f}")
 
     print("[INFO] Evaluating on test set...")
-    test_loss, test_acc = model.evaluate(test_ds)
+    test_loss, test_acc = train_model.evaluate(test_ds)
     print(f"[RESULT] Test loss: {test_loss:.4f}")
     print(f"[RESULT] Test acc:  {test_acc:.4f}")
     
-    # Save the trained model
-    model.save(model_path)
+    # Save the trained model: float32 (Flask / the TFLite converter run it on CPU), without the
+    # augmentation wrapper and with the raw-pixel Rescaling layer in front (it has no weights, so the
+    # trained ones map over unchanged). Both models are made fully trainable first so get_weights()
+    # lists the weights in the same order.
+    if use_mixed:
+        mixed_precision.set_global_policy("float32")
+    export_model = build_model(IMG_SIZE, num_classes, rescale = True, pretrained = False)
+    model.trainable = True
+    export_model.trainable = True
+    export_model.set_weights(model.get_weights())   # weights are float32 under mixed precision too
+    export_model.save(model_path)
     print(f"[INFO] Multi-class model saved to: {model_path}")
     print("[INFO] Done.")
 
@@ -1,7 +1,8 @@
 # App entry point
 from app import create_app
 
-# Create the Flask application using the factory function
-app = create_app()
 if __name__ == "__main__":
+    # Create the Flask application using the factory function. Only under the guard: the brain
+    # inference pool's worker processes import this module again (as __mp_main__)
+    app = create_app()
     app.run(debug = True)
@@ -0,0 +1,82 @@
+import os
+import runpy
+import signal
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# Entry script that creates the app at module level (the worst case): every brain pool worker /
+# forkserver re-imports it as __mp_main__. Each import logs a "pid name create_app" line, each
+# started warmup a "pid name warmup" line.
+STARTUP_SCRIPT = textwrap.dedent(
+    """
+    import os
+    import sys
+    import time
+    sys.path.insert(0, os.environ["REPO_ROOT"])
+    import app as app_package
+
+    def record(event):
+        with open(os.environ["STARTUP_LOG"], "a") as f:
+            f.write(f"{os.getpid()} {__name__} {event}\\n")
+
+    warmup = app_package._async_warmup
+    app_package._async_warmup = lambda: (record("warmup"), warmup())
+    record("create_app")
+    app = app_package.create_app()
+
+    if __name__ == "__main__":
+        from app.core.managers.model_manager import WARM_READY
+        WARM_READY.wait(60)
+        time.sleep(3)   # time for any recursively started pools to show up in the log
+    """
+)
+
+
+class AppStartupTest(unittest.TestCase):
+    @unittest.skipUnless(hasattr(os, "killpg"), "needs POSIX process groups")
+    def test_brain_pool_does_not_recurse_into_create_app(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_path = Path(tmp)
+            (tmp_path / "instance").mkdir()
+            script = tmp_path / "entry.py"
+            script.write_text(STARTUP_SCRIPT)
+            startup_log = tmp_path / "startup.log"
+            env = {
+                **os.environ,
+                "REPO_ROOT": str(REPO_ROOT),
+                "STARTUP_LOG": str(startup_log),
+                "LOG_FILE": str(tmp_path / "app.log"),
+                "ML_EAGER_LOAD": "1",
+                "BRAIN_WORKERS": "1",
+            }
+            # Own process group, so a runaway chain of forkservers / workers is killed with it
+            proc = subprocess.Popen([sys.executable, str(script)], cwd = tmp, env = env, start_new_session = True)
+            try:
+                self.assertEqual(proc.wait(timeout = 120), 0)
+            finally:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                proc.wait()
+
+            lines = [tuple(line.split()[1:]) for line in startup_log.read_text().splitlines()]
+            # Only the real entry point warms up (and so starts the brain pool)
+            self.assertEqual([line for line in lines if line[1] == "warmup"], [("__main__", "warmup")])
+            # Re-imports: at most the forkserver + the one pool worker, never a chain of pools
+            self.assertLessEqual(len([line for line in lines if line[1] == "create_app"]), 3)
+
+    def test_run_py_creates_no_app_when_imported(self):
+        # How pool workers see run.py: imported as __mp_main__, so the app must not be created
+        module_globals = runpy.run_path(str(REPO_ROOT / "run.py"), run_name = "__mp_main__")
+        self.assertNotIn("app", module_globals)
+
+
+if __name__ == "__main__":
+    unittest.main()